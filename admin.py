@@ -5,6 +5,7 @@ from wtforms import SelectField, StringField, PasswordField
 from wtforms.validators import DataRequired, Length
 from flask_admin.form import BaseForm
 from models import db, Lead, User
+from services.lead_search import fulltext_backend, search_condition
 from flask import redirect, url_for, flash
 
 # Custom form for User model
@@ -50,10 +51,25 @@ class LeadModelView(MyModelView):
     column_list = ['name', 'email', 'phone', 'message', 'created_at']
     column_searchable_list = ['name', 'email', 'phone', 'message']
     column_filters = ['created_at']
+    # Newest first through the primary key; no COUNT(*) over the whole table on every page
+    column_default_sort = ('id', True)
+    simple_list_pager = True
     can_create = True
     can_edit = True
     can_delete = True
 
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        # Search through the full-text index instead of ILIKE '%term%' on every column
+        backend = fulltext_backend()
+        if backend is None:
+            return super()._apply_search(query, count_query, joins, count_joins, search)
+        condition = search_condition(search, backend)
+        if condition is not None:
+            query = query.filter(condition)
+            if count_query is not None:
+                count_query = count_query.filter(condition)
+        return query, count_query, joins, count_joins
+
 class UserModelView(MyModelView):
     # Basic configuration
     column_list = ['username', 'email', 'role', 'created_at']
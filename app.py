@@ -1,16 +1,31 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, session
+from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, session, Response, stream_with_context
 from flask_cors import CORS
 import os
+import json
+import logging
 from dotenv import load_dotenv
-from services.chat import get_chatbot_response, chat_service
+from services.chat import get_chatbot_response, stream_chatbot_response, chat_service, embedding_cache, answer_cache
+from services import chat as chat_module
+from services.embedding_jobs import EmbeddingJobRunner
+from services.index_manager import resolve_tenant, tenant_for_url
+from services.conversation_store import make_store, valid_conversation_id
+from services.lead_queue import LEAD_INGEST_MODE, LeadQueue, LeadQueueFull, LeadRejected
+from services.lead_search import DEFAULT_PAGE_SIZE, list_leads
+from services import metrics
+from services.structured_logging import log_event
 import tempfile
+import hmac
+from functools import wraps
 import openai
 from werkzeug.utils import secure_filename
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import DataError, IntegrityError
 from config import Config
 from models import Lead, db, User
 from admin import admin
 from flask_migrate import Migrate
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_mail import Mail, Message
@@ -43,8 +58,19 @@ migrate = Migrate(app, db) #instance of Migrate
 # Initialize LeadExtractor - using the singleton instance directly
 # lead_extractor is already initialized in the services/lead_extractor.py file
 
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+def stamp_new_database():
+    """Mark tables just built by create_all() as being at the latest migration,
+    so `flask db upgrade` does not try to add columns they already have."""
+    with db.engine.begin() as connection:
+        MigrationContext.configure(connection).stamp(ScriptDirectory(MIGRATIONS_DIR), 'heads')
+
 with app.app_context():
+    new_database = not db.inspect(db.engine).has_table(Lead.__tablename__)
     db.create_all()
+    if new_database:
+        stamp_new_database()
     admin.init_app(app)
 
 # Configure CORS with environment variables (with fallbacks)
@@ -379,6 +405,29 @@ def handle_form():
                 'message': 'Name, email, and phone are required fields'
             }), 400
         
+        too_long = _too_long_field({'name': name, 'email': email, 'phone': phone})
+        if too_long:
+            field, length = too_long
+            return jsonify({
+                'success': False,
+                'message': f'{field.capitalize()} must be at most {length} characters'
+            }), 400
+        
+        if lead_queue is not None:
+            # Write-behind: durably queued now, bulk-inserted by the flusher shortly after
+            try:
+                submission_id = lead_queue.enqueue({'name': name, 'email': email, 'phone': phone,
+                                                    'message': message or None})
+            except LeadQueueFull:
+                # Too much waiting already: write this lead directly rather than lose it
+                print("Lead queue is full, saving the lead directly")
+            else:
+                return jsonify({
+                    'success': True,
+                    'message': 'Form submitted successfully',
+                    'submission_id': submission_id
+                }), 202
+
         # Create and save lead
         lead = Lead(
             name=name,
@@ -406,36 +455,229 @@ def handle_form():
             'message': f'Error saving data: {str(e)}'
         }), 500
 
+def _too_long_field(fields):
+    """(field, max length) of the first value longer than its Lead column allows, else None."""
+    for field, value in fields.items():
+        length = getattr(Lead.__table__.c[field].type, 'length', None)
+        if length and len(value) > length:
+            return field, length
+    return None
+
+def _insert_leads(leads):
+    """Bulk-insert a batch from the lead queue in one transaction.
+
+    Leads already stored under their submission_id (a redelivered batch) are skipped.
+    Raises LeadRejected when the database refuses the data itself."""
+    with app.app_context():
+        try:
+            queue_ids = [lead['queue_id'] for lead in leads]
+            delivered = set(db.session.execute(
+                db.select(Lead.submission_id).where(Lead.submission_id.in_(queue_ids))
+            ).scalars())
+            rows = [{
+                'name': lead['name'],
+                'email': lead['email'],
+                'phone': lead['phone'],
+                'message': lead['message'],
+                'created_at': datetime.utcfromtimestamp(lead['created_at']),
+                'submission_id': lead['queue_id'],
+            } for lead in leads if lead['queue_id'] not in delivered]
+            if rows:
+                db.session.execute(db.insert(Lead), rows)
+            db.session.commit()
+        except (DataError, IntegrityError) as e:
+            db.session.rollback()
+            raise LeadRejected(str(e.orig)) from e
+        except Exception:
+            db.session.rollback()
+            raise
+
+# /form submissions go straight to the database unless LEAD_INGEST_MODE=queue
+lead_queue = LeadQueue(_insert_leads) if LEAD_INGEST_MODE == 'queue' else None
+
+# Crawl/embed jobs run in the background; /start-embedding only enqueues them
+embedding_jobs = EmbeddingJobRunner(chat_service.run_embedding_job)
+# Chat histories for clients that send a conversation_id instead of the full history
+conversations = make_store()
+
+# Load the embedding index once at import. Under gunicorn with preload_app this
+# runs in the master and workers inherit it; a missing index never triggers a crawl.
+chat_service.load()
+
+def post_fork():
+    """Called by gunicorn in each worker after fork (see gunicorn.conf.py)."""
+    with app.app_context():
+        db.engine.dispose()  # never share pooled DB connections with the master
+    chat_module.post_fork()
+    embedding_jobs.store.reopen()
+    # A worker gunicorn restarted may have left its jobs marked running
+    embedding_jobs.store.recover_stale()
+    conversations.reopen()
+    if lead_queue is not None:
+        lead_queue.reopen()
+
 # Configure OpenAI
 openai.api_key = os.getenv('OPENAI_API_KEY')
 
+# Crawl jobs launch a headless browser against any URL: admins only, or scripts holding this token
+EMBEDDING_API_TOKEN = os.getenv('EMBEDDING_API_TOKEN')
+
+def _valid_embedding_token(header):
+    scheme, _, token = header.partition(' ')
+    return (bool(EMBEDDING_API_TOKEN) and scheme.lower() == 'bearer'
+            and hmac.compare_digest(token.encode(), EMBEDDING_API_TOKEN.encode()))
+
+def embedding_access_required(view):
+    """A logged-in admin, or ``Authorization: Bearer $EMBEDDING_API_TOKEN``; JSON 401 otherwise."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if current_user.is_authenticated or _valid_embedding_token(request.headers.get('Authorization', '')):
+            return view(*args, **kwargs)
+        return jsonify({'error': 'Authentication required'}), 401
+    return wrapper
+
+def _request_tenant(data):
+    """Site whose index a chat request searches: "tenant" in the body or the
+    X-Tenant header (a site URL or host name). Returns (tenant, error response).
+
+    Only sites that have been crawled are accepted, so clients cannot make the
+    index manager load (or remember) arbitrary tenants."""
+    value = data.get('tenant') or request.headers.get('X-Tenant')
+    if not value:
+        return None, None
+    tenant = resolve_tenant(value)
+    if tenant is None:
+        return None, (jsonify({'type': 'error', 'message': 'Invalid tenant'}), 400)
+    if not chat_service.has_index(tenant):
+        return None, (jsonify({'type': 'error', 'message': 'Unknown tenant'}), 404)
+    return tenant, None
+
+def _request_conversation(data):
+    """History for a chat request: (conversation_id, chat_history, error response).
+
+    With a "conversation_id" key the history is kept server-side (null or "" starts a
+    new conversation); without one the client sends the whole chat_history and
+    conversation_id is None."""
+    if 'conversation_id' not in data:
+        return None, data.get('chat_history', []), None
+    conversation_id = data.get('conversation_id')
+    if not conversation_id:
+        return conversations.create(), [], None
+    if not valid_conversation_id(conversation_id):
+        return None, None, (jsonify({'type': 'error', 'message': 'Invalid conversation_id'}), 400)
+    chat_history = conversations.get(conversation_id)
+    if chat_history is None:
+        return None, None, (jsonify({'type': 'error', 'message': 'Conversation not found or expired',
+                                     'code': 'conversation_not_found'}), 404)
+    return conversation_id, chat_history, None
+
+def _conversation_reply(conversation_id, chat_history, response):
+    """Store the turns added by ``response`` and drop the echoed history from it."""
+    if conversation_id is None:
+        return response
+    new_turns = response.get('chat_history', chat_history)[len(chat_history):]
+    if new_turns:
+        conversations.append(conversation_id, new_turns)
+    reply = {key: value for key, value in response.items() if key != 'chat_history'}
+    reply['conversation_id'] = conversation_id
+    return reply
+
 @app.route('/chat', methods=['POST'])
 def chat():
-    print("Received /chat request")  # Log when endpoint is hit
+    # The OpenAI calls run on the worker's shared event loop (services/openai_client.py)
     try:
         data = request.get_json()
         user_message = data.get('message')
-        chat_history = data.get('chat_history', [])
-        
-        print(f"User message: {user_message}")  # Log the incoming message
-        print(f"Chat history: {chat_history}")
 
         if not user_message:
             return jsonify({'type': 'error', 'message': 'No message provided'}), 400
 
-        print("Calling get_chatbot_response...")  # Log before calling backend logic
-        
+        tenant, error = _request_tenant(data)
+        if error:
+            return error
+        conversation_id, chat_history, error = _request_conversation(data)
+        if error:
+            return error
+
+        # Sizes only: the writer thread truncates the message, the history is never logged
+        log_event("chat.request", message=user_message, history_turns=len(chat_history),
+                  tenant=data.get('tenant'), conversation_id=conversation_id)
+
+        if 'text/event-stream' in request.headers.get('Accept', ''):
+            return _chat_event_stream(user_message, chat_history, tenant, conversation_id)
+
         # Use the enhanced chat function with history support
-        response = get_chatbot_response(user_message, chat_history)
+        response = get_chatbot_response(user_message, chat_history, tenant)
+        response = _conversation_reply(conversation_id, chat_history, response)
         
-        print(f"Chatbot response: {response}")  # Log the response from backend logic
-        return jsonify(response)
+        log_event("chat.response", type=response.get('type'), chars=len(response.get('message') or ''))
+        with metrics.CHAT_STAGE_SECONDS.time("serialize"):
+            return jsonify(response)
         
     except Exception as e:
-        print(f"Error in /chat endpoint: {e}")
+        logging.exception(f"Error in /chat endpoint: {e}")
         return jsonify({'type': 'error', 'message': str(e)}), 500
 
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _chat_event_stream(user_message, chat_history, tenant=None, conversation_id=None):
+    """Stream a chat reply as server-sent events: "token" events, then a terminal
+    "redirect", "done" or "error" event."""
+    def generate():
+        try:
+            for event, data in stream_chatbot_response(user_message, chat_history, tenant):
+                if event in ('done', 'redirect'):
+                    data = _conversation_reply(conversation_id, chat_history, data)
+                yield _sse(event, data)
+        except Exception as e:
+            logging.exception(f"Error in chat stream: {e}")
+            yield _sse('error', {'type': 'error', 'message': str(e)})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # let nginx pass events through unbuffered
+    })
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.get_json()
+    user_message = data.get('message')
+    if not user_message:
+        return jsonify({'type': 'error', 'message': 'No message provided'}), 400
+    tenant, error = _request_tenant(data)
+    if error:
+        return error
+    conversation_id, chat_history, error = _request_conversation(data)
+    if error:
+        return error
+    return _chat_event_stream(user_message, chat_history, tenant, conversation_id)
+
+@app.route('/conversations/<conversation_id>', methods=['GET'])
+def get_conversation(conversation_id):
+    chat_history = conversations.get(conversation_id) if valid_conversation_id(conversation_id) else None
+    if chat_history is None:
+        return jsonify({'error': 'Conversation not found or expired'}), 404
+    return jsonify({'conversation_id': conversation_id, 'chat_history': chat_history})
+
+@app.route('/conversations/<conversation_id>', methods=['DELETE'])
+def delete_conversation(conversation_id):
+    if not valid_conversation_id(conversation_id) or not conversations.delete(conversation_id):
+        return jsonify({'error': 'Conversation not found'}), 404
+    return jsonify({'message': 'Conversation deleted'})
+
+@app.route('/leads/queue/stats', methods=['GET'])
+def lead_queue_stats():
+    if lead_queue is None:
+        return jsonify({'mode': LEAD_INGEST_MODE})
+    return jsonify(dict(lead_queue.stats(), mode=LEAD_INGEST_MODE))
+
+@app.route('/conversations/stats', methods=['GET'])
+def conversation_stats():
+    return jsonify(conversations.stats())
+
 @app.route('/start-embedding', methods=['POST'])
+@embedding_access_required
 def start_embedding():
     print("Received /start-embedding request")  # Log when endpoint is hit
     try:
@@ -447,10 +689,16 @@ def start_embedding():
         
         print(f"Starting embedding process for URL: {url}")
         
-        # Call the embedding function from chat service
-        chat_service._crawl_embed_and_save_playwright_from_url(url)
-        
-        return jsonify({'message': 'Embedding process started successfully!'})
+        if tenant_for_url(url) is None:
+            return jsonify({'error': 'Invalid URL'}), 400
+
+        # Queue the crawl; incremental mode only re-embeds new or changed pages
+        # and merges them into the existing index
+        job, created = embedding_jobs.submit(url, incremental=bool(data.get('incremental')))
+        job['message'] = ('Embedding process started successfully!' if created
+                          else 'An embedding job for this site is already in progress.')
+        job['status_url'] = url_for('embedding_job_status', job_id=job['job_id'])
+        return jsonify(job), 202
         
     except Exception as e:
         import traceback
@@ -458,6 +706,50 @@ def start_embedding():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/embedding-jobs/<job_id>', methods=['GET'])
+@embedding_access_required
+def embedding_job_status(job_id):
+    job = embedding_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/embedding-jobs/<job_id>/cancel', methods=['POST'])
+@embedding_access_required
+def cancel_embedding_job(job_id):
+    if not embedding_jobs.cancel(job_id):
+        return jsonify({'error': 'Job not found or already finished'}), 404
+    return jsonify(embedding_jobs.get(job_id))
+
+@app.route('/embedding-cache/stats', methods=['GET'])
+def embedding_cache_stats():
+    return jsonify(embedding_cache.stats())
+
+@app.route('/answer-cache/stats', methods=['GET'])
+def answer_cache_stats():
+    return jsonify(answer_cache.stats())
+
+@app.route('/intent-router/stats', methods=['GET'])
+def intent_router_stats():
+    return jsonify(chat_service.router.stats())
+
+@app.route('/openai/stats', methods=['GET'])
+def openai_stats():
+    return jsonify(chat_module.openai_runner.stats())
+
+@app.route('/retrieval/stats', methods=['GET'])
+def retrieval_stats():
+    return jsonify(chat_service.retrieval_counts)
+
+@app.route('/indexes/stats', methods=['GET'])
+def index_stats():
+    return jsonify(chat_service.indexes.stats())
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Prometheus text format, summed over all gunicorn workers (see services/metrics.py)
+    return Response(metrics.registry.render(), mimetype=metrics.CONTENT_TYPE)
+
 @app.route('/transcribe', methods=['POST'])
 def transcribe_audio():
     if 'audio' not in request.files:
@@ -505,17 +797,20 @@ def transcribe_audio():
 #     result = lead_extractor.extract_from_url(url)
 #     return jsonify(result)
 
+def _lead_json(lead):
+    return {
+        "name": lead.name,
+        "email": lead.email,
+        "phone": lead.phone,
+        "message": lead.message,
+        "created_at": lead.created_at.isoformat() if lead.created_at else None
+    }
+
 @app.route('/get-top-leads', methods=['GET'])
 def get_top_leads():
     try:
-        leads = Lead.query.order_by(Lead.id.desc()).limit(5).all()
-        results = [{
-            "name": lead.name,
-            "email": lead.email,
-            "phone": lead.phone,
-            "message": lead.message,
-            "created_at": lead.created_at.isoformat() if lead.created_at else None
-        } for lead in leads]
+        leads, _ = list_leads(limit=5)
+        results = [_lead_json(lead) for lead in leads]
 
         return jsonify({
             "success": True,
@@ -528,5 +823,26 @@ def get_top_leads():
             "error": str(e)
         })
 
+@app.route('/leads', methods=['GET'])
+@login_required
+def get_leads():
+    """Newest leads first, optionally filtered by ``q``; pass ``next_cursor`` back as ``cursor`` for the next page."""
+    try:
+        cursor = request.args.get('cursor', type=int)
+        limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+        page, next_cursor = list_leads(search=request.args.get('q'), cursor=cursor, limit=limit)
+        return jsonify({
+            "success": True,
+            "leads": [dict(_lead_json(lead), id=lead.id) for lead in page],
+            "next_cursor": next_cursor
+        })
+
+    except Exception as e:
+        logging.exception("Could not list leads")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
 if __name__ == '__main__':
     app.run(debug=False, port=5000)
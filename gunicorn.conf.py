@@ -0,0 +1,35 @@
+# Gunicorn picks this file up automatically from the working directory.
+import os
+
+if os.getenv('GUNICORN_WORKERS'):
+    workers = int(os.getenv('GUNICORN_WORKERS'))
+
+# With threads > 1 gunicorn uses the gthread worker. Chat requests only wait on
+# the worker's shared OpenAI event loop, so a worker can serve many at once.
+if os.getenv('GUNICORN_THREADS'):
+    threads = int(os.getenv('GUNICORN_THREADS'))
+
+# Import app.py (and load the embedding index) once in the master; workers share
+# the index pages copy-on-write / through the memory-mapped store.
+preload_app = True
+
+
+def on_starting(server):
+    # Metric snapshots of a previous run would be summed into /metrics
+    from services.metrics import registry
+    registry.clear_directory()
+    # Each worker would get its own job table: polls and cancels on another worker would 404
+    from services.embedding_jobs import EMBEDDING_JOBS_DB
+    if EMBEDDING_JOBS_DB == ':memory:' and server.cfg.workers > 1:
+        raise RuntimeError("EMBEDDING_JOBS_DB=:memory: cannot be shared by several workers; use a file path")
+
+
+def post_fork(server, worker):
+    from app import post_fork as app_post_fork
+    app_post_fork()
+
+
+def child_exit(server, worker):
+    # Keep the exited worker's counters, drop its gauges and its snapshot file
+    from services.metrics import registry
+    registry.mark_process_dead(worker.pid)
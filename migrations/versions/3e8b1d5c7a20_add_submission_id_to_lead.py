@@ -0,0 +1,37 @@
+"""add_submission_id_to_lead
+
+Revision ID: 3e8b1d5c7a20
+Revises: 7c3e5a91d2f4
+Create Date: 2026-10-18 13:02:11.504871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e8b1d5c7a20'
+down_revision = '7c3e5a91d2f4'
+branch_labels = None
+depends_on = None
+
+
+# Plain ALTER TABLE, no batch mode: rebuilding the table on SQLite would drop
+# the full-text triggers added by 7c3e5a91d2f4. For the same reason uniqueness
+# is a unique index rather than a table constraint.
+
+
+def upgrade():
+    op.add_column('lead', sa.Column('submission_id', sa.String(length=32), nullable=True))
+
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index('ix_lead_submission_id', 'lead', ['submission_id'], unique=True,
+                            postgresql_concurrently=True)
+    else:
+        op.create_index('ix_lead_submission_id', 'lead', ['submission_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_lead_submission_id', table_name='lead')
+    op.drop_column('lead', 'submission_id')
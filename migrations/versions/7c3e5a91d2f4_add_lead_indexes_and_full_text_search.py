@@ -0,0 +1,75 @@
+"""add_lead_indexes_and_full_text_search
+
+Revision ID: 7c3e5a91d2f4
+Revises: b9242af44d74
+Create Date: 2026-10-18 09:12:40.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e5a91d2f4'
+down_revision = 'b9242af44d74'
+branch_labels = None
+depends_on = None
+
+# Copied from models.py as of this revision
+SEARCH_DOCUMENT = (
+    "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(email, '') || ' ' || "
+    "coalesce(phone, '') || ' ' || coalesce(message, ''))"
+)
+FTS_COLUMNS = "name, email, phone, message"
+SQLITE_FTS = (
+    f"CREATE VIRTUAL TABLE lead_fts USING fts5({FTS_COLUMNS}, content='lead', content_rowid='id')",
+    f"CREATE TRIGGER lead_fts_insert AFTER INSERT ON lead BEGIN "
+    f"INSERT INTO lead_fts (rowid, {FTS_COLUMNS}) VALUES (new.id, new.name, new.email, new.phone, new.message); END",
+    f"CREATE TRIGGER lead_fts_delete AFTER DELETE ON lead BEGIN "
+    f"INSERT INTO lead_fts (lead_fts, rowid, {FTS_COLUMNS}) "
+    f"VALUES ('delete', old.id, old.name, old.email, old.phone, old.message); END",
+    f"CREATE TRIGGER lead_fts_update AFTER UPDATE ON lead BEGIN "
+    f"INSERT INTO lead_fts (lead_fts, rowid, {FTS_COLUMNS}) "
+    f"VALUES ('delete', old.id, old.name, old.email, old.phone, old.message); "
+    f"INSERT INTO lead_fts (rowid, {FTS_COLUMNS}) VALUES (new.id, new.name, new.email, new.phone, new.message); END",
+)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        # CONCURRENTLY keeps the lead table writable while the indexes build,
+        # but cannot run inside the migration's transaction
+        with op.get_context().autocommit_block():
+            op.create_index('ix_lead_created_at', 'lead', ['created_at'], postgresql_concurrently=True)
+            op.create_index('ix_lead_email', 'lead', ['email'], postgresql_concurrently=True)
+            op.create_index('ix_lead_search', 'lead', [sa.text(SEARCH_DOCUMENT)],
+                            postgresql_using='gin', postgresql_concurrently=True)
+        return
+
+    op.create_index('ix_lead_created_at', 'lead', ['created_at'])
+    op.create_index('ix_lead_email', 'lead', ['email'])
+    if dialect == 'sqlite':
+        for statement in SQLITE_FTS:
+            op.execute(statement)
+        # Index the leads that already exist
+        op.execute("INSERT INTO lead_fts (lead_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.drop_index('ix_lead_search', table_name='lead', postgresql_concurrently=True)
+            op.drop_index('ix_lead_email', table_name='lead', postgresql_concurrently=True)
+            op.drop_index('ix_lead_created_at', table_name='lead', postgresql_concurrently=True)
+        return
+
+    if dialect == 'sqlite':
+        for trigger in ('lead_fts_insert', 'lead_fts_delete', 'lead_fts_update'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS lead_fts")
+    op.drop_index('ix_lead_email', table_name='lead')
+    op.drop_index('ix_lead_created_at', table_name='lead')
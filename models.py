@@ -7,13 +7,50 @@ import secrets
 # Initialize extensions
 db = SQLAlchemy()
 
+# Full-text document of a lead. 'simple' does not stem, so names, e-mail addresses
+# and phone numbers match as typed. Queries must use this exact expression for
+# Postgres to pick the GIN index (see services/lead_search.py).
+LEAD_SEARCH_DOCUMENT = (
+    "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(email, '') || ' ' || "
+    "coalesce(phone, '') || ' ' || coalesce(message, ''))"
+)
+# SQLite has no GIN: an external-content FTS5 table kept in step by triggers
+LEAD_FTS_COLUMNS = "name, email, phone, message"
+LEAD_FTS_SQLITE = (
+    f"CREATE VIRTUAL TABLE lead_fts USING fts5({LEAD_FTS_COLUMNS}, content='lead', content_rowid='id')",
+    f"CREATE TRIGGER lead_fts_insert AFTER INSERT ON lead BEGIN "
+    f"INSERT INTO lead_fts (rowid, {LEAD_FTS_COLUMNS}) VALUES (new.id, new.name, new.email, new.phone, new.message); END",
+    f"CREATE TRIGGER lead_fts_delete AFTER DELETE ON lead BEGIN "
+    f"INSERT INTO lead_fts (lead_fts, rowid, {LEAD_FTS_COLUMNS}) "
+    f"VALUES ('delete', old.id, old.name, old.email, old.phone, old.message); END",
+    f"CREATE TRIGGER lead_fts_update AFTER UPDATE ON lead BEGIN "
+    f"INSERT INTO lead_fts (lead_fts, rowid, {LEAD_FTS_COLUMNS}) "
+    f"VALUES ('delete', old.id, old.name, old.email, old.phone, old.message); "
+    f"INSERT INTO lead_fts (rowid, {LEAD_FTS_COLUMNS}) VALUES (new.id, new.name, new.email, new.phone, new.message); END",
+)
+
 class Lead(db.Model):
+    __table_args__ = (
+        db.Index('ix_lead_created_at', 'created_at'),
+        db.Index('ix_lead_email', 'email'),
+        db.Index('ix_lead_submission_id', 'submission_id', unique=True),
+        db.Index('ix_lead_search', db.text(LEAD_SEARCH_DOCUMENT), postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(100), nullable=False)
     message = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Id of the /form submission in the write-behind queue; makes redelivery idempotent
+    submission_id = db.Column(db.String(32), nullable=True)
+
+# Tables made by db.create_all() get the SQLite full-text index too; existing
+# databases get it from the migration
+for statement in LEAD_FTS_SQLITE:
+    db.event.listen(Lead.__table__, 'after_create', db.DDL(statement).execute_if(dialect='sqlite'))
+db.event.listen(Lead.__table__, 'before_drop', db.DDL("DROP TABLE IF EXISTS lead_fts").execute_if(dialect='sqlite'))
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
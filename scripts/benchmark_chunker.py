@@ -0,0 +1,72 @@
+import sys
+import os
+import time
+import tracemalloc
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.chunker import iter_chunks
+from services.embedding_store import load_index, store_exists
+from services.tokens import count_tokens
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_TOKENS = 500
+OVERLAP_TOKENS = 50
+
+
+def word_chunk_text(text, max_tokens):
+    """The previous chunker: fixed windows of ``max_tokens`` whitespace-separated words."""
+    words = text.split()
+    chunks, current_chunk, current_length = [], [], 0
+    for word in words:
+        if current_length + len(word.split()) > max_tokens:
+            chunks.append(" ".join(current_chunk))
+            current_chunk, current_length = [], 0
+        current_chunk.append(word)
+        current_length += len(word.split())
+    if current_chunk:
+        chunks.append(" ".join(current_chunk))
+    return chunks
+
+
+def sample_corpus():
+    """Page-like text rebuilt from the stored index, or a synthetic page if there is none."""
+    base_path = os.path.join(ROOT, 'website_embeddings')
+    if store_exists(base_path):
+        index = load_index(base_path)
+        pages = {}
+        for meta in index.metadata:
+            pages.setdefault(meta["url"], []).append(meta["chunk"])
+        return ["\n".join(chunks) for chunks in pages.values()]
+    paragraph = ("Leads4Less helps small businesses grow with SEO, email marketing and paid media. "
+                 "Our team audits your site, fixes technical issues and builds content that ranks. ")
+    return ["Our Services\n" + paragraph * 40 + "\nPricing\n" + paragraph * 20] * 20
+
+
+def measure(name, chunk_page, pages, repeat):
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        chunks = [chunk for page in pages for chunk in chunk_page(page)]
+    elapsed = (time.perf_counter() - start) / repeat
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    sizes = sorted(count_tokens(chunk) for chunk in chunks)
+    over = sum(1 for size in sizes if size > MAX_TOKENS)
+    print(f"{name:<14} {elapsed * 1000:9.1f} ms  peak {peak / 1024:8.0f} KiB  "
+          f"{len(chunks):5d} chunks  tokens p50 {sizes[len(sizes) // 2]:4d} max {sizes[-1]:5d}  "
+          f"over budget {over}")
+
+
+def benchmark_chunker(repeat=3):
+    """Compare the word-window chunker with the streaming token-aware chunker."""
+    pages = sample_corpus()
+    print(f"{len(pages)} pages, {sum(len(p) for p in pages)} characters, budget {MAX_TOKENS} tokens")
+    measure("word windows", lambda page: word_chunk_text(page, MAX_TOKENS), pages, repeat)
+    measure("token-aware", lambda page: (c.text for c in iter_chunks(page, MAX_TOKENS, OVERLAP_TOKENS)),
+            pages, repeat)
+
+
+if __name__ == '__main__':
+    benchmark_chunker(*(int(arg) for arg in sys.argv[1:2]))
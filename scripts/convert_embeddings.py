@@ -0,0 +1,21 @@
+import sys
+import os
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.embedding_store import convert_json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def convert_embeddings(json_path=None, base_path=None):
+    """Convert website_embeddings.json into the binary memory-mapped store."""
+    json_path = json_path or os.path.join(ROOT, 'website_embeddings.json')
+    base_path = base_path or os.path.splitext(json_path)[0]
+    count = convert_json(json_path, base_path)
+    print(f"Converted {count} embeddings from {json_path} to the binary store at {base_path}.*")
+
+
+if __name__ == '__main__':
+    convert_embeddings(*sys.argv[1:3])
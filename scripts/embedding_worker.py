@@ -0,0 +1,22 @@
+import sys
+import os
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.chat import chat_service
+from services.embedding_jobs import EmbeddingJobRunner, JobStore, EMBEDDING_JOBS_DB
+
+
+def run_worker():
+    """Run queued /start-embedding jobs out of process (EMBEDDING_JOBS_EXTERNAL=true)."""
+    if EMBEDDING_JOBS_DB == ':memory:':
+        print("Set EMBEDDING_JOBS_DB to the job database shared with the web app.")
+        sys.exit(1)
+    runner = EmbeddingJobRunner(chat_service.run_embedding_job, JobStore(EMBEDDING_JOBS_DB), external=True)
+    print(f"Embedding worker polling {EMBEDDING_JOBS_DB} for jobs...")
+    runner.work_forever()
+
+
+if __name__ == '__main__':
+    run_worker()
@@ -0,0 +1,121 @@
+import sys
+import json
+import random
+import threading
+import time
+import zlib
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+REPLY_WORDS = ("Leads4Less can help your business grow with SEO, Email Marketing, Paid Media and "
+               "E-Commerce solutions. Visit https://leads4less.io/ to learn more about our services.").split()
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Answers /v1/embeddings and /v1/chat/completions (plain or streamed) with canned data."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        config = self.server.config
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with self.server.lock:
+            self.server.requests += 1
+        time.sleep(config.latency_ms / 1000)
+        if random.random() < config.error_rate:
+            return self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                   {"retry-after-ms": "50"})
+        if self.path.endswith("/embeddings"):
+            return self._embeddings(request)
+        if self.path.endswith("/chat/completions"):
+            return self._chat(request)
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _embeddings(self, request):
+        inputs = request.get("input")
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        data = []
+        for i, text in enumerate(inputs):
+            # Deterministic per text, so the app's caches behave as with the real API
+            rng = np.random.default_rng(zlib.crc32(text.encode('utf-8')))
+            data.append({"object": "embedding", "index": i,
+                         "embedding": rng.standard_normal(self.server.config.dim).round(6).tolist()})
+        tokens = sum(len(text) // 4 + 1 for text in inputs)
+        self._send_json(200, {"object": "list", "data": data, "model": request.get("model"),
+                              "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    def _chat(self, request):
+        config = self.server.config
+        words = [REPLY_WORDS[i % len(REPLY_WORDS)] for i in range(config.reply_tokens)]
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": request.get("model")}
+        if not request.get("stream"):
+            time.sleep(config.token_delay_ms * len(words) / 1000)
+            return self._send_json(200, dict(base, object="chat.completion", choices=[{
+                "index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop",
+            }], usage={"prompt_tokens": 0, "completion_tokens": len(words), "total_tokens": len(words)}))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, word in enumerate(words + [None]):
+            choice = {"index": 0, "delta": {"content": word + " "} if word else {},
+                      "finish_reason": None if word else "stop"}
+            self._write_chunk(f"data: {json.dumps(dict(base, object='chat.completion.chunk', choices=[choice]))}\n\n")
+            if word:
+                time.sleep(config.token_delay_ms / 1000)
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_fake_openai(port=0, latency_ms=200, token_delay_ms=10, reply_tokens=60, error_rate=0.0, dim=1536):
+    """Serve the fake API on a background thread; returns the server (``server.base_url``)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOpenAIHandler)
+    server.daemon_threads = True
+    server.config = argparse.Namespace(latency_ms=latency_ms, token_delay_ms=token_delay_ms,
+                                       reply_tokens=reply_tokens, error_rate=error_rate, dim=dim)
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_arguments(parser):
+    parser.add_argument('--openai-latency-ms', type=float, default=200, help='delay before every response')
+    parser.add_argument('--openai-token-delay-ms', type=float, default=10, help='delay per generated token')
+    parser.add_argument('--openai-reply-tokens', type=int, default=60)
+    parser.add_argument('--openai-error-rate', type=float, default=0.0, help='fraction of requests answered 429')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stand-in OpenAI API for local load tests.")
+    parser.add_argument('--port', type=int, default=8081)
+    add_arguments(parser)
+    args = parser.parse_args(sys.argv[1:])
+    server = start_fake_openai(args.port, args.openai_latency_ms, args.openai_token_delay_ms,
+                               args.openai_reply_tokens, args.openai_error_rate)
+    print(f"Fake OpenAI API on {server.base_url} (set OPENAI_BASE_URL to use it)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,290 @@
+import sys
+import os
+import json
+import time
+import socket
+import argparse
+import functools
+import secrets
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.fake_openai import add_arguments, start_fake_openai
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ('embedding', 'chat', 'chat_stream', 'form')  # crawl first so chat has an index to search
+QUESTIONS = [
+    "What SEO services do you offer for local businesses?",
+    "How does your email marketing work?",
+    "Can you run paid media campaigns on Google and Meta?",
+    "Do you build Shopify stores?",
+    "What results can I expect from SEO in six months?",
+    "How do you report on campaign performance?",
+]
+STATS_ENDPOINTS = ('/openai/stats', '/retrieval/stats', '/answer-cache/stats', '/embedding-cache/stats',
+                   '/intent-router/stats', '/indexes/stats')
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(samples, elapsed):
+    """Latency percentiles (ms), throughput and error counts; extra numeric sample keys
+    (per-stage timings such as ``ttfb``) get their own percentiles."""
+    ok = [s for s in samples if s['ok']]
+    summary = {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "status_codes": {},
+        "seconds": round(elapsed, 3),
+        "rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+    }
+    for sample in samples:
+        code = str(sample.get('status'))
+        summary["status_codes"][code] = summary["status_codes"].get(code, 0) + 1
+    stages = sorted({key for s in ok for key, value in s.items()
+                     if isinstance(value, float) and key != 'latency'})
+    for stage in ['latency'] + stages:
+        values = sorted(s[stage] * 1000 for s in ok if stage in s)
+        summary[stage + "_ms"] = {
+            "p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99),
+            "mean": sum(values) / len(values) if values else None, "max": values[-1] if values else None,
+        }
+    return summary
+
+
+def run_scenario(request_fn, concurrency, total):
+    """Issue ``total`` requests from ``concurrency`` threads, each with its own session."""
+    local = threading.local()
+
+    def one(i):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            sample = request_fn(local.session, i)
+        except (requests.RequestException, ValueError) as e:
+            sample = {"ok": False, "status": type(e).__name__}
+        sample['latency'] = time.perf_counter() - started
+        return sample
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(one, range(total)))
+    return summarize(samples, time.perf_counter() - started)
+
+
+def chat_body(tenant, unique, i):
+    message = QUESTIONS[i % len(QUESTIONS)] + (f" (request {i})" if unique else "")
+    return {"message": message, "chat_history": [], "tenant": tenant}
+
+
+def chat_request(base_url, tenant, unique, session, i):
+    response = session.post(f"{base_url}/chat", json=chat_body(tenant, unique, i), timeout=120)
+    return {"ok": response.ok and response.json().get('type') != 'error', "status": response.status_code}
+
+
+def chat_stream_request(base_url, tenant, unique, session, i):
+    started = time.perf_counter()
+    sample = {"ok": False}
+    with session.post(f"{base_url}/chat", json=chat_body(tenant, unique, i),
+                      headers={"Accept": "text/event-stream"}, stream=True, timeout=120) as response:
+        sample["status"] = response.status_code
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: token") and "ttfb" not in sample:
+                sample["ttfb"] = time.perf_counter() - started
+            elif line.startswith("event: done") or line.startswith("event: redirect"):
+                sample["ok"] = True
+            elif line.startswith("event: error"):
+                break
+    return sample
+
+
+def form_request(base_url, session, i):
+    response = session.post(f"{base_url}/form", json={
+        "name": f"Load Test {i}", "email": f"load{i}@example.com", "phone": "555-0100",
+        "message": "Benchmark lead",
+    }, timeout=60)
+    return {"ok": response.ok, "status": response.status_code}
+
+
+def embedding_request(base_url, site_url, timeout, token, session, i):
+    """One crawl+embed job of the static site, polled until it finishes."""
+    session.headers["Authorization"] = f"Bearer {token}"
+    response = session.post(f"{base_url}/start-embedding", json={"url": site_url}, timeout=60)
+    if response.status_code != 202:
+        return {"ok": False, "status": response.status_code}
+    submitted = time.perf_counter()
+    status_url = f"{base_url}{response.json()['status_url']}"
+    deadline = submitted + timeout
+    job = {}
+    while time.perf_counter() < deadline:
+        job = session.get(status_url, timeout=30).json()
+        if job.get('status') in ('succeeded', 'failed', 'cancelled'):
+            break
+        time.sleep(0.2)
+    run_seconds = float(job.get('elapsed_seconds') or 0.0)
+    return {
+        "ok": job.get('status') == 'succeeded',
+        "status": job.get('status', 'timeout'),
+        "queued": max(0.0, time.perf_counter() - submitted - run_seconds),
+        "crawl_and_embed": run_seconds,
+        "pages": job.get('pages_visited'),
+        "chunks": job.get('chunks_embedded'),
+    }
+
+
+def build_static_site(directory, pages):
+    """A small linked site with headings and paragraphs, like the pages the crawler sees."""
+    paragraph = ("We help small businesses grow with search engine optimization, email marketing and paid "
+                 "media. Every campaign starts with an audit, a plan and clear monthly reporting. ")
+    links = "".join(f'<li><a href="page-{i}.html">Service {i}</a></li>' for i in range(pages))
+    with open(os.path.join(directory, "index.html"), "w") as f:
+        f.write(f"<html><body><h1>Benchmark Site</h1><ul>{links}</ul></body></html>")
+    for i in range(pages):
+        with open(os.path.join(directory, f"page-{i}.html"), "w") as f:
+            f.write(f'<html><body><h1>Service {i}</h1><p>{paragraph * (3 + i % 5)}</p>'
+                    f'<h2>Pricing</h2><p>Plans for service {i} start at ${100 + 10 * i} per month.</p>'
+                    f'<a href="index.html">Home</a></body></html>')
+
+
+def start_static_site(directory):
+    handler = functools.partial(_QuietHandler, directory=directory)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/index.html"
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(port, env, log_file, startup_timeout=120):
+    """Run app.py under gunicorn (gunicorn.conf.py applies) and wait until it answers."""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "app:app"],
+        cwd=ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"gunicorn exited with code {process.returncode}, see {log_file.name}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/form", timeout=2).ok:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise SystemExit(f"gunicorn did not start within {startup_timeout}s, see {log_file.name}")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_test(args):
+    """Start the stand-ins and the app, run each scenario, and write the results as JSON."""
+    workdir = tempfile.mkdtemp(prefix="load-test-")
+    os.makedirs(os.path.join(workdir, "site"))
+    build_static_site(os.path.join(workdir, "site"), args.site_pages)
+    site, site_url = start_static_site(os.path.join(workdir, "site"))
+    fake = start_fake_openai(0, args.openai_latency_ms, args.openai_token_delay_ms,
+                             args.openai_reply_tokens, args.openai_error_rate)
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="sk-load-test",
+        OPENAI_BASE_URL=fake.base_url,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'leads.db')}",
+        # Shared by all workers so job status polls can hit any of them
+        EMBEDDING_JOBS_DB=os.path.join(workdir, "jobs.db"),
+        EMBEDDING_API_TOKEN=secrets.token_urlsafe(16),
+        INDEXES_DIR=os.path.join(workdir, "indexes"),
+        GUNICORN_WORKERS=str(args.workers),
+        GUNICORN_THREADS=str(args.threads),
+    )
+    results = {
+        "commit": git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": vars(args),
+        "scenarios": {},
+    }
+    log_path = os.path.join(workdir, "gunicorn.log")
+    with open(log_path, "w") as log_file:
+        app = start_app(port, env, log_file)
+        try:
+            for name in args.scenarios:
+                if name == 'chat':
+                    fn = functools.partial(chat_request, base_url, site_url, args.unique)
+                elif name == 'chat_stream':
+                    fn = functools.partial(chat_stream_request, base_url, site_url, args.unique)
+                elif name == 'form':
+                    fn = functools.partial(form_request, base_url)
+                else:
+                    fn = functools.partial(embedding_request, base_url, site_url, args.job_timeout,
+                                           env["EMBEDDING_API_TOKEN"])
+                concurrency = 1 if name == 'embedding' else args.concurrency
+                total = args.embedding_jobs if name == 'embedding' else args.requests
+                print(f"Running {name}: {total} requests, concurrency {concurrency}")
+                results["scenarios"][name] = summary = run_scenario(fn, concurrency, total)
+                print(f"  p50 {summary['latency_ms']['p50']} ms  p95 {summary['latency_ms']['p95']} ms  "
+                      f"p99 {summary['latency_ms']['p99']} ms  {summary['rps']} req/s  {summary['errors']} errors")
+            results["server_stats"] = {
+                path: requests.get(f"{base_url}{path}", timeout=10).json() for path in STATS_ENDPOINTS
+            }
+        finally:
+            app.terminate()
+            app.wait(timeout=30)
+            site.shutdown()
+            fake.shutdown()
+    results["fake_openai_requests"] = fake.requests
+    results["gunicorn_log"] = log_path
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load-test /chat, /form and /start-embedding under gunicorn "
+                                                 "against a stand-in OpenAI API and a local static site.")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--unique', action='store_true', help='make every chat question unique (defeats caches)')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--site-pages', type=int, default=20)
+    parser.add_argument('--embedding-jobs', type=int, default=1)
+    parser.add_argument('--job-timeout', type=float, default=300)
+    parser.add_argument('--output', default=os.path.join(ROOT, 'load_test_results.json'))
+    add_arguments(parser)
+    load_test(parser.parse_args(sys.argv[1:]))
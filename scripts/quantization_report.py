@@ -0,0 +1,78 @@
+import sys
+import os
+import json
+import time
+
+import numpy as np
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.embedding_store import load_index, store_exists
+from services.quantization import RERANK_CANDIDATES, QuantizedVectors
+from services.vector_index import VectorIndex, normalize_rows, top_k
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUERY_NOISE = 0.3  # perturbation of sampled chunk vectors, roughly a paraphrased question
+
+
+def load_corpus(path):
+    """Float32 unit vectors from a binary store (base path) or a legacy JSON file."""
+    if path.endswith('.json'):
+        with open(path, 'r') as f:
+            return VectorIndex.from_records(json.load(f)).vectors
+    if not store_exists(path):
+        raise SystemExit(f"No embedding store at {path}")
+    return np.asarray(load_index(path).vectors, dtype=np.float32)
+
+
+def make_queries(vectors, count, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = vectors[rng.choice(len(vectors), min(count, len(vectors)), replace=False)]
+    noise = rng.normal(scale=QUERY_NOISE / np.sqrt(vectors.shape[1]), size=rows.shape).astype(np.float32)
+    return normalize_rows(rows + noise)
+
+
+def quantization_report(path=None, k=10, queries=200):
+    """Recall@k, resident bytes per chunk and query latency for each storage precision."""
+    path = path or os.path.join(ROOT, 'website_embeddings')
+    if not os.path.exists(path) and os.path.exists(f"{path}.json"):
+        path = f"{path}.json"
+    vectors = load_corpus(path)
+    n, dim = vectors.shape
+    k = min(int(k), n)
+    query_matrix = make_queries(vectors, int(queries))
+    exact = top_k(query_matrix @ vectors.T, k)
+    print(f"{path}: {n} chunks x {dim} dims, {len(query_matrix)} queries, recall@{k}")
+    if n < 1000:
+        print("(small corpus: recall is optimistic; larger corpora show the real gap)")
+
+    quantized = {dtype: QuantizedVectors.quantize(vectors, dtype) for dtype in ("float16", "int8")}
+    rerank_candidates = RERANK_CANDIDATES or 50
+    configs = [("float32", 0)] + [(dtype, rerank) for dtype in quantized for rerank in (0, rerank_candidates)]
+    report = []
+    for dtype, rerank in configs:
+        q = quantized.get(dtype)
+        index = VectorIndex(vectors, list(range(n)), normalized=True)
+        index.quantized, index.rerank = q, rerank
+        start = time.perf_counter()
+        results = index.search_rows(query_matrix, k)
+        elapsed = (time.perf_counter() - start) / len(query_matrix)
+        recall = np.mean([len({i for i, _ in row} & set(truth)) / k for row, truth in zip(results, exact)])
+        resident = q.nbytes if q is not None else vectors.nbytes
+        report.append({
+            "dtype": dtype,
+            "rerank": rerank,
+            "recall": round(float(recall), 4),
+            "bytes_per_chunk": round(resident / n, 1),
+            "memory_ratio": round(vectors.nbytes / resident, 2),
+            "ms_per_query": round(elapsed * 1000, 3),
+        })
+        print(f"{dtype:<8} rerank {rerank:>3}  recall {recall:.4f}  {resident / n:8.1f} B/chunk "
+              f"({vectors.nbytes / resident:.1f}x smaller)  {elapsed * 1000:.3f} ms/query")
+    return report
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    quantization_report(*(args[:1] + [int(a) for a in args[1:3]]))
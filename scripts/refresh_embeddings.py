@@ -0,0 +1,17 @@
+import sys
+import os
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.chat import chat_service, BASE_URL
+
+
+def refresh_embeddings(base_url=BASE_URL):
+    """Incrementally re-crawl the site, re-embedding only new or changed content."""
+    chat_service.refresh_embeddings(base_url)
+    print(f"Embedding index refreshed from {base_url}: {len(chat_service.index)} chunks.")
+
+
+if __name__ == '__main__':
+    refresh_embeddings(*sys.argv[1:2])
@@ -0,0 +1,116 @@
+"""Inverted-file (IVF) approximate nearest-neighbour index in NumPy.
+
+Vectors are partitioned by a spherical k-means coarse quantizer into ``nlist``
+lists. A query scores the centroids, then only the rows in its ``nprobe`` best
+lists, so the work per query is roughly ``nlist + N * nprobe / nlist`` dot
+products instead of ``N``. Raising ``nprobe`` trades latency for recall;
+``nprobe == nlist`` is an exact search.
+
+Small indexes gain nothing from this, so an IVF is only built once a corpus has
+at least ``ANN_MIN_VECTORS`` rows; below that ``VectorIndex`` searches exactly.
+"""
+import logging
+import os
+
+import numpy as np
+
+from services.atomic_files import replace_atomically
+from services.vector_index import normalize_rows, top_k
+
+ANN_BACKEND = os.getenv('ANN_BACKEND', 'exact').lower()  # 'exact' or 'ivf'
+ANN_MIN_VECTORS = int(os.getenv('ANN_MIN_VECTORS', 20000))
+IVF_NLIST = int(os.getenv('IVF_NLIST', 0))  # 0 = 4 * sqrt(N)
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', 8))
+IVF_TRAIN_ITERATIONS = 10
+IVF_TRAIN_POINTS_PER_LIST = 256
+_ASSIGN_BATCH = 8192
+
+
+def _assign(vectors, centroids):
+    """Nearest centroid (by inner product) for every row, in memory-bounded batches."""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _ASSIGN_BATCH):
+        batch = np.asarray(vectors[start:start + _ASSIGN_BATCH], dtype=np.float32)
+        assignments[start:start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+    return assignments
+
+
+class IVFIndex:
+    def __init__(self, centroids, order, offsets, nprobe=IVF_NPROBE):
+        self.centroids = centroids  # (nlist, D), unit rows
+        self.order = order          # row ids grouped by list
+        self.offsets = offsets      # list l holds order[offsets[l]:offsets[l + 1]]
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @property
+    def count(self):
+        return int(self.offsets[-1])
+
+    @classmethod
+    def build(cls, vectors, nlist=None, n_iter=IVF_TRAIN_ITERATIONS, seed=0):
+        """Train the coarse quantizer on a sample of ``vectors`` (unit rows) and fill the lists."""
+        n = len(vectors)
+        nlist = nlist or IVF_NLIST or max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(seed)
+        sample_size = min(n, nlist * IVF_TRAIN_POINTS_PER_LIST)
+        sample = np.asarray(vectors[np.sort(rng.choice(n, sample_size, replace=False))], dtype=np.float32)
+
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(n_iter):
+            assignments = _assign(sample, centroids)
+            by_list = np.argsort(assignments, kind='stable')
+            counts = np.bincount(assignments, minlength=nlist)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            nonempty = counts > 0
+            sums = np.add.reduceat(sample[by_list], starts[nonempty], axis=0)
+            centroids[nonempty] = sums
+            # Re-seed empty lists from random sample points
+            empty = np.flatnonzero(~nonempty)
+            if len(empty):
+                centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+            normalize_rows(centroids)
+
+        assignments = _assign(vectors, centroids)
+        order = np.argsort(assignments, kind='stable').astype(np.int64)
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=nlist)))).astype(np.int64)
+        logging.info(f"Built IVF index: {n} vectors in {nlist} lists")
+        return cls(centroids, order, offsets)
+
+    def save(self, path):
+        replace_atomically(path, lambda f: np.savez(f, centroids=self.centroids, order=self.order,
+                                                    offsets=self.offsets))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['centroids'], data['order'], data['offsets'])
+
+    def search_many(self, vectors, queries, k, nprobe=None):
+        """Approximate top-k for pre-normalized ``queries``: list of (row ids, scores)."""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probes = top_k(queries @ self.centroids.T, nprobe)
+        results = []
+        for query, lists in zip(queries, probes):
+            # Sorted ids read the (possibly memory-mapped) matrix front to back
+            candidates = np.sort(np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists]))
+            if not len(candidates):
+                results.append((candidates, np.empty(0, dtype=np.float32)))
+                continue
+            scores = vectors[candidates] @ query
+            best = top_k(scores, k)
+            results.append((candidates[best], scores[best]))
+        return results
+
+
+def maybe_build_ann(index):
+    """Attach an IVF to ``index`` when ANN_BACKEND=ivf and the corpus is large enough."""
+    if ANN_BACKEND == 'ivf' and len(index) >= ANN_MIN_VECTORS:
+        index.ann = IVFIndex.build(index.vectors)
+    else:
+        index.ann = None
+    return index
@@ -0,0 +1,118 @@
+"""Semantic cache of chatbot replies for first-turn questions.
+
+Cached query embeddings live in one preallocated, row-normalized matrix, so a
+lookup is a single matrix-vector product. A cached reply is served only when the
+new query is within ``threshold`` cosine similarity of a cached one *and* the
+retrieval step picked the same context chunks, so answers never outlive the
+content they were grounded on. Entries expire after ``ttl`` seconds and the
+least recently used entry is evicted when the cache is full.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from services.embedding_store import content_hash
+
+
+def context_key(chunks):
+    """Identity of a retrieved context: hashes of the chunk texts, in rank order."""
+    return tuple(content_hash(c['chunk']) for c in chunks)
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold=0.97, ttl=3600, max_entries=1000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._reset()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _reset(self):
+        self._vectors = None
+        self._active = np.zeros(self.max_entries, dtype=bool)
+        self._entries = OrderedDict()  # slot -> (context key, reply, expires_at)
+        self._free = list(range(self.max_entries - 1, -1, -1))
+
+    @staticmethod
+    def _normalize(query_emb):
+        q = np.asarray(query_emb, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        return q / norm if norm else q
+
+    def get(self, query_emb, key):
+        if query_emb is None or self.max_entries <= 0:
+            return None
+        q = self._normalize(query_emb)
+        now = time.monotonic()
+        with self._lock:
+            if not self._entries or self._vectors.shape[1] != q.shape[0]:
+                self.misses += 1
+                return None
+            scores = self._vectors @ q
+            scores[~self._active] = -np.inf
+            candidates = np.flatnonzero(scores >= self.threshold)
+            for slot in candidates[np.argsort(-scores[candidates])]:
+                slot = int(slot)
+                entry_key, reply, expires_at = self._entries[slot]
+                if expires_at < now:
+                    self._drop(slot)
+                    self.expired += 1
+                    continue
+                if entry_key == key:
+                    self._entries.move_to_end(slot)
+                    self.hits += 1
+                    return reply
+            self.misses += 1
+            return None
+
+    def put(self, query_emb, key, reply):
+        if query_emb is None or self.max_entries <= 0:
+            return
+        q = self._normalize(query_emb)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != q.shape[0]:
+                self._reset()
+                self._vectors = np.zeros((self.max_entries, q.shape[0]), dtype=np.float32)
+            if not self._free:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+            slot = self._free.pop()
+            self._vectors[slot] = q
+            self._active[slot] = True
+            self._entries[slot] = (key, reply, time.monotonic() + self.ttl)
+
+    def _drop(self, slot):
+        del self._entries[slot]
+        self._active[slot] = False
+        self._free.append(slot)
+
+    def invalidate(self):
+        """Forget every cached answer, e.g. after the embedding index is rebuilt."""
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._reset()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,25 @@
+"""Atomic file replacement for the on-disk index files.
+
+Every write goes to a uniquely named temporary file in the target's directory
+and is then renamed over the target, so readers never see a half-written file
+and two processes saving the same index (e.g. concurrent crawls of one site)
+never write into each other's temporary file.
+"""
+import os
+import tempfile
+
+
+def replace_atomically(path, write):
+    """Call ``write(f)`` on a fresh binary file, then rename it to ``path``."""
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
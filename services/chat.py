@@ -1,76 +1,155 @@
+import atexit
 import os
 import json
 import logging
 import time
 import re
-from urllib.parse import urlparse, urljoin
-from bs4 import BeautifulSoup
 import numpy as np
-import requests
-from playwright.sync_api import sync_playwright
 from dotenv import load_dotenv
 from flask import session
 import openai
+from services.vector_index import VectorIndex
+from services.embedding_store import (content_hash, load_hashes, load_index, save_index, store_count,
+                                     store_exists, store_version)
+from services.incremental_index import IncrementalIndex
+from services.embedding_cache import EmbeddingCache
+from services.embedding_batcher import EmbeddingBatcher
+from services.crawler import AsyncCrawler, CrawlError, normalize_url
+from services.answer_cache import SemanticAnswerCache, context_key
+from services.ann_index import maybe_build_ann
+from services.index_manager import INDEXES_DIR, IndexManager, tenant_for_url
+from services.prompt_builder import PromptBuilder, SUMMARY_MAX_TOKENS
+from services.chunker import iter_chunks
+from services.intent_router import IntentRouter
+from services.openai_client import AsyncOpenAIRunner
+from services.lexical_index import BM25Index, reciprocal_rank_fusion
+from services.embedding_provider import EMBEDDING_PROVIDER, ProviderMismatch, check_index, make_provider
+from services import metrics
+from services.metrics import CHAT_REQUEST_SECONDS, CHAT_STAGE_SECONDS, CRAWL_PAGES, CRAWL_PAGES_PENDING
+from services.structured_logging import configure_logging, log_event
 BASE_URL = 'https://leads4less.io/'
 
 load_dotenv()
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging()  # queued writer thread; see services/structured_logging.py
 
 
-EMBEDDING_MODEL = "text-embedding-ada-002"
-EMBEDDINGS_FILE = "website_embeddings.json"
+EMBEDDING_MODEL = "text-embedding-ada-002"  # used when EMBEDDING_PROVIDER=openai
+EMBEDDINGS_FILE = "website_embeddings.json"  # legacy format, read only as a fallback
+EMBEDDINGS_STORE = "website_embeddings"  # binary store, see services/embedding_store.py
 MAX_CONTEXT_CHUNKS = 3
-MAX_TOKENS_PER_CHUNK = 500
+# 'hybrid' fuses BM25 and vector rankings (and skips the embedding call for strong
+# keyword matches); 'vector' is embedding search only
+RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'hybrid').lower()
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', 20))  # per ranking, before fusion
+MAX_TOKENS_PER_CHUNK = int(os.getenv('MAX_TOKENS_PER_CHUNK', 500))  # model tokens, not words
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', 50))
+# Query embedding cache: in-process LRU budget, plus an optional SQLite file shared by workers
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv('EMBEDDING_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+EMBEDDING_CACHE_DB = os.getenv('EMBEDDING_CACHE_DB')
+EMBEDDING_CACHE_DB_MAX_ROWS = int(os.getenv('EMBEDDING_CACHE_DB_MAX_ROWS', 100000))
+# Semantic cache of first-turn replies
+ANSWER_CACHE_THRESHOLD = float(os.getenv('ANSWER_CACHE_THRESHOLD', 0.97))
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', 1000))
 
 
 CHAT_MODEL = "gpt-3.5-turbo"
 
-from openai import OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-print(f"OpenAI API Key loaded: {os.getenv('OPENAI_API_KEY')}")
+# AsyncOpenAI on a per-process event loop with a pooled transport, deadlines and retries
+openai_runner = AsyncOpenAIRunner()
+# Query and document embeddings: OpenAI or a local sentence-transformers model
+embedding_provider = make_provider(EMBEDDING_PROVIDER, EMBEDDING_MODEL, openai_runner)
+def reset_client():
+    """Drop the parent's OpenAI client and local model threads in a freshly forked worker."""
+    openai_runner.reset()
+    embedding_provider.reset()
+if not os.getenv('OPENAI_API_KEY') and EMBEDDING_PROVIDER == 'openai':
+    logging.warning("OPENAI_API_KEY is not set")
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_MAX_BYTES, EMBEDDING_CACHE_DB, EMBEDDING_CACHE_DB_MAX_ROWS)
+atexit.register(embedding_cache.flush)
+answer_cache = SemanticAnswerCache(ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES)
+OPENAI_ERROR_REPLY = "Sorry, I encountered an error while contacting OpenAI."
+OPENAI_TIMEOUT_REPLY = "Sorry, OpenAI is taking too long to respond. Please try again in a moment."
 
 
-def chunk_text(text, max_tokens):
-    words = text.split()
-    chunks, current_chunk, current_length = [], [], 0
-    for word in words:
-        if current_length + len(word.split()) > max_tokens:
-            chunks.append(" ".join(current_chunk))
-            current_chunk, current_length = [], 0
-        current_chunk.append(word)
-        current_length += len(word.split())
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
-    return chunks
-def get_embedding(text):
-    """Generates an embedding for a given text."""
+def chunk_text(text, max_tokens, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """List of chunk texts; the crawler uses the streaming ``iter_chunks`` directly."""
+    return [chunk.text for chunk in iter_chunks(text, max_tokens, overlap_tokens)]
+def _chat_request(messages, **kwargs):
+    return lambda c: c.chat.completions.create(model=CHAT_MODEL, messages=messages, **kwargs)
+def _error_reply(e):
+    logging.error(f"OpenAI API call error: {e}", exc_info=not isinstance(e, openai.APITimeoutError))
+    return OPENAI_TIMEOUT_REPLY if isinstance(e, openai.APITimeoutError) else OPENAI_ERROR_REPLY
+def get_embedding(text, use_cache=True):
+    """Generates an embedding for a given text, served from the query cache when possible."""
+    if use_cache:
+        cached = embedding_cache.get(text, embedding_provider.name)
+        if cached is not None:
+            return cached
     try:
-        response = client.embeddings.create(input=[text], model=EMBEDDING_MODEL)
-        return response.data[0].embedding
+        embedding = embedding_provider.embed_query(text)
+        if use_cache:
+            return embedding_cache.put(text, embedding_provider.name, embedding)
+        return embedding
     except Exception as e:
         logging.error(f"Could not get embedding: {e}")
         return None
+def _log_completion(messages, response):
+    usage = response.usage
+    log_event("openai.chat", model=response.model, messages=len(messages),
+              prompt_tokens=usage.prompt_tokens if usage else None,
+              completion_tokens=usage.completion_tokens if usage else None,
+              finish_reason=response.choices[0].finish_reason)
 def call_openai_api(messages):
     try:
-        logging.info(f"Sending messages to OpenAI: {messages}")
-        response = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=messages,
-        temperature=0.7
-)
-
-
-        logging.info(f"OpenAI response: {response}")
-
+        with CHAT_STAGE_SECONDS.time("llm"):
+            response = openai_runner.run(_chat_request(messages, temperature=0.7))
+        _log_completion(messages, response)
+        return response.choices[0].message.content
+    except Exception as e:
+        return _error_reply(e)
+def summarize_turns(previous_summary, messages):
+    """Fold chat turns into a short running summary (used for long conversations)."""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    prompt = (
+        "Update the running summary of a conversation between a website visitor and the "
+        "site's assistant. Keep names, contact details, services and prices the visitor "
+        "asked about, and any open questions. Reply with the summary only.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{transcript}"
+    )
+    try:
+        response = openai_runner.run(_chat_request(
+            [{"role": "user", "content": prompt}], temperature=0, max_tokens=SUMMARY_MAX_TOKENS
+        ))
         return response.choices[0].message.content
     except Exception as e:
-        logging.error(f"OpenAI API call error: {e}", exc_info=True)
-        return "Sorry, I encountered an error while contacting OpenAI."
+        logging.error(f"Could not summarize chat history: {e}")
+        return previous_summary
+def stream_openai_api(messages):
+    """Yield content deltas from a streaming chat completion as they arrive."""
+    started = time.perf_counter()
+    first = True
+    # include_usage adds a final chunk (no choices) with the token counts
+    for chunk in openai_runner.iter_stream(_chat_request(messages, temperature=0.7, stream=True,
+                                                         stream_options={"include_usage": True})):
+        if chunk.choices and chunk.choices[0].delta.content:
+            if first:
+                CHAT_STAGE_SECONDS.observe(time.perf_counter() - started, "llm_first_token")
+                first = False
+            yield chunk.choices[0].delta.content
+    CHAT_STAGE_SECONDS.observe(time.perf_counter() - started, "llm")
 class ChatService:
     def __init__(self):
-        self.embeddings_data = []
+        # One index per site; the default site keeps using the files in the repo root
+        self.default_tenant = tenant_for_url(BASE_URL)
+        # Indexes rebuilt by another worker are reloaded when their store changes on disk
+        self.indexes = IndexManager(self._open_index, version=self._index_version,
+                                    on_change=lambda tenant: answer_cache.invalidate())
+        self.retrieval_counts = {"lexical_only": 0, "hybrid": 0, "vector": 0, "lexical_fallback": 0}
+        self.prompt_builder = PromptBuilder(summarize_turns)
         self.embeddings_file_path = os.path.join(os.path.dirname(__file__), '..', EMBEDDINGS_FILE)
-        # Redirect rules to live pages on leads4less.io
+        self.embeddings_store_path = os.path.join(os.path.dirname(__file__), '..', EMBEDDINGS_STORE)
+        # Redirect rules to live pages on leads4less.io (default site only)
         self.REDIRECT_RULES = [
             # Main pages
             (re.compile(r"\b(home|homepage|start|landing|landing page|main page)\b", re.I), "https://leads4less.io/"),
@@ -87,20 +166,85 @@ class ChatService:
             (re.compile(r"\b(about|about us|about page)\b", re.I), "https://leads4less.io/"),
             (re.compile(r"\b(pricing|price|pricing page)\b", re.I), "https://leads4less.io/"),
         ]
-        self._initialize_embeddings()
-    def _initialize_embeddings(self):
+        # Only redirect when the user explicitly expresses navigation intent
+        self.NAVIGATION_PATTERN = re.compile(r"\b(take\s+me\s+to|redirect\s+me\s+to|send\s+me\s+to|go\s+to|open)\b", re.I)
+        # Turns answered without OpenAI (leads4less.io only). Patterns must match the
+        # whole message; examples build the centroids for matching on meaning.
+        self.INTENTS = [
+            {
+                "name": "greeting",
+                "pattern": r"^\W*(hi|hello|hey|hiya|howdy|good\s+(morning|afternoon|evening))(\s+there)?\W*$",
+                "examples": ["hi", "hello there", "hey, how are you?", "good morning"],
+                "answer": "Hi! Welcome to https://leads4less.io/. I can help you with our SEO, Email Marketing, "
+                          "Paid Media and E-Commerce services. What would you like to know?",
+            },
+            {
+                "name": "thanks",
+                "pattern": r"^\W*(thanks|thank\s+you|thx|cheers)(\s+(so|very)\s+much)?\W*$",
+                "examples": ["thanks", "thank you so much", "thanks for the help", "great, thank you"],
+                "answer": "You're welcome! If you have any other questions about https://leads4less.io/ services, just ask.",
+            },
+            {
+                "name": "goodbye",
+                "pattern": r"^\W*(bye|goodbye|bye\s+bye|see\s+you(\s+later)?|that'?s\s+all)\W*$",
+                "examples": ["bye", "goodbye", "see you later", "that's all for now"],
+                "answer": "Thanks for chatting with https://leads4less.io/! Reach us any time at https://leads4less.io/contact.",
+            },
+            {
+                "name": "services",
+                "pattern": r"^\W*(what\s+(services|kind\s+of\s+services)\s+do\s+you\s+(have|offer|provide)"
+                           r"|what\s+do\s+you\s+(offer|do))\W*$",
+                "examples": ["what services do you have", "what do you offer", "which services do you provide",
+                             "what can Leads4Less do for me"],
+                "answer": "https://leads4less.io/ offers SEO (https://leads4less.io/seo), Email Marketing "
+                          "(https://leads4less.io/email-marketing), Paid Media (https://leads4less.io/paid-media-1) "
+                          "and E-Commerce solutions (https://leads4less.io/e-commerce). Which one can I tell you more about?",
+            },
+            {
+                "name": "contact",
+                "pattern": r"^\W*(how\s+(can|do)\s+i\s+(contact|reach)\s+you|how\s+to\s+contact\s+you)\W*$",
+                "examples": ["how can I contact you", "how do I get in touch", "how can I reach your team"],
+                "answer": "You can get in touch with the Leads4Less team through https://leads4less.io/contact.",
+            },
+        ]
+        self.router = IntentRouter(self.REDIRECT_RULES, self.NAVIGATION_PATTERN, self.INTENTS,
+                                   embed_many=lambda texts: embedding_provider.embed_documents(texts))
+    @property
+    def index(self):
+        """Embedding index of the default site."""
+        return self.indexes.get(self.default_tenant)
+    def load(self):
+        """Load the default site's index from disk. Never crawls: build it via /start-embedding.
+
+        Other tenants are loaded lazily on their first query.
+        """
         self._load_embeddings()
-        if not self.embeddings_data:
-            logging.info("No embeddings found, starting crawl and embed process.")
-            self._crawl_embed_and_save_playwright_from_url(BASE_URL)
-            self._load_embeddings() # Reload after crawling
+        if not len(self.index):
+            logging.warning("No embeddings found; POST /start-embedding to build the index.")
+
+    def _store_path(self, tenant):
+        if tenant == self.default_tenant:
+            return self.embeddings_store_path
+        return os.path.join(INDEXES_DIR, tenant, EMBEDDINGS_STORE)
+
+    def has_index(self, tenant):
+        """True for the default site and for sites crawled into their own store."""
+        return tenant == self.default_tenant or store_exists(self._store_path(tenant))
+
+    def _json_path(self, tenant):
+        """Legacy JSON file; only the default site ever had one."""
+        return self.embeddings_file_path if tenant == self.default_tenant else None
 
-    def _embeddings_file_has_data(self):
-        """Return True only if embeddings file exists AND contains a non-empty list."""
+    def _embeddings_file_has_data(self, tenant=None):
+        """Return True only if the binary store or legacy JSON file holds a non-empty index."""
+        tenant = tenant or self.default_tenant
+        if store_count(self._store_path(tenant)) > 0:
+            return True
+        json_path = self._json_path(tenant)
         try:
-            if not os.path.exists(self.embeddings_file_path):
+            if not json_path or not os.path.exists(json_path):
                 return False
-            with open(self.embeddings_file_path, 'r') as f:
+            with open(json_path, 'r') as f:
                 data = json.load(f)
             return isinstance(data, list) and len(data) > 0
         except Exception:
@@ -108,159 +252,253 @@ class ChatService:
 
     def _normalize_url(self, url: str) -> str:
         """Remove fragments and trailing slashes for URL de-duplication."""
-        parsed = urlparse(url)
-        normalized = parsed._replace(fragment="").geturl()
-        # Normalize trailing slash (except root)
-        if normalized.endswith('/') and len(normalized) > len(f"{parsed.scheme}://{parsed.netloc}/"):
-            normalized = normalized[:-1]
-        return normalized
+        return normalize_url(url)
 
-    def _crawl_embed_and_save_playwright_from_url(self, base_url):
-        if self._embeddings_file_has_data():
+    def refresh_embeddings(self, base_url=BASE_URL):
+        """Incrementally re-crawl ``base_url`` and swap in the merged index."""
+        self._crawl_embed_and_save_playwright_from_url(base_url, incremental=True)
+        self._load_embeddings(tenant_for_url(base_url))
+
+    def run_embedding_job(self, base_url, incremental, job):
+        """Entry point for background embedding jobs; reloads the index when done."""
+        self._crawl_embed_and_save_playwright_from_url(base_url, incremental=incremental, job=job)
+        if not job.cancelled:
+            self._load_embeddings(tenant_for_url(base_url))
+
+    def _crawl_embed_and_save_playwright_from_url(self, base_url, incremental=False, job=None):
+        """Crawl a site into its own tenant index (keyed by the site's host name)."""
+        tenant = tenant_for_url(base_url)
+        store_path = self._store_path(tenant)
+        os.makedirs(os.path.dirname(store_path), exist_ok=True)
+        previous = None
+        if incremental:
+            previous_hashes, chunk_hashes = load_hashes(store_path)
+            previous_index = self._read_index(tenant)
+            try:
+                check_index(previous_index, embedding_provider)
+                previous = IncrementalIndex(previous_index, previous_hashes, chunk_hashes)
+            except ProviderMismatch as e:
+                logging.warning(f"Re-embedding every chunk: {e}")
+        elif self._embeddings_file_has_data(tenant):
             logging.info("Embeddings file already has data, skipping crawl.")
+            if job is not None:
+                job.update(message="Embeddings file already has data, skipping crawl.")
             return
-        logging.info(f"Crawling for embeddings from: {base_url}")
-        all_embeddings = []
-        with sync_playwright() as p:
-            browser = p.chromium.launch()
-            page = browser.new_page()
-            # Make the crawler more resilient
-            try:
-                page.set_default_navigation_timeout(90000)
-                page.set_default_timeout(90000)
-                page.set_extra_http_headers({
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
-                })
-            except Exception:
-                pass
-            urls_to_visit, visited = {self._normalize_url(base_url)}, set()
-
-            while urls_to_visit:
-                url = urls_to_visit.pop()
-                if url in visited:
+        logging.info(f"Crawling for embeddings from: {base_url} (incremental={incremental})")
+        batcher = EmbeddingBatcher(embedding_provider)
+        reused, fetched_hashes, failed, gone = [], {}, set(), set()
+        crawler = AsyncCrawler(should_stop=(lambda: job.cancelled) if job is not None else None)
+        for page in crawler.iter_pages(base_url):
+            if job is not None:
+                job.update(
+                    pages_visited=crawler.pages_visited,
+                    pages_pending=crawler.pages_pending,
+                    chunks_embedded=batcher.chunks_embedded,
+                    errors=crawler.errors,
+                )
+            url, text = page.url, page.text
+            CRAWL_PAGES.inc(1, "fetched" if text is not None else "gone" if page.status else "failed")
+            CRAWL_PAGES_PENDING.set(crawler.pages_pending)
+            if text is None:
+                (gone if page.status else failed).add(url)
+                continue
+            fetched_hashes[url] = content_hash(text)
+            if previous is not None:
+                unchanged = previous.unchanged_page(url, fetched_hashes[url])
+                if unchanged is not None:
+                    reused.extend(unchanged)
                     continue
-                visited.add(url)
-                try:
-                    page.goto(url, wait_until="domcontentloaded", timeout=90000)
-                    # Try to accept cookie banners quickly if present
-                    try:
-                        page.locator("button:has-text('Accept')").first.click(timeout=2000)
-                    except Exception:
-                        try:
-                            page.get_by_role("button", name="Accept").click(timeout=2000)
-                        except Exception:
-                            pass
-
-                    hrefs = []
-                    try:
-                        hrefs = page.locator('a[href]').evaluate_all("els => els.map(el => el.href)")
-                    except Exception:
-                        pass
-                    if not hrefs:
-                        try:
-                            html = page.content()
-                            soup_links = BeautifulSoup(html, 'html.parser')
-                            for a in soup_links.find_all('a', href=True):
-                                hrefs.append(urljoin(url, a['href']))
-                        except Exception:
-                            hrefs = []
-                    for href in hrefs:
-                        parsed, base = urlparse(href), urlparse(base_url)
-                        if parsed.netloc == base.netloc and not parsed.fragment:
-                            urls_to_visit.add(self._normalize_url(href))
-
-                    text = ""
-                    try:
-                        text = page.evaluate("""() => {
-                            document.querySelectorAll('script, style').forEach(el => el.remove());
-                            return document.body.innerText;
-                        }""").strip()
-                    except Exception:
-                        text = ""
-
-                    if not text:
-                        try:
-                            html = page.content()
-                            soup = BeautifulSoup(html, 'html.parser')
-                            for s in soup(['script', 'style']):
-                                s.extract()
-                            text = soup.get_text(separator='\n', strip=True)
-                        except Exception:
-                            text = ""
-
-                    if not text:
-                        # Fallback to requests + BeautifulSoup if Playwright extraction failed
-                        try:
-                            resp = requests.get(url, headers={
-                                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
-                            }, timeout=20)
-                            if resp.status_code == 200 and resp.text:
-                                soup = BeautifulSoup(resp.text, 'html.parser')
-                                for s in soup(['script', 'style']):
-                                    s.extract()
-                                text = soup.get_text(separator='\n', strip=True)
-                                # Also collect links from fallback
-                                for a in soup.find_all('a', href=True):
-                                    candidate = urljoin(url, a['href'])
-                                    parsed, base = urlparse(candidate), urlparse(base_url)
-                                    if parsed.netloc == base.netloc and not parsed.fragment:
-                                        urls_to_visit.add(self._normalize_url(candidate))
-                        except Exception:
-                            text = ""
-                        
-                        if not text:
-                            continue
-
-                    for chunk in chunk_text(text, MAX_TOKENS_PER_CHUNK):
-                        emb = get_embedding(chunk)
-                        if emb:
-                            all_embeddings.append({"url": url, "chunk": chunk, "embedding": emb})
-                        time.sleep(0.5)
-                except Exception as e:
-                    logging.error(f"Crawl error: {e}")
-                time.sleep(1)
-            browser.close()
-        with open(self.embeddings_file_path, 'w') as f:
-            json.dump(all_embeddings, f, indent=2)
+            for chunk in iter_chunks(text, MAX_TOKENS_PER_CHUNK, CHUNK_OVERLAP_TOKENS):
+                record = previous.reuse_chunk(url, chunk.text) if previous is not None else None
+                if record is not None:
+                    reused.append(record)
+                else:
+                    batcher.add(url, chunk.text, chunk.tokens)
+        CRAWL_PAGES_PENDING.set(0)
+        if job is not None:
+            job.raise_if_cancelled()
+        # A site whose home page did not load would save an empty or partial index
+        start_url = normalize_url(base_url)
+        if start_url in failed or start_url in gone:
+            raise CrawlError(f"Could not load {start_url}; keeping the existing index")
+        batcher.flush()
+        logging.info(f"Embedding throughput: {batcher.stats()}")
+        if job is not None:
+            job.update(pages_visited=crawler.pages_visited, chunks_embedded=batcher.chunks_embedded,
+                       errors=crawler.errors + batcher.failed_chunks)
+        # A page is only recorded as indexed once every one of its chunks embedded;
+        # otherwise the next refresh would think its half-embedded text is up to date
+        failed_pages = batcher.failed_urls
+        if failed_pages and previous is None:
+            raise CrawlError(f"Could not embed {batcher.failed_chunks} chunks from {len(failed_pages)} pages; "
+                             f"keeping the existing index")
+        if failed_pages:
+            logging.warning(f"Keeping the previous rows of {len(failed_pages)} pages whose chunks failed to embed")
+        page_hashes = {url: h for url, h in fetched_hashes.items() if url not in failed_pages}
+        reused = [record for record in reused if record["url"] not in failed_pages]
+        records = [record for record in batcher.records if record["url"] not in failed_pages]
+        if previous is not None:
+            # Only pages the server reported removed (404/410) leave the index; pages that
+            # failed to load or embed, or were not reached this time, keep their previous rows
+            for url in previous.urls() - page_hashes.keys() - gone:
+                reused.extend(previous.page_records(url))
+                if url in previous.page_hashes:
+                    page_hashes[url] = previous.page_hashes[url]
+            logging.info(
+                f"Incremental crawl reused {previous.reused_pages} pages / {previous.reused_chunks} chunks, "
+                f"embedded {batcher.chunks_embedded} new chunks"
+            )
+        all_embeddings = reused + records
+        index = maybe_build_ann(VectorIndex.from_records(all_embeddings))
+        index.provider = embedding_provider.name
+        save_index(index, store_path, page_hashes)
         logging.info(f"Saved {len(all_embeddings)} website embeddings.")
-    def _load_embeddings(self):
+    def _load_embeddings(self, tenant=None):
+        """(Re)load a tenant's index from disk into the index manager."""
+        tenant = tenant or self.default_tenant
+        # Cached answers were grounded on the previous index
+        answer_cache.invalidate()
+        self.indexes.reload(tenant)
+    def _index_version(self, tenant):
+        return store_version(self._store_path(tenant))
+    def _open_index(self, tenant):
+        """Read a tenant's index for serving: also builds its BM25 index in hybrid mode."""
+        index = self._read_index(tenant)
+        try:
+            check_index(index, embedding_provider)
+        except ProviderMismatch as e:
+            logging.error(f"Vector search disabled for {tenant}, rebuild its index: {e}")
+        if RETRIEVAL_MODE == 'hybrid' and len(index):
+            started = time.monotonic()
+            index.lexical = BM25Index.build(meta["chunk"] for meta in index.metadata)
+            logging.info(f"Built BM25 index for {tenant}: {len(index.lexical.vocabulary)} terms "
+                         f"in {time.monotonic() - started:.2f}s")
+        return index
+    def _read_index(self, tenant):
+        store_path = self._store_path(tenant)
+        if store_exists(store_path):
+            try:
+                index = load_index(store_path)
+                logging.info(f"Loaded {len(index)} embeddings for {tenant} from binary store.")
+                return index
+            except Exception as e:
+                logging.error(f"Could not open embedding store, falling back to JSON: {e}")
+        json_path = self._json_path(tenant)
+        if json_path is None:
+            return VectorIndex.empty()
         try:
-            with open(self.embeddings_file_path, 'r') as f:
-                self.embeddings_data = json.load(f)
-            for item in self.embeddings_data:
-                item['embedding'] = np.array(item['embedding'], dtype=np.float32)
-            logging.info(f"Loaded {len(self.embeddings_data)} embeddings.")
+            with open(json_path, 'r') as f:
+                records = json.load(f)
+            index = maybe_build_ann(VectorIndex.from_records(records))
+            logging.info(f"Loaded {len(index)} embeddings.")
+            return index
         except FileNotFoundError:
             logging.warning("Embeddings file not found.")
-            self.embeddings_data = []
+            return VectorIndex.empty()
     def check_for_redirect(self, msg):
-        text = msg.strip()
-        # Only redirect when the user explicitly expresses navigation intent
-        intent_pattern = re.compile(r"\b(take\s+me\s+to|redirect\s+me\s+to|send\s+me\s+to|go\s+to|open)\b", re.IGNORECASE)
-        if not intent_pattern.search(text):
+        return self.router.redirect(msg)
+    def _route(self, user_message, tenant):
+        """Answer locally if possible: return (route, query embedding, similar chunks).
+
+        For the default site, patterns are tried first (no network); otherwise the
+        query is embedded and compared with the intent centroids before retrieval.
+        """
+        with CHAT_STAGE_SECONDS.time("redirect_check"):
+            route = self._match_patterns(user_message, tenant)
+        if route is not None:
+            return route, None, []
+        with CHAT_STAGE_SECONDS.time("lexical_probe"):
+            similar = self._lexical_only(user_message, tenant)
+        if similar is not None:
+            return None, None, similar
+        with CHAT_STAGE_SECONDS.time("embedding"):
+            q_emb = get_embedding(user_message)
+        with CHAT_STAGE_SECONDS.time("retrieval"):
+            return self._route_embedding(q_emb, tenant, user_message)
+    def _match_patterns(self, user_message, tenant):
+        # Redirects and canned answers point at leads4less.io pages
+        if tenant != self.default_tenant:
+            return None
+        return self.router.match(user_message)
+    def _route_embedding(self, q_emb, tenant, user_message=None):
+        if tenant == self.default_tenant:
+            route = self.router.match_embedding(q_emb)
+            if route is not None:
+                return route, q_emb, []
+        return None, q_emb, self.find_similar_chunks(q_emb, tenant, user_message)
+    def _lexical_only(self, user_message, tenant):
+        """Chunks for a strong keyword match (no embedding call needed), else None."""
+        index = self.indexes.get(tenant)
+        if index.lexical is None:
             return None
+        rows = index.lexical.strong_match(user_message, MAX_CONTEXT_CHUNKS)
+        if rows is None:
+            return None
+        self.retrieval_counts["lexical_only"] += 1
+        return [index.metadata[int(i)] for i in rows]
+    def _local_reply(self, user_message, chat_history, route):
+        log_event("chat.local_reply", kind=route.kind, name=route.name, score=round(route.score, 3))
+        if route.kind == "redirect":
+            return {"type": "redirect", "url": route.value}
+        chat_history = (chat_history or []) + [
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": route.value},
+        ]
+        return {"type": "text", "message": route.value, "chat_history": chat_history}
+    def find_similar_chunks(self, query_emb, tenant=None, query_text=None):
+        """Top chunks by vector similarity, fused with BM25 when ``query_text`` is given.
 
-        for pattern, url in self.REDIRECT_RULES:
-            if pattern.search(text):
-                return url
-        return None
-    def find_similar_chunks(self, query_emb):
-        if not self.embeddings_data or query_emb is None:
+        If the embedding is missing (e.g. the embeddings API is down) BM25 alone is used.
+        """
+        index = self.indexes.get(tenant or self.default_tenant)
+        if not len(index):
             return []
-        dists = [np.linalg.norm(query_emb - item['embedding']) for item in self.embeddings_data]
-        idxs = np.argsort(dists)[:MAX_CONTEXT_CHUNKS]
-        return [self.embeddings_data[i] for i in idxs]
-    def get_chatbot_response(self, user_message, chat_history=None):
-        if redirect := self.check_for_redirect(user_message):
-            return {"type": "redirect", "url": redirect}
-        if chat_history is None:
-            chat_history = []
-        # Append the new user message to the provided chat history
-        chat_history = chat_history + [{"role": "user", "content": user_message}]
-        q_emb = get_embedding(user_message)
-        similar = self.find_similar_chunks(q_emb)
-        context = "\n\n---\n\n".join([c['chunk'] for c in similar]) if similar else ""
-        system_prompt = (
+        lexical = index.lexical is not None and bool(query_text)
+        rankings = []
+        if query_emb is not None and self._searchable(index):
+            k = HYBRID_CANDIDATES if lexical else MAX_CONTEXT_CHUNKS
+            rankings.append([i for i, _ in index.search_rows([query_emb], k)[0]])
+        if lexical:
+            rankings.append(index.lexical.search(query_text, HYBRID_CANDIDATES)[0])
+        if not rankings:
+            return []
+        if len(rankings) == 1:
+            self.retrieval_counts["vector" if query_emb is not None else "lexical_fallback"] += 1
+            rows = rankings[0][:MAX_CONTEXT_CHUNKS]
+        else:
+            self.retrieval_counts["hybrid"] += 1
+            rows = reciprocal_rank_fusion(rankings, MAX_CONTEXT_CHUNKS)
+        return [index.metadata[int(i)] for i in rows]
+    def _searchable(self, index):
+        """True if ``index`` was built by the current embedding provider."""
+        try:
+            check_index(index, embedding_provider)
+            return True
+        except ProviderMismatch:
+            return False
+    def search_many(self, query_embs, tenant=None):
+        """Batched find_similar_chunks; entries that are None get an empty result."""
+        index = self.indexes.get(tenant or self.default_tenant)
+        present = [i for i, q in enumerate(query_embs) if q is not None]
+        results = [[] for _ in query_embs]
+        if not present or not len(index) or not self._searchable(index):
+            return results
+        hits = index.search_many([query_embs[i] for i in present], MAX_CONTEXT_CHUNKS)
+        for i, row in zip(present, hits):
+            results[i] = [meta for meta, _ in row]
+        return results
+    def _system_prompt(self, tenant):
+        """The leads4less.io prompt for the default site, a generic one for other sites."""
+        if tenant != self.default_tenant:
+            return (
+                f"You are a helpful AI assistant for the website https://{tenant}/. "
+                f"Answer visitors' questions about https://{tenant}/ using the website context provided. "
+                "If the context does not cover a question, say so and suggest contacting the site's team "
+                "instead of guessing. If users ask about unrelated topics, politely steer them back to "
+                "what the website offers. "
+                "You have access to the full ongoing chat history. When responding, always consider and reference previous messages if they are relevant to the user's current question."
+            )
+        return (
                 "You are a helpful AI assistant specifically for the website https://leads4less.io/. "
                 "Your primary role is to guide users about Leads4Less's digital marketing services including SEO, Email Marketing, Paid Media, and E-Commerce solutions. "
                 "IMPORTANT: Always reference the website https://leads4less.io/ in your responses to remind users they're chatting with a Leads4Less assistant. "
@@ -269,18 +507,114 @@ class ChatService:
                 "Always keep responses focused on Leads4Less services and offerings. "
                 "You have access to the full ongoing chat history. When responding, always consider and reference previous messages if they are relevant to the user's current question."
         )
-        if context:
-            system_prompt += f"\nWebsite Context:\n{context}"
-        messages = [{"role": "system", "content": system_prompt}] + chat_history
+    def _build_messages(self, user_message, chat_history, similar, tenant=None):
+        """Return (chat_history including the new user turn, messages to send to OpenAI)."""
+        if chat_history is None:
+            chat_history = []
+        # Append the new user message to the provided chat history
+        chat_history = chat_history + [{"role": "user", "content": user_message}]
+        system_prompt = self._system_prompt(tenant or self.default_tenant)
+        # Fit context and history into the token budget; old turns are summarized
+        with CHAT_STAGE_SECONDS.time("prompt_build"):
+            messages, token_stats = self.prompt_builder.build(system_prompt, similar, chat_history)
+        log_event("chat.prompt", **token_stats)
+        return chat_history, messages
+    def get_chatbot_response(self, user_message, chat_history=None, tenant=None):
+        started = time.perf_counter()
+        tenant = tenant or self.default_tenant
+        route, q_emb, similar = self._route(user_message, tenant)
+        if route is not None:
+            CHAT_REQUEST_SECONDS.observe(time.perf_counter() - started, "local")
+            return self._local_reply(user_message, chat_history, route)
+        # Only first-turn questions are answered from the semantic cache
+        first_turn = not chat_history
+        key = (tenant,) + context_key(similar)
+        with CHAT_STAGE_SECONDS.time("answer_cache"):
+            reply = answer_cache.get(q_emb, key) if first_turn else None
+        answered_by = "cache" if reply is not None else "openai"
+        chat_history, messages = self._build_messages(user_message, chat_history, similar, tenant)
 
-        reply = call_openai_api(messages)
+        if reply is None:
+            reply = call_openai_api(messages)
+            if reply in (OPENAI_ERROR_REPLY, OPENAI_TIMEOUT_REPLY):
+                answered_by = "error"
+            elif first_turn:
+                answer_cache.put(q_emb, key, reply)
 
         
         chat_history = chat_history + [{"role": "assistant", "content": reply}]
+        CHAT_REQUEST_SECONDS.observe(time.perf_counter() - started, answered_by)
         return {"type": "text", "message": reply, "chat_history": chat_history}
+    def stream_chatbot_response(self, user_message, chat_history=None, tenant=None):
+        """Generator of (event, data) pairs: "token" deltas, then one terminal
+        "redirect", "done" (full reply and chat_history) or "error" event."""
+        started = time.perf_counter()
+        tenant = tenant or self.default_tenant
+        route, q_emb, similar = self._route(user_message, tenant)
+        if route is not None:
+            CHAT_REQUEST_SECONDS.observe(time.perf_counter() - started, "local")
+            response = self._local_reply(user_message, chat_history, route)
+            if response["type"] == "redirect":
+                yield "redirect", response
+            else:
+                yield "token", {"content": response["message"]}
+                yield "done", response
+            return
+        first_turn = not chat_history
+        key = (tenant,) + context_key(similar)
+        with CHAT_STAGE_SECONDS.time("answer_cache"):
+            cached = answer_cache.get(q_emb, key) if first_turn else None
+        chat_history, messages = self._build_messages(user_message, chat_history, similar, tenant)
+        parts = []
+        try:
+            deltas = [cached] if cached is not None else stream_openai_api(messages)
+            for delta in deltas:
+                parts.append(delta)
+                yield "token", {"content": delta}
+        except Exception as e:
+            CHAT_REQUEST_SECONDS.observe(time.perf_counter() - started, "error")
+            yield "error", {"type": "error", "message": _error_reply(e)}
+            return
+        reply = "".join(parts)
+        if first_turn and cached is None:
+            answer_cache.put(q_emb, key, reply)
+        chat_history = chat_history + [{"role": "assistant", "content": reply}]
+        CHAT_REQUEST_SECONDS.observe(time.perf_counter() - started, "cache" if cached is not None else "openai")
+        yield "done", {"type": "text", "message": reply, "chat_history": chat_history}
     def clear_history(self):
         pass 
 
+# Cheap to construct: the index is loaded by chat_service.load() (in the gunicorn
+# master when preloading, see gunicorn.conf.py) or lazily on the first query.
 chat_service = ChatService()
-def get_chatbot_response(user_message, chat_history=None):
-    return chat_service.get_chatbot_response(user_message, chat_history)
+@metrics.registry.collector
+def _collect_metrics():
+    """Copy the counts kept by the caches, retrieval and the OpenAI runner into /metrics."""
+    for path, count in chat_service.retrieval_counts.items():
+        metrics.RETRIEVALS.set_total(count, path)
+    for cache, result, count in (
+        ("embedding", "hit", embedding_cache.hits),
+        ("embedding", "disk_hit", embedding_cache.disk_hits),
+        ("embedding", "miss", embedding_cache.misses),
+        ("answer", "hit", answer_cache.hits),
+        ("answer", "miss", answer_cache.misses),
+    ):
+        metrics.CACHE_LOOKUPS.set_total(count, cache, result)
+    metrics.OPENAI_REQUESTS.set_total(openai_runner.calls)
+    metrics.OPENAI_RETRIES.set_total(openai_runner.retries)
+    metrics.OPENAI_IN_FLIGHT.set_total(openai_runner.in_flight)
+def post_fork():
+    """Per-worker re-initialisation after forking from a preloaded master.
+
+    The index itself is inherited (shared via mmap or copy-on-write); only
+    objects owning sockets or SQLite handles are rebuilt.
+    """
+    reset_client()
+    embedding_cache.reopen()
+    metrics.registry.reset()
+    # One batched embedding call per worker, off the request path
+    chat_service.router.warm()
+def get_chatbot_response(user_message, chat_history=None, tenant=None):
+    return chat_service.get_chatbot_response(user_message, chat_history, tenant)
+def stream_chatbot_response(user_message, chat_history=None, tenant=None):
+    return chat_service.stream_chatbot_response(user_message, chat_history, tenant)
@@ -0,0 +1,87 @@
+"""Token-aware chunking of crawled page text.
+
+Text is walked lazily as lines and sentences, so chunks are produced one at a
+time instead of materialising every word of the page. Chunk sizes are measured
+in the embedding model's own tokens, chunks prefer to break at headings and
+sentence ends, and consecutive chunks share up to ``overlap_tokens`` of trailing
+sentences so an answer split across a boundary is still retrievable.
+"""
+import re
+from collections import deque, namedtuple
+
+from services.tokens import count_tokens
+
+# ``tokens`` is the exact token count of ``text``, stored in the index metadata
+Chunk = namedtuple('Chunk', ['text', 'tokens'])
+
+_LINES = re.compile(r"[^\n]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORDS = re.compile(r"\S+")
+
+
+def _is_heading(line):
+    """Short line without closing punctuation, e.g. a section title."""
+    return len(line) <= 80 and len(line.split()) <= 10 and not line.endswith(('.', '!', '?', ',', ':', ';'))
+
+
+def _segments(text):
+    """Yield (segment, separator, is_heading) in reading order."""
+    for match in _LINES.finditer(text):
+        line = match.group().strip()
+        if not line:
+            continue
+        if _is_heading(line):
+            yield line, "\n", True
+            continue
+        sentences = _SENTENCE_END.split(line)
+        for i, sentence in enumerate(sentences):
+            yield sentence, " " if i else "\n", False
+
+
+def _split_oversized(segment, max_tokens):
+    """Break a single segment longer than ``max_tokens`` at word boundaries."""
+    piece, piece_tokens = [], 0
+    for word in _WORDS.findall(segment):
+        tokens = count_tokens(" " + word)
+        if piece and piece_tokens + tokens > max_tokens:
+            yield " ".join(piece), piece_tokens
+            piece, piece_tokens = [], 0
+        piece.append(word)
+        piece_tokens += tokens
+    if piece:
+        yield " ".join(piece), piece_tokens
+
+
+def iter_chunks(text, max_tokens, overlap_tokens=0):
+    """Yield Chunk(text, tokens) of at most ~``max_tokens`` tokens each."""
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    current, current_tokens = deque(), 0  # (segment, separator, tokens)
+    emitted_upto = 0  # segments in ``current`` that were already part of an emitted chunk
+
+    def emit():
+        body = "".join(sep + seg for seg, sep, _ in current).strip()
+        return Chunk(body, count_tokens(body))
+
+    for segment, separator, is_heading in _segments(text):
+        seg_tokens = count_tokens(segment)
+        pieces = [(segment, seg_tokens)] if seg_tokens <= max_tokens else _split_oversized(segment, max_tokens)
+        for piece, piece_tokens in pieces:
+            full = current_tokens + piece_tokens > max_tokens
+            # Start a new chunk at a heading once the current one is reasonably full
+            at_heading = is_heading and current_tokens >= max_tokens // 2
+            if current and len(current) > emitted_upto and (full or at_heading):
+                yield emit()
+                # Carry trailing segments over as overlap (never across a heading break)
+                kept, kept_tokens = deque(), 0
+                if overlap_tokens and not at_heading:
+                    for item in reversed(current):
+                        if kept_tokens + item[2] > overlap_tokens or kept_tokens + item[2] + piece_tokens > max_tokens:
+                            break
+                        kept.appendleft(item)
+                        kept_tokens += item[2]
+                current, current_tokens, emitted_upto = kept, kept_tokens, len(kept)
+            current.append((piece, separator, piece_tokens))
+            current_tokens += piece_tokens
+            separator = " "
+    if current and len(current) > emitted_upto:
+        yield emit()
@@ -0,0 +1,239 @@
+"""Server-side chat histories for ``/chat`` requests that send a ``conversation_id``.
+
+Clients send only the new message and receive only the new reply; the turns
+live here. Every backend appends just the new messages and refreshes a sliding
+TTL, so the cost of a turn does not grow with the length of the conversation
+(reading the history for the prompt aside).
+
+* ``memory`` (default): per-process dict with TTL and LRU eviction. Only
+  correct with a single gunicorn worker.
+* ``sqlite``: a file shared by all workers on the host (``CONVERSATION_DB``).
+* ``redis``: any Redis-compatible server (``CONVERSATION_REDIS_URL``); one list
+  per conversation.
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+CONVERSATION_STORE = os.getenv('CONVERSATION_STORE', 'memory').lower()  # 'memory', 'sqlite' or 'redis'
+CONVERSATION_DB = os.getenv('CONVERSATION_DB') or os.path.join(os.path.dirname(__file__), '..', 'conversations.db')
+CONVERSATION_REDIS_URL = os.getenv('CONVERSATION_REDIS_URL', 'redis://localhost:6379/0')
+CONVERSATION_TTL = int(os.getenv('CONVERSATION_TTL', 24 * 3600))  # seconds since the last turn
+CONVERSATION_MAX_MESSAGES = int(os.getenv('CONVERSATION_MAX_MESSAGES', 200))  # oldest are dropped
+CONVERSATION_MAX_ENTRIES = int(os.getenv('CONVERSATION_MAX_ENTRIES', 10000))  # memory backend only
+
+_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def new_conversation_id():
+    return uuid.uuid4().hex
+
+
+def valid_conversation_id(conversation_id):
+    return isinstance(conversation_id, str) and bool(_ID.match(conversation_id))
+
+
+class MemoryConversationStore:
+    def __init__(self, ttl=CONVERSATION_TTL, max_messages=CONVERSATION_MAX_MESSAGES,
+                 max_entries=CONVERSATION_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # id -> (messages, expires_at)
+        self._lock = threading.Lock()
+
+    def create(self):
+        conversation_id = new_conversation_id()
+        with self._lock:
+            self._entries[conversation_id] = ([], time.monotonic() + self.ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return conversation_id
+
+    def get(self, conversation_id):
+        """Messages of a conversation, or None if unknown or expired."""
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._entries[conversation_id]
+                return None
+            return list(entry[0])
+
+    def append(self, conversation_id, messages):
+        with self._lock:
+            history = self._entries.pop(conversation_id, ([], 0))[0]
+            history.extend(messages)
+            del history[:-self.max_messages]
+            self._entries[conversation_id] = (history, time.monotonic() + self.ttl)
+
+    def delete(self, conversation_id):
+        with self._lock:
+            return self._entries.pop(conversation_id, None) is not None
+
+    def reopen(self):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "conversations": len(self._entries), "ttl": self.ttl}
+
+
+class SQLiteConversationStore:
+    PURGE_EVERY = 500  # appends between sweeps of expired conversations
+
+    def __init__(self, db_path=CONVERSATION_DB, ttl=CONVERSATION_TTL, max_messages=CONVERSATION_MAX_MESSAGES):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self._appends = 0
+        self._connect()
+
+    def reopen(self):
+        """Open a fresh connection, e.g. in a forked worker."""
+        self._connect()
+
+    def _connect(self):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS conversations (id TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS conversation_messages ("
+            "conversation_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+            "PRIMARY KEY (conversation_id, seq))"
+        )
+
+    def create(self):
+        conversation_id = new_conversation_id()
+        with self._lock:
+            self._db.execute("INSERT INTO conversations (id, expires_at) VALUES (?, ?)",
+                             (conversation_id, time.time() + self.ttl))
+        return conversation_id
+
+    def get(self, conversation_id):
+        with self._lock:
+            row = self._db.execute("SELECT expires_at FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+            if row is None or row[0] < time.time():
+                return None
+            rows = self._db.execute(
+                "SELECT role, content FROM conversation_messages WHERE conversation_id = ? ORDER BY seq",
+                (conversation_id,),
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def append(self, conversation_id, messages):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                last = self._db.execute(
+                    "SELECT MAX(seq) FROM conversation_messages WHERE conversation_id = ?", (conversation_id,)
+                ).fetchone()[0]
+                start = 0 if last is None else last + 1
+                self._db.executemany(
+                    "INSERT INTO conversation_messages (conversation_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                    [(conversation_id, start + i, m["role"], m["content"]) for i, m in enumerate(messages)],
+                )
+                self._db.execute(
+                    "DELETE FROM conversation_messages WHERE conversation_id = ? AND seq < ?",
+                    (conversation_id, start + len(messages) - self.max_messages),
+                )
+                self._db.execute("INSERT OR REPLACE INTO conversations (id, expires_at) VALUES (?, ?)",
+                                 (conversation_id, time.time() + self.ttl))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._appends += 1
+            if self._appends % self.PURGE_EVERY == 0:
+                self._purge_expired()
+
+    def _purge_expired(self):
+        try:
+            now = time.time()
+            self._db.execute(
+                "DELETE FROM conversation_messages WHERE conversation_id IN "
+                "(SELECT id FROM conversations WHERE expires_at < ?)", (now,)
+            )
+            self._db.execute("DELETE FROM conversations WHERE expires_at < ?", (now,))
+        except sqlite3.Error as e:
+            logging.error(f"Could not purge expired conversations: {e}")
+
+    def delete(self, conversation_id):
+        with self._lock:
+            self._db.execute("DELETE FROM conversation_messages WHERE conversation_id = ?", (conversation_id,))
+            return self._db.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,)).rowcount > 0
+
+    def stats(self):
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM conversations WHERE expires_at >= ?",
+                                     (time.time(),)).fetchone()[0]
+        return {"backend": "sqlite", "conversations": count, "ttl": self.ttl}
+
+
+class RedisConversationStore:
+    """One list of JSON messages per conversation, trimmed and expired on every append."""
+    PREFIX = "conversation:"
+
+    def __init__(self, url=CONVERSATION_REDIS_URL, ttl=CONVERSATION_TTL, max_messages=CONVERSATION_MAX_MESSAGES):
+        import redis  # optional: only needed for this backend
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self._redis = redis.Redis.from_url(url)  # the connection pool is fork-aware
+
+    def _key(self, conversation_id):
+        return f"{self.PREFIX}{conversation_id}"
+
+    def create(self):
+        conversation_id = new_conversation_id()
+        # An empty list does not exist in Redis, so a new conversation starts with a marker
+        self._redis.set(f"{self._key(conversation_id)}:created", 1, ex=self.ttl)
+        return conversation_id
+
+    def get(self, conversation_id):
+        key = self._key(conversation_id)
+        pipe = self._redis.pipeline()
+        pipe.lrange(key, 0, -1)
+        pipe.exists(f"{key}:created")
+        messages, created = pipe.execute()
+        if not messages and not created:
+            return None
+        return [json.loads(m) for m in messages]
+
+    def append(self, conversation_id, messages):
+        key = self._key(conversation_id)
+        pipe = self._redis.pipeline()
+        pipe.rpush(key, *[json.dumps(m) for m in messages])
+        pipe.ltrim(key, -self.max_messages, -1)
+        pipe.expire(key, self.ttl)
+        pipe.expire(f"{key}:created", self.ttl)
+        pipe.execute()
+
+    def delete(self, conversation_id):
+        key = self._key(conversation_id)
+        return self._redis.delete(key, f"{key}:created") > 0
+
+    def reopen(self):
+        pass
+
+    def stats(self):
+        return {"backend": "redis", "ttl": self.ttl}
+
+
+def make_store(backend=CONVERSATION_STORE):
+    if backend == 'memory':
+        return MemoryConversationStore()
+    if backend == 'sqlite':
+        return SQLiteConversationStore()
+    if backend == 'redis':
+        return RedisConversationStore()
+    raise ValueError(f"Unknown CONVERSATION_STORE: {backend}")
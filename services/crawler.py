@@ -0,0 +1,251 @@
+"""Concurrent same-site crawler built on async Playwright.
+
+A pool of browser contexts (one page each) pulls URLs from a shared frontier.
+Per-host semaphores cap how many fetches hit one host at once, and each slot
+waits ``delay`` seconds after its fetch before taking the next URL, so the
+politeness delay overlaps with fetches running in the other slots.
+
+Page handling mirrors the original sequential crawler: Playwright text first,
+then the rendered HTML, then a plain ``requests`` fetch as the last fallback.
+
+A crawl that cannot run at all (e.g. the browser fails to launch) raises
+``CrawlError`` from ``iter_pages`` once the pages it did fetch are consumed, so
+callers can tell a failed crawl from an empty site.
+"""
+import asyncio
+import logging
+import os
+import queue
+import threading
+from collections import namedtuple
+from urllib.parse import urlparse, urljoin
+
+import requests
+from bs4 import BeautifulSoup
+from playwright.async_api import async_playwright
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
+CRAWL_CONCURRENCY = int(os.getenv('CRAWL_CONCURRENCY', 4))
+CRAWL_PER_HOST_LIMIT = int(os.getenv('CRAWL_PER_HOST_LIMIT', 4))
+CRAWL_DELAY = float(os.getenv('CRAWL_DELAY', 1.0))
+CRAWL_TIMEOUT_MS = int(os.getenv('CRAWL_TIMEOUT_MS', 90000))
+
+# Responses that mean a page was removed (as opposed to failing to load)
+GONE_STATUSES = (404, 410)
+
+# ``text`` is None when the page could not be loaded; ``error`` then holds the reason
+# and ``status`` the HTTP status if the server answered
+CrawledPage = namedtuple('CrawledPage', ['url', 'text', 'error', 'status'], defaults=(None,))
+
+_DONE = object()
+
+
+def normalize_url(url):
+    """Remove fragments and trailing slashes for URL de-duplication."""
+    parsed = urlparse(url)
+    normalized = parsed._replace(fragment="").geturl()
+    # Normalize trailing slash (except root)
+    if normalized.endswith('/') and len(normalized) > len(f"{parsed.scheme}://{parsed.netloc}/"):
+        normalized = normalized[:-1]
+    return normalized
+
+
+def _same_site_links(hrefs, base_netloc):
+    links = set()
+    for href in hrefs:
+        parsed = urlparse(href)
+        if parsed.netloc == base_netloc and not parsed.fragment:
+            links.add(normalize_url(href))
+    return links
+
+
+def _soup_text(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    for s in soup(['script', 'style']):
+        s.extract()
+    return soup, soup.get_text(separator='\n', strip=True)
+
+
+def _fetch_with_requests(url, base_netloc):
+    """Fallback when Playwright yields no text: plain GET, returns (text, links)."""
+    try:
+        resp = requests.get(url, headers={"User-Agent": USER_AGENT}, timeout=20)
+        if resp.status_code == 200 and resp.text:
+            soup, text = _soup_text(resp.text)
+            hrefs = [urljoin(url, a['href']) for a in soup.find_all('a', href=True)]
+            return text, _same_site_links(hrefs, base_netloc)
+    except Exception:
+        pass
+    return "", set()
+
+
+class CrawlError(Exception):
+    pass
+
+
+class PageGone(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class AsyncCrawler:
+    def __init__(self, concurrency=CRAWL_CONCURRENCY, per_host_limit=CRAWL_PER_HOST_LIMIT,
+                 delay=CRAWL_DELAY, timeout_ms=CRAWL_TIMEOUT_MS, should_stop=None):
+        """``should_stop`` is polled before each fetch; once it returns True the frontier is drained."""
+        self.concurrency = max(1, concurrency)
+        self.per_host_limit = max(1, per_host_limit)
+        self.delay = delay
+        self.timeout_ms = timeout_ms
+        self.should_stop = should_stop
+        self._stop = threading.Event()
+        self._host_slots = {}
+        self.pages_visited = 0
+        self.pages_pending = 0
+        self.errors = 0
+        self.failed = None  # the exception that aborted the crawl, if any
+
+    def _stopping(self):
+        return self._stop.is_set() or (self.should_stop is not None and self.should_stop())
+
+    def iter_pages(self, base_url):
+        """Crawl ``base_url`` on a background event loop, yielding CrawledPage as they finish.
+
+        Pages with no extractable text are skipped, exactly like the sequential crawler.
+        Raises CrawlError if the crawl itself failed. Stopping early (``break`` or an
+        exception in the caller) stops the crawl too.
+        """
+        results = queue.Queue()
+
+        def run():
+            try:
+                asyncio.run(self.crawl(base_url, results.put))
+            except Exception as e:
+                logging.error(f"Crawler stopped: {e}")
+                self.failed = e
+            finally:
+                results.put(_DONE)
+
+        self._stop.clear()
+        thread = threading.Thread(target=run, name="crawler", daemon=True)
+        thread.start()
+        try:
+            while (page := results.get()) is not _DONE:
+                yield page
+        finally:
+            self._stop.set()
+        thread.join()
+        if self.failed is not None:
+            raise CrawlError(f"Crawl of {base_url} failed: {self.failed}") from self.failed
+
+    async def crawl(self, base_url, emit):
+        base_url = normalize_url(base_url)
+        base_netloc = urlparse(base_url).netloc
+        frontier, seen = asyncio.Queue(), {base_url}
+        frontier.put_nowait(base_url)
+
+        async with async_playwright() as p:
+            browser = await p.chromium.launch()
+            pool = asyncio.Queue()
+            for _ in range(self.concurrency):
+                context = await browser.new_context(user_agent=USER_AGENT)
+                page = await context.new_page()
+                page.set_default_navigation_timeout(self.timeout_ms)
+                page.set_default_timeout(self.timeout_ms)
+                pool.put_nowait(page)
+
+            async def worker():
+                while True:
+                    url = await frontier.get()
+                    try:
+                        if self._stopping():
+                            continue
+                        links = await self._process(url, base_netloc, pool, emit)
+                        for link in links - seen:
+                            seen.add(link)
+                            frontier.put_nowait(link)
+                    finally:
+                        self.pages_pending = frontier.qsize()
+                        frontier.task_done()
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            try:
+                await frontier.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                await browser.close()
+        logging.info(f"Crawl finished: {self.pages_visited} pages visited, {self.errors} errors")
+
+    async def _process(self, url, base_netloc, pool, emit):
+        host = urlparse(url).netloc
+        slots = self._host_slots.setdefault(host, asyncio.Semaphore(self.per_host_limit))
+        async with slots:
+            page = await pool.get()
+            try:
+                text, links = await self._visit(page, url, base_netloc)
+                self.pages_visited += 1
+                if text:
+                    emit(CrawledPage(url, text, None))
+            except PageGone as e:
+                self.pages_visited += 1
+                emit(CrawledPage(url, None, str(e), e.status))
+                links = set()
+            except Exception as e:
+                logging.error(f"Crawl error: {e}")
+                self.errors += 1
+                emit(CrawledPage(url, None, str(e)))
+                links = set()
+            finally:
+                pool.put_nowait(page)
+            # Hold the host slot for the politeness delay; other slots keep fetching
+            await asyncio.sleep(self.delay)
+        return links
+
+    async def _visit(self, page, url, base_netloc):
+        response = await page.goto(url, wait_until="domcontentloaded", timeout=self.timeout_ms)
+        if response is not None and response.status in GONE_STATUSES:
+            raise PageGone(response.status)
+        # Try to accept cookie banners quickly if present
+        try:
+            await page.locator("button:has-text('Accept')").first.click(timeout=2000)
+        except Exception:
+            try:
+                await page.get_by_role("button", name="Accept").click(timeout=2000)
+            except Exception:
+                pass
+
+        hrefs = []
+        try:
+            hrefs = await page.locator('a[href]').evaluate_all("els => els.map(el => el.href)")
+        except Exception:
+            pass
+        if not hrefs:
+            try:
+                soup_links = BeautifulSoup(await page.content(), 'html.parser')
+                hrefs = [urljoin(url, a['href']) for a in soup_links.find_all('a', href=True)]
+            except Exception:
+                hrefs = []
+        links = _same_site_links(hrefs, base_netloc)
+
+        text = ""
+        try:
+            text = (await page.evaluate("""() => {
+                document.querySelectorAll('script, style').forEach(el => el.remove());
+                return document.body.innerText;
+            }""")).strip()
+        except Exception:
+            text = ""
+
+        if not text:
+            try:
+                _, text = _soup_text(await page.content())
+            except Exception:
+                text = ""
+
+        if not text:
+            # Fallback to requests + BeautifulSoup if Playwright extraction failed
+            text, extra_links = await asyncio.to_thread(_fetch_with_requests, url, base_netloc)
+            links |= extra_links
+        return text, links
@@ -0,0 +1,100 @@
+"""Packs crawled chunks into multi-input embedding requests.
+
+Chunks are buffered until either the item or the (estimated) token limit of a
+request is reached, then sent to the embedding provider in one call. Rate limits
+and transient server errors are retried, honouring ``Retry-After`` when the API
+sends it and otherwise backing off exponentially with jitter.
+"""
+import logging
+import time
+
+from services.metrics import CRAWL_CHUNKS
+from services.openai_client import backoff_delay, is_retryable
+
+MAX_BATCH_ITEMS = 256
+MAX_BATCH_TOKENS = 100_000
+MAX_RETRIES = 6
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return max(1, len(text) // 4)
+
+
+class EmbeddingBatcher:
+    def __init__(self, provider, max_items=MAX_BATCH_ITEMS, max_tokens=MAX_BATCH_TOKENS,
+                 max_retries=MAX_RETRIES, sleep=time.sleep):
+        """``provider`` is an ``embedding_provider`` backend (``embed_documents``)."""
+        self.provider = provider
+        self.max_items = max_items
+        self.max_tokens = max_tokens
+        self.max_retries = max_retries
+        self._sleep = sleep
+        self._pending = []
+        self._pending_tokens = 0
+        self.records = []
+        self.chunks_embedded = 0
+        self.tokens_embedded = 0
+        self.requests = 0
+        self.retries = 0
+        self.failed_chunks = 0
+        self.failed_urls = set()
+        self._started = time.monotonic()
+
+    def add(self, url, chunk, tokens=None):
+        """Queue a chunk; sends a request as soon as the batch is full.
+
+        ``tokens`` is the chunk's exact token count when the caller already knows it.
+        """
+        counted = tokens
+        tokens = tokens or estimate_tokens(chunk)
+        if self._pending and (len(self._pending) >= self.max_items
+                              or self._pending_tokens + tokens > self.max_tokens):
+            self.flush()
+        self._pending.append((url, chunk, counted))
+        self._pending_tokens += tokens
+
+    def flush(self):
+        if not self._pending:
+            return
+        batch, batch_tokens = self._pending, self._pending_tokens
+        self._pending, self._pending_tokens = [], 0
+        vectors = self._create([chunk for _, chunk, _ in batch])
+        if vectors is None:
+            self.failed_chunks += len(batch)
+            self.failed_urls.update(url for url, _, _ in batch)
+            return
+        for (url, chunk, tokens), embedding in zip(batch, vectors):
+            self.records.append({"url": url, "chunk": chunk, "tokens": tokens, "embedding": embedding})
+        self.chunks_embedded += len(batch)
+        CRAWL_CHUNKS.inc(len(batch))
+        self.tokens_embedded += batch_tokens
+
+    def _create(self, inputs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.requests += 1
+                return self.provider.embed_documents(inputs)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    logging.error(f"Embedding batch of {len(inputs)} chunks failed: {e}")
+                    return None
+                wait = backoff_delay(attempt, e, BASE_BACKOFF, MAX_BACKOFF)
+                self.retries += 1
+                logging.warning(f"Embedding request throttled ({e.__class__.__name__}), retrying in {wait:.1f}s")
+                self._sleep(wait)
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        return {
+            "chunks": self.chunks_embedded,
+            "tokens": self.tokens_embedded,
+            "requests": self.requests,
+            "retries": self.retries,
+            "failed_chunks": self.failed_chunks,
+            "seconds": round(elapsed, 2),
+            "chunks_per_sec": round(self.chunks_embedded / elapsed, 2),
+            "tokens_per_sec": round(self.tokens_embedded / elapsed, 2),
+        }
@@ -0,0 +1,210 @@
+"""Two-tier cache for query embeddings.
+
+Tier 1 is an in-process LRU bounded by the bytes held in vectors. Tier 2 is an
+optional SQLite file shared by every worker on the host, written in batches and
+capped at ``max_rows`` (least recently used rows are deleted first). Keys are a
+hash of the embedding model plus the normalized query text, so switching models
+never returns stale vectors.
+"""
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Case- and whitespace-insensitive form of a query used for cache keys."""
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def cache_key(text, model):
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, max_bytes, db_path=None, max_rows=100000, batch_size=32, flush_interval=5.0):
+        self.max_bytes = max_bytes
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # SQLite is only touched outside ``_lock``: one connection per thread, and
+        # writes buffered in ``_pending`` until a batch is committed by ``flush``.
+        self._local = threading.local()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._persistent = False
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.db_evictions = 0
+        if db_path:
+            self._open_db()
+
+    def _open_db(self):
+        self._local = threading.local()
+        try:
+            db = self._connection()
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, "
+                "last_used REAL NOT NULL DEFAULT 0)"
+            )
+            try:
+                db.execute("ALTER TABLE query_embeddings ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+            except sqlite3.OperationalError:
+                pass  # column already present
+            db.execute("CREATE INDEX IF NOT EXISTS ix_query_embeddings_last_used ON query_embeddings (last_used)")
+            db.commit()
+            self._persistent = True
+        except sqlite3.Error as e:
+            logging.error(f"Embedding cache database disabled: {e}")
+            self._persistent = False
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=5)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def reopen(self):
+        """Open fresh SQLite connections, e.g. in a forked worker process."""
+        with self._pending_lock:
+            self._pending.clear()  # the parent flushes its own writes
+        if self.db_path:
+            self._open_db()
+
+    def get(self, text, model):
+        key = cache_key(text, model)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+        vector = self._db_get(key)
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, vector)
+        # Refresh last_used so the row cap evicts cold queries first
+        self._db_put(key, model, vector)
+        return vector
+
+    def put(self, text, model, embedding):
+        key = cache_key(text, model)
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector.setflags(write=False)
+        with self._lock:
+            self._remember(key, vector)
+        self._db_put(key, model, vector)
+        return vector
+
+    def _remember(self, key, vector):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key).nbytes
+        self._entries[key] = vector
+        self._bytes += vector.nbytes
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def _db_get(self, key):
+        if not self._persistent:
+            return None
+        with self._pending_lock:
+            pending = self._pending.get(key)
+        if pending is not None:
+            return pending[1]
+        try:
+            row = self._connection().execute(
+                "SELECT vector FROM query_embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"Embedding cache read failed: {e}")
+            return None
+        if row is None:
+            return None
+        vector = np.frombuffer(row[0], dtype=np.float32)
+        vector.setflags(write=False)
+        return vector
+
+    def _db_put(self, key, model, vector):
+        if not self._persistent:
+            return
+        with self._pending_lock:
+            self._pending[key] = (model, vector, time.time())
+            due = (len(self._pending) >= self.batch_size
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Commit buffered writes in one transaction, then trim the table to ``max_rows``."""
+        if not self._persistent:
+            return
+        with self._flush_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, {}
+                self._last_flush = time.monotonic()
+            if not batch:
+                return
+            db = self._connection()
+            try:
+                with db:
+                    db.executemany(
+                        "INSERT OR REPLACE INTO query_embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                        [(key, model, vector.tobytes(), used) for key, (model, vector, used) in batch.items()],
+                    )
+                    if self.max_rows:
+                        excess = db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0] - self.max_rows
+                        if excess > 0:
+                            db.execute(
+                                "DELETE FROM query_embeddings WHERE key IN "
+                                "(SELECT key FROM query_embeddings ORDER BY last_used LIMIT ?)",
+                                (excess,),
+                            )
+                            self.db_evictions += excess
+            except sqlite3.Error as e:
+                logging.error(f"Embedding cache write failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "db_evictions": self.db_evictions,
+                "pending_writes": len(self._pending),
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "persistent": self._persistent,
+            }
@@ -0,0 +1,309 @@
+"""Background crawl/embed jobs for ``/start-embedding``.
+
+Job state lives in a small SQLite table in a file shared by every gunicorn
+worker on the host (``EMBEDDING_JOBS_DB``), so a status poll or cancel can reach
+any worker. With ``EMBEDDING_JOBS_EXTERNAL=true`` the web process only enqueues
+jobs and ``scripts/embedding_worker.py`` runs them out of process. A site has at
+most one queued or running job at a time: submitting another crawl of the same
+host returns the job already in progress.
+
+Each running job records the process that owns it (``host:pid``). On startup
+``recover_stale`` marks jobs whose process has exited as failed, so a crawl
+killed with its worker does not show as running forever.
+"""
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from services.index_manager import tenant_for_url
+
+EMBEDDING_JOBS_DB = os.getenv('EMBEDDING_JOBS_DB') or os.path.join(os.path.dirname(__file__), '..', 'embedding_jobs.sqlite3')
+EMBEDDING_JOB_WORKERS = int(os.getenv('EMBEDDING_JOB_WORKERS', 1))
+EMBEDDING_JOBS_EXTERNAL = os.getenv('EMBEDDING_JOBS_EXTERNAL', 'False').lower() == 'true'
+
+FINISHED = ('succeeded', 'failed', 'cancelled')
+_COLUMNS = (
+    'id', 'url', 'incremental', 'status', 'message', 'pages_visited', 'pages_pending',
+    'chunks_embedded', 'errors', 'cancel_requested', 'created_at', 'started_at', 'finished_at', 'owner',
+    'tenant',
+)
+# Progress fields a running job may report
+_PROGRESS = ('pages_visited', 'pages_pending', 'chunks_embedded', 'errors', 'message')
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _process_alive(owner):
+    """False if ``owner`` is a process that has exited (or ran on another, now gone, host)."""
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        # The job database is a local SQLite file: another host name means a previous container
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobStore:
+    def __init__(self, db_path=EMBEDDING_JOBS_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._connect()
+
+    def reopen(self):
+        """Open a fresh connection, e.g. in a forked worker (``:memory:``, used by tests, starts empty)."""
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self):
+        db_path = self.db_path
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=10, isolation_level=None)
+        if db_path != ':memory:':
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_jobs ("
+            "id TEXT PRIMARY KEY, url TEXT NOT NULL, incremental INTEGER NOT NULL DEFAULT 0, "
+            "status TEXT NOT NULL, message TEXT, pages_visited INTEGER NOT NULL DEFAULT 0, "
+            "pages_pending INTEGER NOT NULL DEFAULT 0, chunks_embedded INTEGER NOT NULL DEFAULT 0, "
+            "errors INTEGER NOT NULL DEFAULT 0, cancel_requested INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, owner TEXT, tenant TEXT)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(embedding_jobs)")}
+        # Job databases created before jobs recorded their process and site
+        for column in ('owner', 'tenant'):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE embedding_jobs ADD COLUMN {column} TEXT")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS ix_embedding_jobs_active ON embedding_jobs (tenant, status)"
+        )
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params)
+
+    def create(self, url, incremental, tenant=None):
+        job_id = uuid.uuid4().hex
+        self._execute(
+            "INSERT INTO embedding_jobs (id, url, incremental, status, created_at, tenant) "
+            "VALUES (?, ?, ?, 'queued', ?, ?)",
+            (job_id, url, int(bool(incremental)), time.time(), tenant),
+        )
+        return job_id
+
+    def create_once(self, url, incremental, tenant):
+        """Queue a job unless ``tenant`` already has one queued or running.
+
+        Returns (job_id, created); atomic across processes sharing the database.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id FROM embedding_jobs WHERE tenant = ? AND status IN ('queued', 'running') "
+                    "ORDER BY created_at LIMIT 1",
+                    (tenant,),
+                ).fetchone()
+                job_id = row[0] if row else uuid.uuid4().hex
+                if row is None:
+                    self._db.execute(
+                        "INSERT INTO embedding_jobs (id, url, incremental, status, created_at, tenant) "
+                        "VALUES (?, ?, ?, 'queued', ?, ?)",
+                        (job_id, url, int(bool(incremental)), time.time(), tenant),
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return job_id, row is None
+
+    def get(self, job_id):
+        row = self._execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM embedding_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def update(self, job_id, **fields):
+        if not fields:
+            return
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        self._execute(f"UPDATE embedding_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def start(self, job_id):
+        """Mark a queued job running; False if it was cancelled (or claimed) meanwhile."""
+        cursor = self._execute(
+            "UPDATE embedding_jobs SET status = 'running', started_at = ?, owner = ? "
+            "WHERE id = ? AND status = 'queued'",
+            (time.time(), _owner(), job_id),
+        )
+        return cursor.rowcount == 1
+
+    def claim_next(self):
+        """Atomically take the oldest queued job (for out-of-process workers)."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id FROM embedding_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row:
+                    self._db.execute(
+                        "UPDATE embedding_jobs SET status = 'running', started_at = ?, owner = ? WHERE id = ?",
+                        (time.time(), _owner(), row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return row[0] if row else None
+
+    def recover_stale(self):
+        """Mark running jobs whose process has exited as failed; returns their ids."""
+        rows = self._execute("SELECT id, owner FROM embedding_jobs WHERE status = 'running'").fetchall()
+        stale = [job_id for job_id, owner in rows if not _process_alive(owner)]
+        for job_id in stale:
+            self._execute(
+                "UPDATE embedding_jobs SET status = 'failed', message = ?, pages_pending = 0, finished_at = ? "
+                "WHERE id = ? AND status = 'running'",
+                ("The process running this job exited before it finished", time.time(), job_id),
+            )
+            logging.warning(f"Embedding job {job_id} was interrupted; marked failed")
+        return stale
+
+    def request_cancel(self, job_id):
+        cursor = self._execute(
+            "UPDATE embedding_jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')",
+            (job_id,),
+        )
+        # Jobs that never started can be finished right away
+        self._execute(
+            "UPDATE embedding_jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id),
+        )
+        return cursor.rowcount == 1
+
+    def cancel_requested(self, job_id):
+        row = self._execute("SELECT cancel_requested FROM embedding_jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+
+class JobHandle:
+    """Passed to the job function to report progress and poll for cancellation."""
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.id = job_id
+        self._cancel_checked = 0.0
+        self._cancelled = False
+
+    def update(self, **progress):
+        self.store.update(self.id, **{k: v for k, v in progress.items() if k in _PROGRESS})
+
+    @property
+    def cancelled(self):
+        # The flag may be set by another process, so re-read it at most twice a second
+        now = time.monotonic()
+        if not self._cancelled and now - self._cancel_checked > 0.5:
+            self._cancel_checked = now
+            self._cancelled = self.store.cancel_requested(self.id)
+        return self._cancelled
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled(self.id)
+
+
+def describe(job):
+    """Public JSON view of a job row, with an ETA derived from crawl progress."""
+    if job is None:
+        return None
+    now = time.time()
+    started, finished = job['started_at'], job['finished_at']
+    elapsed = ((finished or now) - started) if started else 0.0
+    eta = None
+    if job['status'] == 'running' and job['pages_visited']:
+        eta = round(elapsed / job['pages_visited'] * job['pages_pending'], 1)
+    return {
+        "job_id": job['id'],
+        "url": job['url'],
+        "incremental": bool(job['incremental']),
+        "status": job['status'],
+        "message": job['message'],
+        "pages_visited": job['pages_visited'],
+        "pages_pending": job['pages_pending'],
+        "chunks_embedded": job['chunks_embedded'],
+        "errors": job['errors'],
+        "cancel_requested": bool(job['cancel_requested']),
+        "elapsed_seconds": round(elapsed, 1),
+        "eta_seconds": eta,
+    }
+
+
+class EmbeddingJobRunner:
+    def __init__(self, run_job, store=None, max_workers=EMBEDDING_JOB_WORKERS, external=EMBEDDING_JOBS_EXTERNAL):
+        """``run_job(url, incremental, handle)`` does the actual crawl and embedding."""
+        self.run_job = run_job
+        self.store = store or JobStore()
+        self.store.recover_stale()
+        self.external = external
+        self._executor = None if external else ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="embedding-job"
+        )
+
+    def submit(self, url, incremental=False):
+        """Queue a crawl of ``url``. Returns (job, created): while the site already has a
+        job queued or running, that job is returned instead of starting a second crawl."""
+        # A job whose worker died must not block new crawls of its site
+        self.store.recover_stale()
+        job_id, created = self.store.create_once(url, incremental, tenant_for_url(url))
+        if created and self._executor is not None:
+            self._executor.submit(self._run_queued, job_id)
+        return describe(self.store.get(job_id)), created
+
+    def get(self, job_id):
+        return describe(self.store.get(job_id))
+
+    def cancel(self, job_id):
+        return self.store.request_cancel(job_id)
+
+    def _run_queued(self, job_id):
+        if self.store.start(job_id):
+            self._run(job_id)
+
+    def _run(self, job_id):
+        job = self.store.get(job_id)
+        handle = JobHandle(self.store, job_id)
+        try:
+            self.run_job(job['url'], bool(job['incremental']), handle)
+            status = 'cancelled' if handle.cancelled else 'succeeded'
+        except JobCancelled:
+            status = 'cancelled'
+        except Exception as e:
+            logging.error(f"Embedding job {job_id} failed: {e}", exc_info=True)
+            self.store.update(job_id, message=str(e))
+            status = 'failed'
+        self.store.update(job_id, status=status, pages_pending=0, finished_at=time.time())
+        logging.info(f"Embedding job {job_id} {status}")
+
+    def work_forever(self, poll_interval=2.0):
+        """Loop used by the out-of-process worker: claim and run queued jobs."""
+        while True:
+            job_id = self.store.claim_next()
+            if job_id is None:
+                time.sleep(poll_interval)
+                continue
+            self._run(job_id)
@@ -0,0 +1,167 @@
+"""Embedding providers: the OpenAI API or a local sentence-transformers model.
+
+A provider embeds single queries on the chat path (``embed_query``) and batches
+of chunks while indexing (``embed_documents``).
+Its ``name`` is stored with every index it builds; vectors from one provider
+are meaningless to another even when the dimensions agree, so an index is only
+searched with the provider that built it (see ``check_index``).
+
+The local backend loads its model once per process, on first use, and runs
+inference on a small thread pool. Concurrent queries are collected for up to
+``LOCAL_EMBEDDING_BATCH_WAIT_MS`` and encoded together, so a busy worker runs
+one forward pass per batch instead of one per request.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+EMBEDDING_PROVIDER = os.getenv('EMBEDDING_PROVIDER', 'openai').lower()  # 'openai' or 'local'
+LOCAL_EMBEDDING_MODEL = os.getenv('LOCAL_EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv('LOCAL_EMBEDDING_BATCH_SIZE', 32))
+LOCAL_EMBEDDING_BATCH_WAIT_MS = float(os.getenv('LOCAL_EMBEDDING_BATCH_WAIT_MS', 5))
+LOCAL_EMBEDDING_THREADS = int(os.getenv('LOCAL_EMBEDDING_THREADS', 2))
+OPENAI_BULK_TIMEOUT = 120  # seconds for one indexing batch
+
+OPENAI_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+# Indexes written before providers were recorded were all built with ada-002
+LEGACY_PROVIDER = "openai:text-embedding-ada-002"
+
+
+class ProviderMismatch(ValueError):
+    pass
+
+
+def check_index(index, provider):
+    """Raise ProviderMismatch unless ``index`` was built by ``provider``."""
+    if not len(index):
+        return
+    built_by = index.provider or LEGACY_PROVIDER
+    if built_by != provider.name:
+        raise ProviderMismatch(f"index was built with {built_by}, queries use {provider.name}")
+    if provider.dim and index.dim != provider.dim:
+        raise ProviderMismatch(f"index has {index.dim}-d vectors, {provider.name} produces {provider.dim}-d")
+
+
+class OpenAIEmbeddingProvider:
+    def __init__(self, model, runner):
+        """``runner`` is the process' ``openai_client.AsyncOpenAIRunner``."""
+        self.model = model
+        self.runner = runner
+        self.name = f"openai:{model}"
+        self.dim = OPENAI_DIMENSIONS.get(model)
+
+    def _request(self, texts):
+        return lambda c: c.embeddings.create(input=texts, model=self.model)
+
+    def embed_query(self, text):
+        return self.runner.run(self._request([text])).data[0].embedding
+
+    def embed_documents(self, texts):
+        # One retry layer: EmbeddingBatcher (and the intent router) back off between batches themselves
+        response = self.runner.run(self._request(texts), timeout=OPENAI_BULK_TIMEOUT, max_retries=0)
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    def reset(self):
+        pass  # the runner is reset separately
+
+
+class LocalEmbeddingProvider:
+    def __init__(self, model_name=LOCAL_EMBEDDING_MODEL, batch_size=LOCAL_EMBEDDING_BATCH_SIZE,
+                 batch_wait_ms=LOCAL_EMBEDDING_BATCH_WAIT_MS, threads=LOCAL_EMBEDDING_THREADS):
+        self.model_name = model_name
+        self.name = f"local:{model_name}"
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.threads = threads
+        self._lock = threading.Lock()
+        self._pid = None
+        self._model = None
+        self.batches = 0
+        self.texts = 0
+
+    @property
+    def dim(self):
+        return self._model.get_sentence_embedding_dimension() if self._model is not None else None
+
+    def _ensure_started(self):
+        # Model, pool and dispatcher belong to one process; a forked worker starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            from sentence_transformers import SentenceTransformer
+            started = time.monotonic()
+            self._model = SentenceTransformer(self.model_name, device='cpu')
+            logging.info(f"Loaded local embedding model {self.model_name} in {time.monotonic() - started:.1f}s")
+            self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="embed")
+            self._queue = queue.Queue()
+            threading.Thread(target=self._dispatch, args=(self._queue,), name="embed-batcher", daemon=True).start()
+            self._pid = os.getpid()
+
+    def reset(self):
+        """Forget the parent's model and threads (call in a freshly forked worker)."""
+        with self._lock:
+            self._pid = None
+
+    def _encode(self, texts):
+        self.batches += 1
+        self.texts += len(texts)
+        return self._model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                  normalize_embeddings=True, show_progress_bar=False).astype(np.float32)
+
+    def _dispatch(self, pending):
+        """Collect queued queries into batches and hand each batch to the pool."""
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._pool.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        try:
+            vectors = self._encode([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+    def _submit(self, text):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed_query(self, text):
+        return self._submit(text).result()
+
+    def embed_documents(self, texts):
+        """Already a batch: encoded directly on the pool, bypassing the query batcher."""
+        self._ensure_started()
+        return list(self._pool.submit(self._encode, list(texts)).result())
+
+
+def make_provider(name, openai_model, runner):
+    if name == 'local':
+        return LocalEmbeddingProvider()
+    if name != 'openai':
+        raise ValueError(f"Unknown EMBEDDING_PROVIDER: {name}")
+    return OpenAIEmbeddingProvider(openai_model, runner)
@@ -0,0 +1,265 @@
+"""Binary on-disk layout for the website embedding index.
+
+A store with base path ``website_embeddings`` is:
+
+* ``website_embeddings.npy``        float32 (N, D) matrix, rows pre-normalized
+* ``website_embeddings.chunks.bin`` UTF-8 chunk texts, concatenated
+* ``website_embeddings.offsets.npy`` / ``.url_ids.npy`` / ``.tokens.npy`` /
+  ``.chunk_hashes.npy``  per-chunk byte offsets into the blob, url ids, token
+  counts and content hashes (the hashes are used by incremental re-crawls)
+* ``website_embeddings.meta.json``  embedding provider, count, url table and
+  content hash per page; small whatever the number of chunks
+
+plus derived files: ``website_embeddings.ivf.<key>.npz`` when an approximate
+(IVF) index was built, and ``website_embeddings.int8.<key>.npy`` /
+``.int8.<key>.scales.npy`` (or ``.float16.<key>.npy``) when ``EMBEDDING_DTYPE``
+selects a quantized copy for scoring. ``key`` is the content hash recorded in the
+sidecar, so derived files left by an interrupted save never match the store
+they sit next to. They are written after the sidecar and only ever by
+``save_index``; loading never writes.
+
+The vector block and per-chunk arrays are opened with ``np.load(mmap_mode='r')``
+and the chunk blob with ``np.memmap``, so loading is O(1) in the number of
+chunks and every gunicorn worker shares the page cache. Version 1 stores, which
+kept the per-chunk arrays in the JSON sidecar, can still be read.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+from services.atomic_files import replace_atomically
+from services.vector_index import VectorIndex
+from services.ann_index import ANN_BACKEND, IVFIndex, maybe_build_ann
+from services.tokens import count_tokens
+from services.quantization import EMBEDDING_DTYPE, RERANK_CANDIDATES, QuantizedVectors
+
+STORE_VERSION = 2
+READABLE_VERSIONS = (1, STORE_VERSION)
+ROW_ARRAYS = ("offsets", "url_ids", "tokens", "chunk_hashes")
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _paths(base_path):
+    return {
+        "vectors": f"{base_path}.npy",
+        "chunks": f"{base_path}.chunks.bin",
+        "meta": f"{base_path}.meta.json",
+    }
+
+
+def _row_paths(base_path):
+    return {name: f"{base_path}.{name}.npy" for name in ROW_ARRAYS}
+
+
+def _ann_path(base_path, key=None):
+    return f"{base_path}.ivf.{key}.npz" if key else f"{base_path}.ivf.npz"
+
+
+def _derived_paths(base_path):
+    """Every IVF and quantized file next to the store, whatever its key."""
+    base = glob.escape(base_path)
+    patterns = [f"{base}.ivf.npz", f"{base}.ivf.*.npz"]
+    for dtype in ("float16", "int8"):
+        patterns += [f"{base}.{dtype}.npy", f"{base}.{dtype}.*.npy"]
+    return {path for pattern in patterns for path in glob.glob(pattern)}
+
+
+class ChunkMetadata:
+    """Read-only sequence of ``{"url", "chunk", "tokens"}`` dicts decoded lazily from the chunk blob."""
+
+    def __init__(self, blob, offsets, url_ids, urls, token_counts=None):
+        self._blob = blob
+        self._offsets = offsets
+        self._url_ids = url_ids
+        self._urls = urls
+        self._token_counts = token_counts
+
+    def __len__(self):
+        return len(self._url_ids)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start, end = self._offsets[i], self._offsets[i + 1]
+        meta = {
+            "url": self._urls[self._url_ids[i]],
+            "chunk": bytes(self._blob[start:end]).decode('utf-8'),
+        }
+        if self._token_counts is not None:
+            meta["tokens"] = int(self._token_counts[i])
+        return meta
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def store_exists(base_path):
+    return all(os.path.exists(p) for p in _paths(base_path).values())
+
+
+def store_version(base_path):
+    """Identity of the store's current contents (None if missing); changes on every save.
+
+    The sidecar is replaced last by ``save_index``, so its inode and mtime mark a
+    complete write.
+    """
+    try:
+        stat = os.stat(_paths(base_path)["meta"])
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def store_count(base_path):
+    """Number of chunks in the store, read from the sidecar only (0 if missing)."""
+    try:
+        with open(_paths(base_path)["meta"], 'r') as f:
+            return int(json.load(f).get("count", 0))
+    except (OSError, ValueError):
+        return 0
+
+
+def save_index(index, base_path, page_hashes=None):
+    """Write ``index`` as a binary store; each file is swapped in atomically.
+
+    ``page_hashes`` maps each crawled url to the hash of its extracted text.
+    """
+    paths = _paths(base_path)
+    urls, url_lookup, url_ids, offsets, blob = [], {}, [], [0], bytearray()
+    chunk_hashes, token_counts = [], []
+    for meta in index.metadata:
+        url = meta["url"]
+        if url not in url_lookup:
+            url_lookup[url] = len(urls)
+            urls.append(url)
+        url_ids.append(url_lookup[url])
+        encoded = meta["chunk"].encode('utf-8')
+        blob += encoded
+        offsets.append(len(blob))
+        chunk_hashes.append(content_hash(meta["chunk"]))
+        # Stored so the prompt builder never re-tokenizes retrieved chunks
+        token_counts.append(meta.get("tokens") or count_tokens(meta["chunk"]))
+
+    rows = {
+        "offsets": np.asarray(offsets, dtype=np.int64),
+        "url_ids": np.asarray(url_ids, dtype=np.int32),
+        "tokens": np.asarray(token_counts, dtype=np.int32),
+        "chunk_hashes": np.asarray(chunk_hashes, dtype='S40'),
+    }
+    sidecar = {
+        "version": STORE_VERSION,
+        "count": len(index),
+        "dim": index.dim,
+        "provider": index.provider,
+        "urls": urls,
+        "page_hashes": page_hashes or {},
+    }
+    vectors = np.ascontiguousarray(index.vectors, dtype=np.float32)
+    digest = hashlib.sha1(json.dumps(sidecar, sort_keys=True).encode('utf-8'))
+    for data in (vectors.data, bytes(blob), *(array.data for array in rows.values())):
+        digest.update(data)
+    sidecar["key"] = key = digest.hexdigest()[:16]
+    replace_atomically(paths["vectors"], lambda f: np.save(f, vectors))
+    replace_atomically(paths["chunks"], lambda f: f.write(bytes(blob)))
+    for name, path in _row_paths(base_path).items():
+        replace_atomically(path, lambda f, array=rows[name]: np.save(f, array))
+    # Sidecar last: readers treat it as the commit marker for the other files.
+    replace_atomically(
+        paths["meta"],
+        lambda f: f.write(json.dumps(sidecar, separators=(',', ':')).encode('utf-8')),
+    )
+    # Derived files last, keyed on the committed sidecar; then drop other versions' copies
+    keep = set()
+    if index.ann is not None:
+        keep.add(_ann_path(base_path, key))
+        index.ann.save(_ann_path(base_path, key))
+    if EMBEDDING_DTYPE != 'float32' and len(index):
+        keep.update(QuantizedVectors.paths(base_path, EMBEDDING_DTYPE, key))
+        QuantizedVectors.quantize(vectors, EMBEDDING_DTYPE).save(base_path, key)
+    for path in _derived_paths(base_path) - keep:
+        os.remove(path)
+    if keep:
+        # A reader that loaded between the sidecar and the derived files reloads (see store_version)
+        os.utime(paths["meta"])
+    logging.info(f"Saved {len(index)} embeddings to {base_path}.*")
+
+
+def load_index(base_path):
+    """Open a binary store as a memory-mapped ``VectorIndex``."""
+    paths = _paths(base_path)
+    with open(paths["meta"], 'r') as f:
+        sidecar = json.load(f)
+    if sidecar.get("version") not in READABLE_VERSIONS:
+        raise ValueError(f"Unsupported embedding store version: {sidecar.get('version')}")
+    count = sidecar["count"]
+    if not count:
+        return VectorIndex.empty()
+
+    vectors = np.load(paths["vectors"], mmap_mode='r')
+    blob = np.memmap(paths["chunks"], dtype=np.uint8, mode='r')
+    if sidecar["version"] == 1:
+        offsets = np.asarray(sidecar["offsets"], dtype=np.int64)
+        url_ids = np.asarray(sidecar["url_ids"], dtype=np.int32)
+        token_counts = np.asarray(sidecar["token_counts"], dtype=np.int32) if "token_counts" in sidecar else None
+    else:
+        row_paths = _row_paths(base_path)
+        offsets = np.load(row_paths["offsets"], mmap_mode='r')
+        url_ids = np.load(row_paths["url_ids"], mmap_mode='r')
+        token_counts = np.load(row_paths["tokens"], mmap_mode='r')
+    if len(vectors) != count or len(url_ids) != count or len(offsets) != count + 1:
+        raise ValueError(f"Embedding store files do not match its sidecar ({count} chunks)")
+    metadata = ChunkMetadata(blob, offsets, url_ids, sidecar["urls"], token_counts)
+    index = VectorIndex(vectors, metadata, normalized=True)
+    index.provider = sidecar.get("provider")
+    key = sidecar.get("key")
+    if EMBEDDING_DTYPE != 'float32':
+        quantized = QuantizedVectors.load(base_path, EMBEDDING_DTYPE, count, key)
+        if quantized is None:
+            # e.g. saved under another EMBEDDING_DTYPE; the next save writes the copy
+            logging.warning(f"No {EMBEDDING_DTYPE} copy of {base_path}; scoring on float32 until it is rebuilt")
+        else:
+            index.quantized = quantized
+            index.rerank = RERANK_CANDIDATES
+    if ANN_BACKEND == 'ivf' and os.path.exists(_ann_path(base_path, key)):
+        ann = IVFIndex.load(_ann_path(base_path, key))
+        if ann.count == count:
+            index.ann = ann
+        else:
+            logging.warning("Ignoring IVF index that does not match the stored vectors.")
+    return index
+
+
+def load_hashes(base_path):
+    """Return ``(page_hashes, chunk_hashes)`` from the sidecar, or empty values if missing."""
+    try:
+        with open(_paths(base_path)["meta"], 'r') as f:
+            sidecar = json.load(f)
+    except (OSError, ValueError):
+        return {}, []
+    page_hashes = sidecar.get("page_hashes", {})
+    if sidecar.get("version") == 1:
+        return page_hashes, sidecar.get("chunk_hashes", [])
+    try:
+        chunk_hashes = np.load(_row_paths(base_path)["chunk_hashes"])
+    except (OSError, ValueError):
+        return page_hashes, []
+    return page_hashes, [h.decode('ascii') for h in chunk_hashes]
+
+
+def convert_json(json_path, base_path):
+    """One-shot conversion of a legacy ``website_embeddings.json`` file."""
+    with open(json_path, 'r') as f:
+        records = json.load(f)
+    index = maybe_build_ann(VectorIndex.from_records(records))
+    save_index(index, base_path)
+    return len(index)
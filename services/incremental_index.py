@@ -0,0 +1,54 @@
+"""Reuse of an existing index during a re-crawl.
+
+Pages whose extracted text hashes the same as last time keep all of their rows.
+For changed pages, any chunk whose text was already embedded (anywhere on the
+site) keeps its vector, so only genuinely new text is sent to the embeddings API.
+Pages the re-crawl did not fetch are carried over unchanged unless the server
+reported them removed (404/410).
+"""
+from services.embedding_store import content_hash
+
+
+class IncrementalIndex:
+    def __init__(self, index, page_hashes, chunk_hashes=None):
+        self.index = index
+        self.page_hashes = page_hashes
+        if not chunk_hashes or len(chunk_hashes) != len(index):
+            chunk_hashes = [content_hash(meta["chunk"]) for meta in index.metadata]
+        self._rows_by_url = {}
+        self._row_by_chunk = {}
+        for i, meta in enumerate(index.metadata):
+            self._rows_by_url.setdefault(meta["url"], []).append(i)
+            self._row_by_chunk.setdefault(chunk_hashes[i], i)
+        self.reused_pages = 0
+        self.reused_chunks = 0
+
+    def _record(self, i, url=None):
+        meta = self.index.metadata[i]
+        return {"url": url or meta["url"], "chunk": meta["chunk"], "tokens": meta.get("tokens"),
+                "embedding": self.index.vectors[i]}
+
+    def unchanged_page(self, url, page_hash):
+        """Records for ``url`` if its text is unchanged since the last crawl, else None."""
+        if url not in self._rows_by_url or self.page_hashes.get(url) != page_hash:
+            return None
+        rows = self._rows_by_url[url]
+        self.reused_pages += 1
+        self.reused_chunks += len(rows)
+        return [self._record(i) for i in rows]
+
+    def urls(self):
+        """Pages in the previous index."""
+        return set(self._rows_by_url)
+
+    def page_records(self, url):
+        """All previous records for ``url`` (used to keep pages not fetched this time)."""
+        return [self._record(i) for i in self._rows_by_url.get(url, [])]
+
+    def reuse_chunk(self, url, chunk):
+        """A record for ``chunk`` built from an existing vector, or None if it is new."""
+        i = self._row_by_chunk.get(content_hash(chunk))
+        if i is None:
+            return None
+        self.reused_chunks += 1
+        return self._record(i, url)
@@ -0,0 +1,179 @@
+"""One embedding index per site (tenant), loaded lazily under a memory budget.
+
+Tenants are keyed by the site's host name (``leads4less.io``). Indexes are
+loaded on first use and kept in an LRU; when the bytes held by loaded indexes
+exceed ``INDEX_MEMORY_BUDGET`` the least recently queried tenants are dropped
+and simply reloaded from disk the next time they are needed. Callers should
+only ask for tenants that have an index on disk (``ChatService.has_index``).
+
+An index rebuilt by another process (another gunicorn worker or the embedding
+worker) is picked up by comparing the store's version, checked at most every
+``INDEX_CHECK_INTERVAL`` seconds per tenant.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+INDEX_MEMORY_BUDGET = int(os.getenv('INDEX_MEMORY_BUDGET', 1024 * 1024 * 1024))
+INDEX_CHECK_INTERVAL = float(os.getenv('INDEX_CHECK_INTERVAL', 5))  # seconds
+INDEXES_DIR = os.getenv('INDEXES_DIR') or os.path.join(os.path.dirname(__file__), '..', 'indexes')
+
+_UNSAFE = re.compile(r"[^a-z0-9.-]+")
+_DOTS = re.compile(r"\.{2,}")
+
+
+def sanitize_tenant(key):
+    """Filesystem-safe tenant key, or None if nothing usable is left."""
+    key = _DOTS.sub(".", _UNSAFE.sub("-", key.strip().lower())).strip(".-")
+    return key or None
+
+
+def tenant_for_url(url):
+    """Tenant key of a site URL: its host name without ``www.`` or port."""
+    if "://" not in url:
+        url = f"https://{url}"
+    host = (urlparse(url).hostname or "").removeprefix("www.")
+    return sanitize_tenant(host)
+
+
+def resolve_tenant(value):
+    """Tenant key from a client-supplied site URL or key; None if invalid."""
+    if not value:
+        return None
+    return tenant_for_url(value) if "/" in value else sanitize_tenant(value.removeprefix("www."))
+
+
+def index_nbytes(index):
+    # With a quantized copy the float32 rows are only read for re-ranking candidates
+    nbytes = index.quantized.nbytes if index.quantized is not None else index.vectors.nbytes
+    if index.ann is not None:
+        nbytes += index.ann.centroids.nbytes + index.ann.order.nbytes + index.ann.offsets.nbytes
+    if index.lexical is not None:
+        nbytes += index.lexical.nbytes
+    return nbytes
+
+
+class IndexManager:
+    def __init__(self, loader, budget_bytes=INDEX_MEMORY_BUDGET, version=None, on_change=None,
+                 check_interval=INDEX_CHECK_INTERVAL):
+        """``loader(tenant)`` reads a tenant's index from disk; ``version(tenant)``, if
+        given, returns a value that changes whenever that index is rewritten, and
+        ``on_change(tenant)`` is called before a changed index is reloaded."""
+        self._loader = loader
+        self._version = version
+        self._on_change = on_change
+        self.budget_bytes = budget_bytes
+        self.check_interval = check_interval
+        self._indexes = OrderedDict()
+        self._sizes = {}
+        self._versions = {}
+        self._checked = {}
+        self._lock = threading.Lock()
+        self._tenant_locks = {}
+        self.hits = 0
+        self.loads = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def get(self, tenant):
+        with self._lock:
+            index = self._touch(tenant)
+            stale_check = index is not None and self._check_due(tenant)
+            if index is not None and not stale_check:
+                return index
+        if stale_check:
+            # Only this caller checks; others keep the current index meanwhile
+            if self._version(tenant) == self._versions.get(tenant):
+                return index
+            logging.info(f"Embedding index for tenant {tenant} changed on disk, reloading")
+            self.reloads += 1
+            if self._on_change is not None:
+                self._on_change(tenant)
+        # Per-tenant locks exist only while a load is in flight (removed below)
+        with self._lock:
+            tenant_lock = self._tenant_locks.setdefault(tenant, threading.Lock())
+        # Load outside the manager lock so other tenants keep being served
+        try:
+            with tenant_lock:
+                with self._lock:
+                    current = self._touch(tenant)
+                if current is None or current is index:
+                    index = self.reload(tenant)
+                else:
+                    index = current
+        finally:
+            # Later callers find the index cached; don't keep a lock per tenant ever asked for
+            with self._lock:
+                if self._tenant_locks.get(tenant) is tenant_lock:
+                    del self._tenant_locks[tenant]
+        return index
+
+    def reload(self, tenant):
+        """Read a tenant's index from disk and install it."""
+        # Versioned before reading: a rewrite during the read is caught on the next check
+        version = self._version(tenant) if self._version is not None else None
+        index = self._loader(tenant)
+        self.put(tenant, index, version)
+        return index
+
+    def _check_due(self, tenant):
+        if self._version is None:
+            return False
+        now = time.monotonic()
+        if now - self._checked.get(tenant, 0.0) < self.check_interval:
+            return False
+        self._checked[tenant] = now
+        return True
+
+    def _touch(self, tenant):
+        index = self._indexes.get(tenant)
+        if index is not None:
+            self._indexes.move_to_end(tenant)
+            self.hits += 1
+        return index
+
+    def put(self, tenant, index, version=None):
+        """Install (or replace) a tenant's index, evicting cold tenants over budget."""
+        with self._lock:
+            self._drop(tenant)
+            self.loads += 1
+            # Empty indexes are cached too (they cost nothing), so they are not re-read on every query
+            self._indexes[tenant] = index
+            self._sizes[tenant] = index_nbytes(index)
+            self._versions[tenant] = version
+            self._checked[tenant] = time.monotonic()
+            while self.resident_bytes > self.budget_bytes and len(self._indexes) > 1:
+                cold = next(iter(self._indexes))
+                self._drop(cold)
+                self.evictions += 1
+                logging.info(f"Evicted embedding index for tenant {cold}")
+
+    def evict(self, tenant):
+        with self._lock:
+            self._drop(tenant)
+
+    def _drop(self, tenant):
+        self._indexes.pop(tenant, None)
+        self._sizes.pop(tenant, None)
+        self._versions.pop(tenant, None)
+        self._checked.pop(tenant, None)
+
+    @property
+    def resident_bytes(self):
+        return sum(self._sizes.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tenants_loaded": list(self._indexes),
+                "resident_bytes": self.resident_bytes,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "loads": self.loads,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+            }
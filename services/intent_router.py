@@ -0,0 +1,163 @@
+"""Answers navigation and small-talk/FAQ turns locally, before retrieval.
+
+Every redirect rule, the navigation-verb pattern and every intent pattern are
+compiled into one alternation with a named group per rule, so a message is
+scanned once regardless of how many rules there are. A redirect needs both a
+navigation verb and a destination rule (the lowest-numbered rule wins, as
+before). Intent patterns are anchored to the whole message, so they only fire
+for messages that are *nothing but* e.g. a greeting.
+
+Messages that no pattern claims can still be matched on meaning: the query
+embedding (which retrieval needs anyway) is compared with a precomputed
+centroid per intent, and a canned answer is returned only above
+``INTENT_THRESHOLD`` cosine similarity. Centroids are built from every intent's
+example phrases with one batched embedding call on a background thread
+(started after fork, or by the first query), never at import and never on a
+request thread. Until they are ready, or while a failed build is backing off,
+only the patterns route.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from services.vector_index import normalize_rows
+
+INTENT_THRESHOLD = float(os.getenv('INTENT_THRESHOLD', 0.93))  # > 1 disables centroid routing
+CENTROID_RETRY_BASE = 5.0  # seconds before retrying a failed build, doubling up to the max
+CENTROID_RETRY_MAX = 300.0
+
+# kind is "redirect" (value = url) or "intent" (value = answer text)
+Route = namedtuple('Route', ['kind', 'name', 'value', 'score'])
+
+_NAVIGATION = "nav"
+
+
+class IntentRouter:
+    def __init__(self, redirect_rules, navigation_pattern, intents, embed_many=None, threshold=INTENT_THRESHOLD):
+        """``intents`` are ``{"name", "answer", "pattern"?, "examples"?}`` dicts;
+        ``embed_many(texts)`` returns one embedding per text (used for the centroids)."""
+        self.redirect_urls = [url for _, url in redirect_rules]
+        self.intents = intents
+        self.embed_many = embed_many
+        self.threshold = threshold
+        alternatives = [f"(?P<{_NAVIGATION}>{navigation_pattern.pattern})"]
+        # Intents before redirect rules: their anchored patterns only match a whole message
+        alternatives += [f"(?P<i{i}>{intent['pattern']})" for i, intent in enumerate(intents) if intent.get("pattern")]
+        alternatives += [f"(?P<r{i}>{pattern.pattern})" for i, (pattern, _) in enumerate(redirect_rules)]
+        self._matcher = re.compile("|".join(alternatives), re.IGNORECASE)
+        self._centroids = None
+        self._centroid_intents = []
+        self._centroid_lock = threading.Lock()
+        self._building = False
+        self._retry_at = 0.0
+        self.centroid_failures = 0
+        self.pattern_hits = 0
+        self.centroid_hits = 0
+        self.redirects = 0
+        self.misses = 0
+
+    def _scan(self, text):
+        return {match.lastgroup for match in self._matcher.finditer(text)}
+
+    def redirect(self, message):
+        """Url of the first matching redirect rule if the message asks to navigate, else None."""
+        groups = self._scan(message.strip())
+        return self._redirect(groups)
+
+    def _redirect(self, groups):
+        if _NAVIGATION not in groups:
+            return None
+        rules = [int(g[1:]) for g in groups if g.startswith("r")]
+        return self.redirect_urls[min(rules)] if rules else None
+
+    def match(self, message):
+        """Route for a message using the patterns only (no network), or None."""
+        groups = self._scan(message.strip())
+        url = self._redirect(groups)
+        if url is not None:
+            self.redirects += 1
+            return Route("redirect", "navigation", url, 1.0)
+        matched = [int(g[1:]) for g in groups if g.startswith("i")]
+        if matched:
+            intent = self.intents[min(matched)]
+            self.pattern_hits += 1
+            return Route("intent", intent["name"], intent["answer"], 1.0)
+        return None
+
+    def match_embedding(self, query_emb):
+        """Route for a query embedding close enough to an intent centroid, or None."""
+        centroids = self._get_centroids() if query_emb is not None and self.threshold <= 1 else None
+        if centroids is None or not len(centroids):
+            self.misses += 1
+            return None
+        query = normalize_rows(np.array(query_emb, dtype=np.float32, ndmin=2))[0]
+        scores = centroids @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            self.misses += 1
+            return None
+        intent = self._centroid_intents[best]
+        self.centroid_hits += 1
+        return Route("intent", intent["name"], intent["answer"], float(scores[best]))
+
+    def _get_centroids(self):
+        if self._centroids is None:
+            self.warm()
+        return self._centroids
+
+    def warm(self):
+        """Start building the centroids in the background; returns the thread, or None
+        if they are built, being built or backing off after a failure."""
+        if self._centroids is not None or self.embed_many is None:
+            return None
+        with self._centroid_lock:
+            if self._building or time.monotonic() < self._retry_at:
+                return None
+            self._building = True
+        thread = threading.Thread(target=self._build_centroids, name="intent-centroids", daemon=True)
+        thread.start()
+        return thread
+
+    def _build_centroids(self):
+        examples = [list(intent.get("examples", ())) for intent in self.intents]
+        texts = [text for intent_texts in examples for text in intent_texts]
+        try:
+            vectors = self.embed_many(texts) if texts else []
+        except Exception as e:
+            with self._centroid_lock:
+                wait = min(CENTROID_RETRY_MAX, CENTROID_RETRY_BASE * 2 ** self.centroid_failures)
+                self.centroid_failures += 1
+                self._retry_at = time.monotonic() + wait
+                self._building = False
+            logging.warning(f"Could not build intent centroids, retrying in {wait:.0f}s: {e}")
+            return
+        centroids, names, start = [], [], 0
+        for intent, texts in zip(self.intents, examples):
+            rows = vectors[start:start + len(texts)]
+            start += len(texts)
+            if rows:
+                centroids.append(normalize_rows(np.array(rows, dtype=np.float32)).mean(axis=0))
+                names.append(intent)
+        with self._centroid_lock:
+            self._centroid_intents = names
+            self._centroids = (normalize_rows(np.array(centroids, dtype=np.float32)) if centroids
+                               else np.zeros((0, 0), dtype=np.float32))
+            self._building = False
+        logging.info(f"Built intent centroids for {len(names)} intents")
+
+    def stats(self):
+        routed = self.pattern_hits + self.centroid_hits + self.redirects
+        return {
+            "redirects": self.redirects,
+            "pattern_hits": self.pattern_hits,
+            "centroid_hits": self.centroid_hits,
+            "misses": self.misses,
+            "routed_ratio": routed / (routed + self.misses) if routed + self.misses else 0.0,
+            "centroids_ready": self._centroids is not None,
+            "centroid_failures": self.centroid_failures,
+        }
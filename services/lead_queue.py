@@ -0,0 +1,242 @@
+"""Write-behind ingestion for ``/form`` (``LEAD_INGEST_MODE=queue``).
+
+A validated submission is appended to a local SQLite queue (WAL, synchronous
+commit) and acknowledged at once with its queue id. The request never waits on
+the main database. A flusher thread in each worker claims batches of queued
+leads, bulk-inserts them into ``Lead`` and then deletes them from the queue:
+
+* at-least-once: a lead leaves the queue only after its insert committed. A
+  batch that fails, or whose worker dies mid-flush, is claimed again once
+  ``LEAD_CLAIM_TIMEOUT`` has passed. The queue id is stored as
+  ``Lead.submission_id`` (unique), so ``write_batch`` skips leads that a crash
+  between the commit and the delete would otherwise insert twice.
+* poison leads: when the database refuses a batch (``write_batch`` raises
+  ``LeadRejected``), its leads are written one at a time and those refused
+  again move to the ``lead_dead_letter`` table instead of blocking the queue.
+  Any other error (e.g. the database is down) retries the batch with backoff.
+* backpressure: once ``LEAD_QUEUE_MAX_PENDING`` leads are waiting, ``enqueue``
+  raises ``LeadQueueFull`` and ``/form`` writes the lead synchronously.
+
+The queue file is shared by all workers on the host, so its leads survive
+restarts and any worker's flusher may deliver them.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from services.metrics import registry
+
+LEAD_INGEST_MODE = os.getenv('LEAD_INGEST_MODE', 'sync').lower()  # 'sync' or 'queue'
+LEAD_QUEUE_DB = os.getenv('LEAD_QUEUE_DB') or os.path.join(os.path.dirname(__file__), '..', 'lead_queue.db')
+LEAD_QUEUE_MAX_PENDING = int(os.getenv('LEAD_QUEUE_MAX_PENDING', 10000))
+LEAD_FLUSH_INTERVAL = float(os.getenv('LEAD_FLUSH_INTERVAL', 1.0))  # seconds between flushes when idle
+LEAD_FLUSH_BATCH = int(os.getenv('LEAD_FLUSH_BATCH', 500))
+LEAD_CLAIM_TIMEOUT = float(os.getenv('LEAD_CLAIM_TIMEOUT', 60))  # seconds before a stuck batch is retried
+MAX_BACKOFF = 30.0
+
+FIELDS = ('name', 'email', 'phone', 'message')
+
+LEADS_QUEUED = registry.counter("leads_queued_total", "Leads accepted into the write-behind queue.")
+LEADS_FLUSHED = registry.counter("leads_flushed_total", "Queued leads inserted into the database.")
+LEADS_QUEUE_FULL = registry.counter("leads_queue_full_total", "Leads written synchronously because the queue was full.")
+LEADS_DEAD_LETTERED = registry.counter("leads_dead_lettered_total", "Queued leads the database refused to insert.")
+LEAD_FLUSH_FAILURES = registry.counter("lead_flush_failures_total", "Failed bulk inserts of queued leads.")
+
+
+class LeadQueueFull(Exception):
+    pass
+
+
+class LeadRejected(Exception):
+    """Raised by ``write_batch`` when the database refuses the data itself (retrying cannot help)."""
+
+
+class LeadQueue:
+    def __init__(self, write_batch, db_path=LEAD_QUEUE_DB, max_pending=LEAD_QUEUE_MAX_PENDING,
+                 batch_size=LEAD_FLUSH_BATCH, flush_interval=LEAD_FLUSH_INTERVAL, claim_timeout=LEAD_CLAIM_TIMEOUT):
+        """``write_batch(leads)`` inserts a list of lead dicts in one transaction and raises on failure."""
+        self.write_batch = write_batch
+        self.db_path = db_path
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.claim_timeout = claim_timeout
+        self._pid = None
+        self._wake = threading.Event()
+        self.failures = 0
+        self.last_flush = None
+        self.last_error = None
+        self._connect()
+
+    def _connect(self):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")  # an acknowledged lead survives a power cut
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS lead_queue ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, "
+            "name TEXT NOT NULL, email TEXT NOT NULL, phone TEXT NOT NULL, message TEXT, "
+            "created_at REAL NOT NULL, claimed_by TEXT, claimed_at REAL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS lead_dead_letter ("
+            "id TEXT PRIMARY KEY, name TEXT, email TEXT, phone TEXT, message TEXT, "
+            "created_at REAL NOT NULL, error TEXT, failed_at REAL NOT NULL)"
+        )
+
+    def reopen(self):
+        """Open a fresh connection and start this worker's flusher (call in a forked worker)."""
+        self._connect()
+        self._pid = None
+        self._wake = threading.Event()
+        self.start()
+
+    def start(self):
+        """Start the flusher, which also delivers leads left over from a previous run."""
+        self._ensure_started()
+
+    def _ensure_started(self):
+        # Threads do not survive fork: each worker starts its own flusher
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._flush_forever, name="lead-flusher", daemon=True).start()
+            self._pid = os.getpid()
+
+    def pending(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM lead_queue").fetchone()[0]
+
+    def enqueue(self, lead):
+        """Durably queue a lead dict; returns its id. Raises LeadQueueFull."""
+        self._ensure_started()
+        lead_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                pending = self._db.execute("SELECT COUNT(*) FROM lead_queue").fetchone()[0]
+                if pending >= self.max_pending:
+                    LEADS_QUEUE_FULL.inc()
+                    raise LeadQueueFull(f"{pending} leads are waiting to be written")
+                self._db.execute(
+                    "INSERT INTO lead_queue (id, name, email, phone, message, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (lead_id,) + tuple(lead.get(field) for field in FIELDS) + (time.time(),),
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        LEADS_QUEUED.inc()
+        if pending + 1 >= self.batch_size:
+            self._wake.set()
+        return lead_id
+
+    def _claim(self):
+        """Mark up to ``batch_size`` unclaimed (or abandoned) leads as ours and return them."""
+        token = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE lead_queue SET claimed_by = ?, claimed_at = ? WHERE seq IN ("
+                "SELECT seq FROM lead_queue WHERE claimed_at IS NULL OR claimed_at < ? ORDER BY seq LIMIT ?)",
+                (token, now, now - self.claim_timeout, self.batch_size),
+            )
+            rows = self._db.execute(
+                f"SELECT seq, id, {', '.join(FIELDS)}, created_at FROM lead_queue WHERE claimed_by = ? ORDER BY seq",
+                (token,),
+            ).fetchall()
+        return token, rows
+
+    def _release(self, token):
+        """Give back claimed leads so they are retried without waiting for the timeout."""
+        with self._lock:
+            self._db.execute("UPDATE lead_queue SET claimed_by = NULL, claimed_at = NULL WHERE claimed_by = ?",
+                             (token,))
+
+    def flush(self):
+        """Deliver one batch; returns the number of queued leads it took off the queue."""
+        token, rows = self._claim()
+        if not rows:
+            return 0
+        leads = [dict(zip(('queue_id',) + FIELDS + ('created_at',), row[1:])) for row in rows]
+        try:
+            self.write_batch(leads)
+        except LeadRejected:
+            # Find the lead(s) the database refuses instead of retrying the same batch forever
+            self._flush_each(token, rows, leads)
+        except Exception:
+            self._release(token)
+            raise
+        else:
+            with self._lock:
+                self._db.execute("DELETE FROM lead_queue WHERE claimed_by = ?", (token,))
+            LEADS_FLUSHED.inc(len(rows))
+        self.last_flush = time.time()
+        return len(rows)
+
+    def _flush_each(self, token, rows, leads):
+        for row, lead in zip(rows, leads):
+            try:
+                self.write_batch([lead])
+            except LeadRejected as e:
+                self._dead_letter(row[0], row[1], str(e))
+                continue
+            except Exception:
+                self._release(token)
+                raise
+            with self._lock:
+                self._db.execute("DELETE FROM lead_queue WHERE seq = ?", (row[0],))
+            LEADS_FLUSHED.inc()
+
+    def _dead_letter(self, seq, lead_id, error):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO lead_dead_letter (id, {', '.join(FIELDS)}, created_at, error, failed_at) "
+                    f"SELECT id, {', '.join(FIELDS)}, created_at, ?, ? FROM lead_queue WHERE seq = ?",
+                    (error[:1000], time.time(), seq),
+                )
+                self._db.execute("DELETE FROM lead_queue WHERE seq = ?", (seq,))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        LEADS_DEAD_LETTERED.inc()
+        logging.error(f"Moved queued lead {lead_id} to lead_dead_letter: {error}")
+
+    def dead_letters(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM lead_dead_letter").fetchone()[0]
+
+    def _flush_forever(self):
+        backoff = 0.0
+        while True:
+            self._wake.wait(backoff or self.flush_interval)
+            self._wake.clear()
+            try:
+                while self.flush() >= self.batch_size:
+                    pass  # keep going while full batches are waiting
+                backoff = 0.0
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                LEAD_FLUSH_FAILURES.inc()
+                backoff = min(MAX_BACKOFF, max(self.flush_interval, backoff * 2))
+                logging.error(f"Could not write queued leads, retrying in {backoff:.1f}s: {e}")
+
+    def stats(self):
+        return {
+            "pending": self.pending(),
+            "max_pending": self.max_pending,
+            "dead_letters": self.dead_letters(),
+            "flush_failures": self.failures,
+            "last_flush": self.last_flush,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,85 @@
+"""Lead search and keyset pagination.
+
+Search terms are matched as prefixes ("jo smi" finds "John Smith") against the
+full-text index that migration 7c3e5a91d2f4 adds to ``lead``:
+
+* Postgres: a GIN index on ``models.LEAD_SEARCH_DOCUMENT``;
+* SQLite: the ``lead_fts`` FTS5 table.
+
+On a database without the index (e.g. not migrated yet) search falls back to
+``ILIKE`` on every column, which scans the table.
+
+Listings are newest first and paged by id (``WHERE id < :cursor``), so a page
+costs the same however deep it is, and leads inserted meanwhile do not shift
+later pages the way ``OFFSET`` does.
+"""
+import re
+
+from models import LEAD_SEARCH_DOCUMENT, Lead, db
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_TERMS = 8
+SEARCH_COLUMNS = (Lead.name, Lead.email, Lead.phone, Lead.message)
+
+# Words, optionally joined by the characters of e-mails, domains and phone numbers
+_TERM = re.compile(r"\w+(?:[.@+\-]\w+)*")
+_backends = {}
+
+
+def search_terms(search):
+    return _TERM.findall(search or '')[:MAX_TERMS]
+
+
+def fulltext_backend():
+    """'postgresql' or 'sqlite' if the full-text index exists, else None (checked once per database)."""
+    engine = db.engine
+    key = str(engine.url)
+    if key not in _backends:
+        _backends[key] = _detect_backend(engine)
+    return _backends[key]
+
+
+def _detect_backend(engine):
+    dialect = engine.dialect.name
+    if dialect == 'postgresql':
+        check = "SELECT to_regclass('ix_lead_search')"
+    elif dialect == 'sqlite':
+        check = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'lead_fts'"
+    else:
+        return None
+    with engine.connect() as conn:
+        return dialect if conn.execute(db.text(check)).scalar() else None
+
+
+def search_condition(search, backend=None):
+    """A filter matching leads that contain every term of ``search``, or None if it has no terms."""
+    terms = search_terms(search)
+    if not terms:
+        return None
+    if backend == 'postgresql':
+        tsquery = " & ".join(f"'{term}':*" for term in terms)
+        return db.text(f"{LEAD_SEARCH_DOCUMENT} @@ to_tsquery('simple', :lead_search)").bindparams(
+            lead_search=tsquery)
+    if backend == 'sqlite':
+        fts_query = " ".join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+        return db.text("lead.id IN (SELECT rowid FROM lead_fts WHERE lead_fts MATCH :lead_search)").bindparams(
+            lead_search=fts_query)
+    return db.and_(*(
+        db.or_(*(column.ilike(f"%{term}%") for column in SEARCH_COLUMNS)) for term in terms
+    ))
+
+
+def list_leads(search=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """One page of leads, newest first. Returns (leads, next_cursor); next_cursor is None on the last page."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = Lead.query
+    condition = search_condition(search, fulltext_backend()) if search else None
+    if condition is not None:
+        query = query.filter(condition)
+    if cursor is not None:
+        query = query.filter(Lead.id < cursor)
+    # One extra row tells whether another page follows
+    leads = query.order_by(Lead.id.desc()).limit(limit + 1).all()
+    next_cursor = leads[limit - 1].id if len(leads) > limit else None
+    return leads[:limit], next_cursor
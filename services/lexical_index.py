@@ -0,0 +1,127 @@
+"""In-memory BM25 inverted index over the chunk texts of a ``VectorIndex``.
+
+Postings are stored CSR-style in flat NumPy arrays: the documents of term ``t``
+are ``doc_ids[offsets[t]:offsets[t + 1]]`` (ascending), with their BM25 term
+weights, length normalisation included, precomputed in ``weights``. A query is
+then one ``scores[docs] += idf * weights`` per query term.
+
+Lexical and vector rankings are combined with reciprocal-rank fusion, which
+needs no score calibration between the two.
+"""
+import os
+import re
+
+import numpy as np
+
+from services.vector_index import top_k
+
+BM25_K1 = float(os.getenv('BM25_K1', 1.2))
+BM25_B = float(os.getenv('BM25_B', 0.75))
+RRF_K = int(os.getenv('RRF_K', 60))
+# A query is answered from BM25 alone (no embedding call) when its best chunk contains
+# every query term, there are at least LEXICAL_ONLY_MIN_TERMS of them (0 disables),
+# and that chunk outscores the runner-up by LEXICAL_ONLY_MARGIN.
+LEXICAL_ONLY_MIN_TERMS = int(os.getenv('LEXICAL_ONLY_MIN_TERMS', 2))
+LEXICAL_ONLY_MARGIN = float(os.getenv('LEXICAL_ONLY_MARGIN', 1.5))
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.'-][a-z0-9]+)*")
+STOPWORDS = frozenset("""
+a about an and any are as at be but by can could do does for from get have how i if in is it its me much my
+of on or our please tell than that the their them there this to us want was we what when where which who
+why will with would you your
+""".split())
+
+
+def tokenize(text):
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, vocabulary, offsets, doc_ids, weights, idf, count):
+        self.vocabulary = vocabulary  # term -> term id
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.idf = idf
+        self.count = count  # number of chunks
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.doc_ids.nbytes + self.weights.nbytes + self.idf.nbytes
+
+    @classmethod
+    def build(cls, texts, k1=BM25_K1, b=BM25_B):
+        vocabulary, term_ids, doc_ids, tfs, lengths = {}, [], [], [], []
+        for doc, text in enumerate(texts):
+            counts = {}
+            tokens = tokenize(text)
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                term_ids.append(vocabulary.setdefault(token, len(vocabulary)))
+                doc_ids.append(doc)
+                tfs.append(tf)
+            lengths.append(len(tokens))
+        n_docs = len(lengths)
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        tfs = np.asarray(tfs, dtype=np.float32)
+        lengths = np.asarray(lengths, dtype=np.float32)
+
+        # Group postings by term; doc ids stay ascending within each term (stable sort)
+        order = np.argsort(term_ids, kind='stable')
+        term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+        df = np.bincount(term_ids, minlength=len(vocabulary))
+        offsets = np.concatenate(([0], np.cumsum(df))).astype(np.int64)
+        avgdl = lengths.mean() if n_docs and lengths.mean() > 0 else 1.0
+        norm = k1 * (1 - b + b * lengths[doc_ids] / avgdl)
+        weights = (tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        return cls(vocabulary, offsets, doc_ids, weights, idf, n_docs)
+
+    def _postings(self, term_id):
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return self.doc_ids[start:end], self.weights[start:end]
+
+    def search(self, query, k):
+        """Return (doc ids, scores, coverage) of the k best chunks for ``query``.
+
+        ``coverage`` is the fraction of distinct query terms found in the best chunk.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        known = [self.vocabulary[t] for t in terms if t in self.vocabulary]
+        if not known or not self.count:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), 0.0
+        scores = np.zeros(self.count, dtype=np.float32)
+        for term_id in known:
+            docs, weights = self._postings(term_id)
+            scores[docs] += self.idf[term_id] * weights
+        matched = np.flatnonzero(scores)
+        best = matched[top_k(scores[matched], k)]
+        top = best[0]
+        present = 0
+        for term_id in known:
+            docs, _ = self._postings(term_id)
+            i = np.searchsorted(docs, top)
+            present += i < len(docs) and docs[i] == top
+        return best, scores[best], present / len(terms)
+
+    def strong_match(self, query, k, min_terms=LEXICAL_ONLY_MIN_TERMS, margin=LEXICAL_ONLY_MARGIN):
+        """Doc ids for ``query`` if BM25 alone is confident enough, else None."""
+        if min_terms <= 0 or len(set(tokenize(query))) < min_terms:
+            return None
+        ids, scores, coverage = self.search(query, max(k, 2))
+        if coverage < 1.0 or not len(ids):
+            return None
+        if len(scores) > 1 and scores[0] < margin * scores[1]:
+            return None
+        return ids[:k]
+
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=RRF_K):
+    """Fuse ranked lists of doc ids: score(d) = sum over lists of 1 / (rrf_k + rank)."""
+    fused = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            fused[int(doc)] = fused.get(int(doc), 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(fused, key=fused.get, reverse=True)[:k]
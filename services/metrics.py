@@ -0,0 +1,313 @@
+"""In-process counters, gauges and histograms, exported in Prometheus text format.
+
+Recording a value is a dict update under a lock; nothing is sent anywhere on
+the request path. Every process writes a snapshot of its metrics to
+``METRICS_DIR/<pid>.json`` about once per ``METRICS_FLUSH_INTERVAL`` seconds,
+from a background thread. ``render()`` merges the snapshots of all processes,
+so a scrape served by any gunicorn worker covers the whole server:
+
+* counters and histogram buckets are summed, including those of workers that
+  have exited (counters must never go backwards);
+* gauges are summed over live processes only (see ``mark_process_dead``, which
+  folds an exited worker's snapshot into ``dead.json``).
+
+Under ``preload_app`` the directory is chosen once in the master, so all of its
+workers share it.
+"""
+import atexit
+import bisect
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+METRICS_DIR = os.getenv('METRICS_DIR') or os.path.join(tempfile.gettempdir(), f"chatbot-metrics-{os.getpid()}")
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1.0))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; covers a sub-millisecond regex match up to a slow completion
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def set_total(self, value, *labels):
+        """Set a value kept elsewhere (for collectors, which run before each snapshot)."""
+        with self.registry.lock:
+            self._values[labels] = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, *labels):
+        with self.registry.lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+        self.registry.ensure_started()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        with self.registry.lock:
+            self._values[labels] = value
+        self.registry.ensure_started()
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        slot = bisect.bisect_left(self.buckets, value)  # buckets are "less than or equal"
+        with self.registry.lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][slot] += 1
+            entry[1] += value
+        self.registry.ensure_started()
+
+    def time(self, *labels):
+        """Context manager observing the seconds spent in its block."""
+        return _Timer(self, labels)
+
+
+class Registry:
+    def __init__(self, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.collectors = []
+        self._pid = None
+
+    def _add(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._add(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self, name, documentation, labelnames, buckets))
+
+    def collector(self, fn):
+        """Register ``fn()``, run before every snapshot to copy values kept elsewhere
+        (e.g. cache hit counts) into counters and gauges."""
+        self.collectors.append(fn)
+        return fn
+
+    def ensure_started(self):
+        """Start this process' flusher thread (threads do not survive fork)."""
+        if self._pid == os.getpid():
+            return
+        with self.lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            threading.Thread(target=self._flush_forever, name="metrics-flush", daemon=True).start()
+            self._pid = os.getpid()
+
+    def reset(self):
+        """Zero the values inherited from the parent (call in a freshly forked worker)."""
+        with self.lock:
+            for metric in self.metrics.values():
+                metric._values.clear()
+            self._pid = None
+        self.ensure_started()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Could not write metrics snapshot: {e}")
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def flush(self):
+        """Write this process' snapshot (atomically)."""
+        for collect in self.collectors:
+            collect()
+        with self.lock:
+            snapshot = {
+                "pid": os.getpid(),
+                "alive": True,
+                "metrics": {
+                    name: [[list(labels), value] for labels, value in metric._values.items()]
+                    for name, metric in self.metrics.items()
+                },
+            }
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(os.getpid())
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+
+    def _snapshots(self):
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                with open(path) as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue  # being replaced or half-written by a crashed process
+
+    def merged(self):
+        """{metric name: {label tuple: value}} summed over every process' snapshot."""
+        merged = {name: {} for name in self.metrics}
+        for snapshot in self._snapshots():
+            for name, entries in snapshot["metrics"].items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.kind == "gauge" and not snapshot["alive"]):
+                    continue
+                _accumulate(metric, merged[name], entries)
+        return merged
+
+    def render(self):
+        """Prometheus text exposition of all processes' metrics."""
+        self.flush()
+        lines = []
+        for name, values in self.merged().items():
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, value in sorted(values.items()):
+                pairs = list(zip(metric.labelnames, labels))
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{_format_labels(pairs)} {_format_value(value)}")
+                    continue
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(pairs + [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(pairs)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(pairs)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def mark_process_dead(self, pid):
+        """Fold a dead process' counters into ``dead.json`` and delete its snapshot.
+
+        Its gauges are dropped; counters and histograms stay in the totals without
+        leaving one file per exited worker. Only the master calls this.
+        """
+        path = self._path(pid)
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return
+        dead_path = self._path("dead")
+        try:
+            with open(dead_path) as f:
+                dead = json.load(f)
+        except (OSError, ValueError):
+            dead = {"pid": None, "alive": False, "metrics": {}}
+        for name, entries in snapshot["metrics"].items():
+            metric = self.metrics.get(name)
+            if metric is None or metric.kind == "gauge":
+                continue
+            values = {tuple(labels): value for labels, value in dead["metrics"].get(name, [])}
+            _accumulate(metric, values, entries)
+            dead["metrics"][name] = [[list(labels), value] for labels, value in values.items()]
+        with open(f"{dead_path}.tmp", "w") as f:
+            json.dump(dead, f)
+        os.replace(f"{dead_path}.tmp", dead_path)
+        os.remove(path)
+
+    def clear_directory(self):
+        """Remove snapshots left by a previous server (call once when the master starts)."""
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            os.remove(path)
+
+
+def _accumulate(metric, values, entries):
+    """Add snapshot ``entries`` of ``metric`` into ``values`` ({label tuple: value})."""
+    for labels, value in entries:
+        labels = tuple(labels)
+        if metric.kind != "histogram":
+            values[labels] = values.get(labels, 0) + value
+            continue
+        total = values.setdefault(labels, [[0] * (len(metric.buckets) + 1), 0.0])
+        total[0] = [a + b for a, b in zip(total[0], value[0])]
+        total[1] += value[1]
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(_format_value(value))}"' for name, value in pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return value
+
+
+registry = Registry()
+atexit.register(lambda: registry.flush())
+
+# /chat
+CHAT_STAGE_SECONDS = registry.histogram(
+    "chat_stage_seconds", "Time spent in each stage of a chat request.", ("stage",))
+CHAT_REQUEST_SECONDS = registry.histogram(
+    "chat_request_seconds", "End-to-end chat request time by how the reply was produced.", ("answered_by",))
+RETRIEVALS = registry.counter(
+    "retrievals_total", "Context retrievals by path (lexical_only, hybrid, vector, lexical_fallback).", ("path",))
+# OpenAI
+OPENAI_REQUESTS = registry.counter("openai_requests_total", "OpenAI API calls (excluding retries).")
+OPENAI_RETRIES = registry.counter("openai_retries_total", "OpenAI API attempts retried after an error.")
+OPENAI_ERRORS = registry.counter("openai_errors_total", "OpenAI API calls that failed, by error type.", ("error",))
+OPENAI_TOKENS = registry.counter("openai_tokens_total", "Tokens billed by OpenAI.", ("model", "type"))
+OPENAI_IN_FLIGHT = registry.gauge("openai_in_flight", "OpenAI API calls currently in flight.")
+# Caches
+CACHE_LOOKUPS = registry.counter("cache_lookups_total", "Cache lookups by cache and result.", ("cache", "result"))
+# Crawling
+CRAWL_PAGES = registry.counter("crawl_pages_total", "Pages fetched by embedding jobs.", ("result",))
+CRAWL_CHUNKS = registry.counter("crawl_chunks_embedded_total", "Chunks embedded by embedding jobs.")
+CRAWL_PAGES_PENDING = registry.gauge("crawl_pages_pending", "Pages queued by running embedding jobs.")
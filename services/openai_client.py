@@ -0,0 +1,196 @@
+"""Shared OpenAI transport for the request path.
+
+``AsyncOpenAIRunner`` keeps one ``AsyncOpenAI`` client per process on a
+background event loop, over a single pooled ``httpx.AsyncClient``. Request
+threads hand it coroutines and wait on the result, so a worker
+can have hundreds of calls in flight over a small set of keep-alive connections
+instead of one blocking socket per request.
+
+Every call has a deadline that covers all of its attempts. Rate limits (429),
+server errors (5xx), timeouts and dropped connections are retried with
+jittered exponential backoff, honouring ``Retry-After`` when the API sends it.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import os
+import random
+import threading
+
+import httpx
+import openai
+
+from services.metrics import OPENAI_ERRORS, OPENAI_TOKENS
+
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', 30))  # seconds per call, retries included
+OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', 5))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 3))
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 200))
+BASE_BACKOFF = 0.5
+MAX_BACKOFF = 8.0
+
+
+def retry_after(error):
+    """Seconds the API asked us to wait (``retry-after-ms`` / ``retry-after``), or None."""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    value = response.headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get('retry-after')
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def backoff_delay(attempt, error=None, base=BASE_BACKOFF, cap=MAX_BACKOFF):
+    """Wait before retry number ``attempt`` (0-based): Retry-After, else jittered exponential."""
+    wait = retry_after(error) if error is not None else None
+    if wait is None:
+        wait = min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.0)
+    return wait
+
+
+def record_usage(response):
+    """Count the tokens reported in a response (or the final chunk of a stream)."""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    OPENAI_TOKENS.inc(usage.prompt_tokens or 0, response.model, "prompt")
+    if getattr(usage, 'completion_tokens', None):
+        OPENAI_TOKENS.inc(usage.completion_tokens, response.model, "completion")
+
+
+class AsyncOpenAIRunner:
+    def __init__(self, api_key=None, timeout=OPENAI_TIMEOUT, max_retries=OPENAI_MAX_RETRIES,
+                 max_connections=OPENAI_MAX_CONNECTIONS):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self._client = None
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.in_flight = 0
+
+    def _ensure_started(self):
+        # Threads do not survive fork: each worker starts its own loop on first use
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="openai-async", daemon=True).start()
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=httpx.Timeout(self.timeout, connect=OPENAI_CONNECT_TIMEOUT),
+            )
+            # Retries are done here, inside the call deadline, not by the SDK
+            self._client = openai.AsyncOpenAI(api_key=self.api_key or os.getenv("OPENAI_API_KEY"),
+                                              http_client=http_client, max_retries=0)
+            self._loop = loop
+            self._pid = os.getpid()
+
+    def reset(self):
+        """Forget the parent's loop and client (call in a freshly forked worker)."""
+        with self._lock:
+            self._pid = None
+
+    async def _call(self, request, max_retries):
+        self.calls += 1
+        self.in_flight += 1
+        try:
+            for attempt in range(max_retries + 1):
+                try:
+                    response = await request(self._client)
+                    record_usage(response)
+                    return response
+                except Exception as e:
+                    if not is_retryable(e) or attempt == max_retries:
+                        self.failures += 1
+                        OPENAI_ERRORS.inc(1, e.__class__.__name__)
+                        raise
+                    wait = backoff_delay(attempt, e)
+                    self.retries += 1
+                    logging.warning(f"OpenAI request failed ({e.__class__.__name__}), retrying in {wait:.1f}s")
+                    await asyncio.sleep(wait)
+        finally:
+            self.in_flight -= 1
+
+    async def _call_with_deadline(self, request, timeout, max_retries):
+        try:
+            return await asyncio.wait_for(self._call(request, max_retries), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            OPENAI_ERRORS.inc(1, "APITimeoutError")
+            raise openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com/v1")) from None
+
+    def submit(self, request, timeout=None, max_retries=None):
+        """Schedule ``request(client)`` (returns an awaitable) on the loop; a concurrent Future.
+
+        ``max_retries=0`` is for callers that retry on their own schedule.
+        """
+        self._ensure_started()
+        max_retries = self.max_retries if max_retries is None else max_retries
+        coro = self._call_with_deadline(request, timeout or self.timeout, max_retries)
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, request, timeout=None, max_retries=None):
+        """Blocking call from a request thread."""
+        return self.submit(request, timeout, max_retries).result()
+
+    def iter_stream(self, request, timeout=None):
+        """Blocking iterator over a streamed response.
+
+        The deadline and retries apply to opening the stream; afterwards each
+        chunk must arrive within ``timeout`` seconds.
+        """
+        timeout = timeout or self.timeout
+        stream = self.run(request, timeout)
+        chunks = stream.__aiter__()
+        try:
+            while True:
+                future = asyncio.run_coroutine_threadsafe(chunks.__anext__(), self._loop)
+                try:
+                    chunk = future.result(timeout)
+                except StopAsyncIteration:
+                    return
+                except concurrent.futures.TimeoutError:
+                    future.cancel()
+                    self.timeouts += 1
+                    OPENAI_ERRORS.inc(1, "APITimeoutError")
+                    raise openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com/v1")) from None
+                record_usage(chunk)
+                yield chunk
+        finally:
+            # Release the pooled connection even if the client went away mid-stream
+            asyncio.run_coroutine_threadsafe(stream.close(), self._loop)
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "in_flight": self.in_flight,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "max_connections": self.max_connections,
+            "timeout": self.timeout,
+        }
@@ -0,0 +1,126 @@
+"""Fits the system prompt, retrieved context and chat history into a token budget.
+
+* The system prompt and the new user message are always sent.
+* Context chunks are added in rank order up to ``context_share`` of the budget.
+* The most recent history turns are kept verbatim, newest first, while they fit.
+* Older turns are folded into a rolling summary. The fold boundary only moves in
+  blocks of ``fold_block`` messages and summaries are cached by the exact turns
+  they cover, so the summariser runs once per block rather than once per turn,
+  and each run only has to fold the new block into the previous summary.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from services.tokens import TOKENS_PER_REPLY, count_message_tokens, count_tokens
+
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', 6000))
+PROMPT_CONTEXT_SHARE = float(os.getenv('PROMPT_CONTEXT_SHARE', 0.5))
+HISTORY_FOLD_BLOCK = int(os.getenv('HISTORY_FOLD_BLOCK', 4))
+SUMMARY_MAX_TOKENS = int(os.getenv('SUMMARY_MAX_TOKENS', 200))
+SUMMARY_CACHE_SIZE = 1000
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def _extend_hash(digest, message):
+    payload = json.dumps([message.get("role"), message.get("content")], ensure_ascii=False)
+    return hashlib.sha1(digest + payload.encode('utf-8')).digest()
+
+
+class PromptBuilder:
+    def __init__(self, summarize, budget=PROMPT_TOKEN_BUDGET, context_share=PROMPT_CONTEXT_SHARE,
+                 fold_block=HISTORY_FOLD_BLOCK):
+        """``summarize(previous_summary, messages)`` returns an updated summary string."""
+        self.summarize = summarize
+        self.budget = budget
+        self.context_share = context_share
+        self.fold_block = max(1, fold_block)
+        self._summaries = OrderedDict()  # prefix hash -> summary of history[:n]
+        self._lock = threading.Lock()
+
+    def build(self, system_prompt, chunks, history):
+        """Return (messages, stats). ``history`` ends with the new user message."""
+        history = [{"role": m.get("role"), "content": m.get("content") or ""} for m in history]
+        *previous, current = history
+        system_tokens = count_tokens(system_prompt)
+        current_tokens = count_message_tokens(current)
+        remaining = self.budget - system_tokens - current_tokens - TOKENS_PER_REPLY
+
+        # Context chunks in rank order; each chunk may carry a precomputed "tokens" count
+        context_budget = max(0, int(remaining * self.context_share))
+        context, context_tokens = [], 0
+        for chunk in chunks:
+            tokens = (chunk.get("tokens") or count_tokens(chunk["chunk"])) + 2  # + separator
+            if context_tokens + tokens > context_budget:
+                break
+            context.append(chunk["chunk"])
+            context_tokens += tokens
+        remaining -= context_tokens
+
+        # Verbatim window: newest turns that fit; everything older gets folded.
+        # Room for the summary is reserved as soon as not all history fits.
+        message_tokens = [count_message_tokens(m) for m in previous]
+        history_budget = remaining
+        if sum(message_tokens) > remaining:
+            history_budget -= SUMMARY_MAX_TOKENS
+        keep, history_tokens = len(previous), 0
+        for i in range(len(previous) - 1, -1, -1):
+            if history_tokens + message_tokens[i] > history_budget:
+                break
+            history_tokens += message_tokens[i]
+            keep = i
+        # Move the fold boundary in whole blocks so the summary changes rarely
+        fold = min(len(previous), -(-keep // self.fold_block) * self.fold_block)
+        history_tokens -= sum(message_tokens[keep:fold])
+
+        summary = self._summary(previous[:fold]) if fold else ""
+        summary_tokens = 0
+        if summary:
+            summary_tokens = count_message_tokens({"role": "system", "content": SUMMARY_PREFIX + summary})
+
+        if context:
+            system_prompt += "\nWebsite Context:\n" + "\n\n---\n\n".join(context)
+        messages = [{"role": "system", "content": system_prompt}]
+        if summary:
+            messages.append({"role": "system", "content": SUMMARY_PREFIX + summary})
+        messages += previous[fold:] + [current]
+
+        stats = {
+            "system": system_tokens,
+            "context": context_tokens,
+            "summary": summary_tokens,
+            "history": history_tokens,
+            "user": current_tokens,
+            "total": system_tokens + context_tokens + summary_tokens + history_tokens + current_tokens + TOKENS_PER_REPLY,
+            "budget": self.budget,
+            "chunks_used": len(context),
+            "chunks_dropped": len(chunks) - len(context),
+            "messages_folded": fold,
+        }
+        return messages, stats
+
+    def _summary(self, folded):
+        """Summary of ``folded`` turns, extending the longest cached prefix summary."""
+        digests, digest = [], b""
+        for message in folded:
+            digest = _extend_hash(digest, message)
+            digests.append(digest)
+        with self._lock:
+            if digests[-1] in self._summaries:
+                self._summaries.move_to_end(digests[-1])
+                return self._summaries[digests[-1]]
+            start, previous = 0, ""
+            for n in range(len(digests) - 1, 0, -1):
+                if digests[n - 1] in self._summaries:
+                    start, previous = n, self._summaries[digests[n - 1]]
+                    break
+        summary = self.summarize(previous, folded[start:])
+        if summary:
+            with self._lock:
+                self._summaries[digests[-1]] = summary
+                while len(self._summaries) > SUMMARY_CACHE_SIZE:
+                    self._summaries.popitem(last=False)
+        return summary
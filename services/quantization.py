@@ -0,0 +1,93 @@
+"""Reduced-precision copies of the embedding matrix for scoring.
+
+* ``float16``: half the memory of float32, practically lossless for ranking.
+* ``int8``: a quarter of the memory. Each row is scaled by its own max
+  absolute value (``row ~= codes * scale``), so a score is ``(codes @ q) * scale``.
+
+Scoring converts the codes to float32 one block of rows at a time, so the
+temporary memory stays bounded whatever the corpus size. Exact ranking is
+restored by re-scoring the best ``RERANK_CANDIDATES`` rows against the float32
+matrix. That matrix stays memory-mapped on disk and only the candidate rows are
+read.
+"""
+import os
+
+import numpy as np
+
+from services.atomic_files import replace_atomically
+
+EMBEDDING_DTYPE = os.getenv('EMBEDDING_DTYPE', 'float32').lower()  # 'float32', 'float16' or 'int8'
+RERANK_CANDIDATES = int(os.getenv('RERANK_CANDIDATES', 50))  # 0 = rank on quantized scores only
+DTYPES = ('float16', 'int8')
+_BLOCK = 8192
+
+
+class QuantizedVectors:
+    def __init__(self, codes, scales=None):
+        self.codes = codes    # (N, D) float16 or int8
+        self.scales = scales  # (N,) float32 for int8, else None
+
+    @property
+    def dtype(self):
+        return self.codes.dtype.name
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def quantize(cls, vectors, dtype):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported embedding dtype: {dtype}")
+        n = len(vectors)
+        codes = np.empty(vectors.shape, dtype=dtype)
+        scales = np.empty(n, dtype=np.float32) if dtype == 'int8' else None
+        for start in range(0, n, _BLOCK):
+            block = np.asarray(vectors[start:start + _BLOCK], dtype=np.float32)
+            if scales is None:
+                codes[start:start + len(block)] = block
+                continue
+            scale = np.abs(block).max(axis=1) / 127
+            scale[scale == 0] = 1.0
+            codes[start:start + len(block)] = np.round(block / scale[:, None])
+            scales[start:start + len(block)] = scale
+        return cls(codes, scales)
+
+    def scores(self, queries):
+        """(Q, N) approximate inner products for float32 ``queries``."""
+        scores = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), _BLOCK):
+            block = self.codes[start:start + _BLOCK].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    @staticmethod
+    def paths(base_path, dtype, key=None):
+        """Files of the copy derived from the store version ``key`` (unkeyed: version 1 stores)."""
+        prefix = f"{base_path}.{dtype}.{key}" if key else f"{base_path}.{dtype}"
+        return f"{prefix}.npy", f"{prefix}.scales.npy"
+
+    def save(self, base_path, key=None):
+        codes_path, scales_path = self.paths(base_path, self.dtype, key)
+        for path, array in ((codes_path, self.codes), (scales_path, self.scales)):
+            if array is None:
+                continue
+            replace_atomically(path, lambda f, array=array: np.save(f, array))
+
+    @classmethod
+    def load(cls, base_path, dtype, count, key=None):
+        """Memory-mapped copy for ``dtype`` of store version ``key``, or None if missing."""
+        codes_path, scales_path = cls.paths(base_path, dtype, key)
+        try:
+            codes = np.load(codes_path, mmap_mode='r')
+            scales = np.load(scales_path) if dtype == 'int8' else None
+        except (OSError, ValueError):
+            return None
+        if len(codes) != count or (scales is not None and len(scales) != count):
+            return None
+        return cls(codes, scales)
@@ -0,0 +1,205 @@
+"""Structured, non-blocking logging.
+
+``configure_logging()`` routes every record through a bounded in-memory queue
+to a background writer thread. The thread formats the record and writes it to
+stderr, so a request thread never formats or does I/O on behalf of a log line.
+When the queue is full, records are dropped and counted rather than blocking
+the request.
+
+Hot-path events are logged with ``log_event(name, **fields)``. It passes the
+field values by reference, so its cost does not depend on their size. It can
+also be sampled per event (``LOG_SAMPLE_RATES``); warnings and errors are never
+sampled. When a record is written, its fields and message are:
+
+* truncated: strings to ``LOG_MAX_FIELD_CHARS``, and collections to their
+  first ``LOG_MAX_ITEMS`` items plus a count;
+* redacted: fields named like credentials are masked, as are API keys, bearer
+  tokens and e-mail addresses in any text.
+
+``LOG_FORMAT=json`` writes one JSON object per line; the default ``text`` keeps
+the previous ``time - LEVEL - message`` layout and appends the fields as ``key=value``.
+"""
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+from services.metrics import registry
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()  # 'text' or 'json'
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+LOG_MAX_FIELD_CHARS = int(os.getenv('LOG_MAX_FIELD_CHARS', 200))
+LOG_MAX_ITEMS = int(os.getenv('LOG_MAX_ITEMS', 5))
+# "event=rate,..." e.g. "chat.request=0.1"; events not listed use LOG_SAMPLE_RATE
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 1.0))
+LOG_SAMPLE_RATES = {
+    name.strip(): float(rate)
+    for name, rate in (item.split('=', 1) for item in os.getenv('LOG_SAMPLE_RATES', '').split(',') if '=' in item)
+}
+# Libraries that log every HTTP request at INFO
+QUIET_LOGGERS = ('httpx', 'httpcore', 'openai')
+
+REDACTED = "[REDACTED]"
+SECRET_FIELD = re.compile(r"(pass(word)?|secret|token|api_?key|authorization|cookie)", re.I)
+SECRET_PATTERNS = (
+    (re.compile(r"\bsk-[A-Za-z0-9_\-]{8,}"), "sk-" + REDACTED),
+    (re.compile(r"\b(Bearer|Basic)\s+[A-Za-z0-9._~+/=\-]+", re.I), r"\1 " + REDACTED),
+    (re.compile(r"\b([A-Za-z0-9._%+\-])[A-Za-z0-9._%+\-]*@([A-Za-z0-9.\-]+\.[A-Za-z]{2,})\b"), r"\1***@\2"),
+)
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+LOG_RECORDS_DROPPED = registry.counter("log_records_dropped_total", "Log records dropped because the queue was full.")
+
+
+def redact(text):
+    for pattern, replacement in SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def clip(value, max_chars=LOG_MAX_FIELD_CHARS, max_items=LOG_MAX_ITEMS):
+    """A JSON-friendly copy of ``value`` whose size does not grow with the input."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else f"{value[:max_chars]}...(+{len(value) - max_chars} chars)"
+    if isinstance(value, dict):
+        clipped = {str(k): REDACTED if SECRET_FIELD.search(str(k)) else clip(v, max_chars, max_items)
+                   for k, v in itertools.islice(value.items(), max_items)}
+        if len(value) > max_items:
+            clipped["..."] = f"+{len(value) - max_items} keys"
+        return clipped
+    if isinstance(value, (list, tuple, set)):
+        head = value[:max_items] if isinstance(value, (list, tuple)) else list(value)[:max_items]
+        clipped = [clip(v, max_chars, max_items) for v in head]
+        if len(value) > max_items:
+            clipped.append(f"...(+{len(value) - max_items} items)")
+        return clipped
+    return clip(str(value), max_chars, max_items)
+
+
+def _fields(record):
+    """Structured fields of a record: ``log_event`` fields or other ``extra`` keys."""
+    fields = getattr(record, 'fields', None)
+    if fields is None:
+        fields = {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS and k != 'event'}
+    return {k: REDACTED if SECRET_FIELD.search(k) else clip(v) for k, v in fields.items()}
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s - %(levelname)s - %(message)s')
+
+    def format(self, record):
+        record.msg = clip(record.getMessage(), max_chars=4 * LOG_MAX_FIELD_CHARS)
+        record.args = None
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(
+                f"{k}={v if isinstance(v, (int, float)) else json.dumps(v, ensure_ascii=False)}"
+                for k, v in fields.items()
+            )
+        return redact(line)
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "msg": clip(record.getMessage(), max_chars=4 * LOG_MAX_FIELD_CHARS),
+        }
+        if hasattr(record, 'event'):
+            entry["event"] = record.event
+        entry.update(_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return redact(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to a per-process writer thread; drops them when the queue is full."""
+
+    def __init__(self, handler, maxsize=LOG_QUEUE_SIZE):
+        super().__init__(None)
+        self.target = handler
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._pid = None
+        self._listener = None
+
+    def _ensure_started(self):
+        # The writer thread does not survive fork: each worker starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.Queue(self.maxsize)
+            self._listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        # Formatting happens in the writer thread; the record is passed as is
+        return record
+
+    def enqueue(self, record):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+    def stop(self):
+        """Write out queued records (at exit)."""
+        if self._listener is not None and self._pid == os.getpid():
+            try:
+                self._listener.stop()
+            except queue.Full:
+                pass
+            self._pid = None
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    """Install the queue handler on the root logger (replacing existing handlers)."""
+    root = logging.getLogger()
+    if any(isinstance(h, NonBlockingQueueHandler) for h in root.handlers):
+        return
+    writer = logging.StreamHandler(sys.stderr)
+    writer.setFormatter(JSONFormatter() if fmt == 'json' else TextFormatter())
+    handler = NonBlockingQueueHandler(writer)
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    atexit.register(handler.stop)
+
+
+def log_event(event, level=logging.INFO, **fields):
+    """Log a named event with structured fields, subject to sampling.
+
+    Values are stored by reference and only truncated and serialized by the
+    writer thread, so pass objects that will not be mutated afterwards.
+    """
+    logger = logging.getLogger()
+    if not logger.isEnabledFor(level):
+        return
+    if level < logging.WARNING:
+        rate = LOG_SAMPLE_RATES.get(event, LOG_SAMPLE_RATE)
+        if rate < 1.0 and random.random() >= rate:
+            return
+    logger.log(level, event, extra={"event": event, "fields": fields})
@@ -0,0 +1,54 @@
+"""Token counting in the chat/embedding models' own units (``tiktoken`` cl100k_base).
+
+If the encoding cannot be loaded (package missing, or its BPE file cannot be
+downloaded on first use) counts fall back to a ~4 characters/token estimate so
+the chatbot keeps working; the fallback is logged once.
+"""
+import logging
+import re
+
+ENCODING_NAME = "cl100k_base"  # used by gpt-3.5-turbo and text-embedding-ada-002
+# Per-message overhead of the chat format (role/separators) and reply priming
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+_encoding = None
+_encoding_failed = False
+_APPROX_TOKEN = re.compile(r"\w{1,4}|[^\w\s]", re.UNICODE)
+
+
+def get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(ENCODING_NAME)
+        except Exception as e:
+            _encoding_failed = True
+            logging.warning(f"tiktoken unavailable, estimating token counts: {e}")
+    return _encoding
+
+
+def encode(text):
+    """Token ids, or approximate tokens (strings) when tiktoken is unavailable."""
+    encoding = get_encoding()
+    if encoding is not None:
+        return encoding.encode(text, disallowed_special=())
+    return _APPROX_TOKEN.findall(text)
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(_APPROX_TOKEN.findall(text))
+
+
+def count_message_tokens(message):
+    return TOKENS_PER_MESSAGE + count_tokens(message.get("content") or "") + count_tokens(message.get("role") or "")
+
+
+def count_messages_tokens(messages):
+    return sum(count_message_tokens(m) for m in messages) + TOKENS_PER_REPLY
@@ -0,0 +1,121 @@
+import numpy as np
+
+
+def normalize_rows(matrix):
+    """L2-normalize each row in place; zero rows are left untouched."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def top_k(scores, k):
+    """Indices of the k highest scores per row, best first, via argpartition."""
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    idxs = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, idxs, axis=-1), axis=-1)
+    return np.take_along_axis(idxs, order, axis=-1)
+
+
+class VectorIndex:
+    """Contiguous, pre-normalized float32 embedding matrix with parallel chunk metadata.
+
+    Row i of ``vectors`` is the embedding of ``metadata[i]``. Because every row is
+    unit length, cosine similarity is a single matrix-vector product and ranking by
+    it matches ranking by euclidean distance.
+    """
+
+    def __init__(self, vectors, metadata, normalized=False):
+        if normalized:
+            # Already unit length (e.g. a read-only memory map): use as is, no copy.
+            vectors = np.asarray(vectors, dtype=np.float32)
+        else:
+            vectors = np.array(vectors, dtype=np.float32, order='C', ndmin=2)
+            if len(metadata):
+                vectors = normalize_rows(vectors)
+        if len(vectors) != len(metadata):
+            raise ValueError("vectors and metadata must have the same length")
+        self.vectors = vectors
+        self.metadata = metadata if normalized else list(metadata)
+        # Optional approximate backend (e.g. ann_index.IVFIndex); None means exact search
+        self.ann = None
+        # Optional lexical index over the chunk texts (lexical_index.BM25Index)
+        self.lexical = None
+        # Name of the embedding provider that produced the vectors (embedding_provider)
+        self.provider = None
+        # Optional reduced-precision copy used for scoring (quantization.QuantizedVectors);
+        # the best ``rerank`` candidates are then re-scored exactly against ``vectors``
+        self.quantized = None
+        self.rerank = 0
+
+    @classmethod
+    def from_records(cls, records):
+        """Build an index from ``{"url", "chunk", "embedding"}`` records (optionally with "tokens")."""
+        if not records:
+            return cls.empty()
+        vectors = np.array([item['embedding'] for item in records], dtype=np.float32)
+        metadata = [
+            {"url": item['url'], "chunk": item['chunk'], "tokens": item['tokens']} if item.get('tokens')
+            else {"url": item['url'], "chunk": item['chunk']}
+            for item in records
+        ]
+        return cls(vectors, metadata)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros((0, 0), dtype=np.float32), [])
+
+    def __len__(self):
+        return len(self.metadata)
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1] if len(self) else 0
+
+    def _prepare_queries(self, queries):
+        queries = np.array(queries, dtype=np.float32, ndmin=2)
+        return normalize_rows(queries)
+
+    def search(self, query_emb, k, nprobe=None):
+        """Return ``(metadata, score)`` pairs for the k most similar chunks."""
+        return self.search_many([query_emb], k, nprobe)[0]
+
+    def search_many(self, queries, k, nprobe=None):
+        """Batched search: one matrix-matrix product for all queries.
+
+        When an approximate backend is attached it is used instead; ``nprobe``
+        then overrides its recall/latency setting.
+        """
+        return [
+            [(self.metadata[i], score) for i, score in row]
+            for row in self.search_rows(queries, k, nprobe)
+        ]
+
+    def search_rows(self, queries, k, nprobe=None):
+        """Like ``search_many`` but with row numbers instead of metadata."""
+        if not len(self) or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+        queries = self._prepare_queries(queries)
+        if self.ann is not None:
+            return [
+                [(int(i), float(score)) for i, score in zip(row_idxs, row_scores)]
+                for row_idxs, row_scores in self.ann.search_many(self.vectors, queries, k, nprobe)
+            ]
+        if self.quantized is not None:
+            return [self._rerank(query, row_scores, k) for query, row_scores in zip(queries, self.quantized.scores(queries))]
+        scores = queries @ self.vectors.T
+        idxs = top_k(scores, k)
+        return [
+            [(int(i), float(row_scores[i])) for i in row_idxs]
+            for row_idxs, row_scores in zip(idxs, scores)
+        ]
+
+    def _rerank(self, query, approx_scores, k):
+        if self.rerank <= 0:
+            return [(int(i), float(approx_scores[i])) for i in top_k(approx_scores, k)]
+        # Sorted ids read the (memory-mapped) float32 rows front to back
+        candidates = np.sort(top_k(approx_scores, max(k, self.rerank)))
+        exact = self.vectors[candidates] @ query
+        return [(int(candidates[i]), float(exact[i])) for i in top_k(exact, k)]
@@ -0,0 +1,33 @@
+import sys
+import os
+import functools
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def static_site(tmp_path):
+    """URL of a local site: a home page linking page-0..page-2, where page-2 is missing (404)."""
+    links = "".join(f'<li><a href="page-{i}.html">Service {i}</a></li>' for i in range(3))
+    (tmp_path / "index.html").write_text(f"<html><body><h1>Test Site</h1><ul>{links}</ul></body></html>")
+    for i in range(2):
+        (tmp_path / f"page-{i}.html").write_text(
+            f"<html><body><h1>Service {i}</h1><p>Plans for service {i} start at ${100 + 10 * i} per month.</p>"
+            f'<a href="index.html">Home</a></body></html>'
+        )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=str(tmp_path)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/index.html"
+    server.shutdown()
+    server.server_close()
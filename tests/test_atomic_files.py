@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+from services.atomic_files import replace_atomically
+
+
+def test_replace_atomically_swaps_in_the_new_file(tmp_path):
+    path = tmp_path / "index.bin"
+    path.write_bytes(b"old")
+    replace_atomically(str(path), lambda f: f.write(b"new"))
+    assert path.read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["index.bin"]
+
+
+def test_failed_write_keeps_the_old_file_and_no_temporary(tmp_path):
+    path = tmp_path / "index.bin"
+    path.write_bytes(b"old")
+
+    def write(f):
+        f.write(b"partial")
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        replace_atomically(str(path), write)
+    assert path.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["index.bin"]
@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+from services.crawler import AsyncCrawler, CrawlError, CrawledPage
+
+
+def _chromium_available():
+    try:
+        from playwright.sync_api import sync_playwright
+        with sync_playwright() as p:
+            p.chromium.launch().close()
+        return True
+    except Exception:
+        return False
+
+
+needs_chromium = pytest.mark.skipif(not _chromium_available(), reason="Playwright Chromium is not installed")
+
+
+@needs_chromium
+def test_crawls_every_linked_page(static_site):
+    crawler = AsyncCrawler(concurrency=2, delay=0, timeout_ms=10000)
+    pages = {page.url.rsplit("/", 1)[-1]: page for page in crawler.iter_pages(static_site)}
+
+    assert {"index.html", "page-0.html", "page-1.html"} <= pages.keys()
+    assert "Service 1" in pages["page-1.html"].text
+    assert crawler.failed is None
+
+
+@needs_chromium
+def test_missing_page_is_reported_gone(static_site):
+    crawler = AsyncCrawler(concurrency=2, delay=0, timeout_ms=10000)
+    gone = [page for page in crawler.iter_pages(static_site) if page.text is None]
+
+    assert [(page.url.rsplit("/", 1)[-1], page.status) for page in gone] == [("page-2.html", 404)]
+    assert crawler.errors == 0
+
+
+def test_failed_crawl_raises(monkeypatch):
+    async def crawl(self, base_url, emit):
+        emit(CrawledPage(base_url, "home", None))
+        raise RuntimeError("browser failed to launch")
+
+    monkeypatch.setattr(AsyncCrawler, "crawl", crawl)
+    crawler = AsyncCrawler()
+    pages = []
+    with pytest.raises(CrawlError, match="browser failed to launch"):
+        for page in crawler.iter_pages("http://127.0.0.1/"):
+            pages.append(page)
+
+    assert [page.text for page in pages] == ["home"]
+    assert isinstance(crawler.failed, RuntimeError)
+
+
+def test_stopping_early_stops_the_crawl(monkeypatch):
+    finished = threading.Event()
+
+    async def crawl(self, base_url, emit):
+        import asyncio
+        while not self._stopping():
+            emit(CrawledPage(base_url, "page", None))
+            await asyncio.sleep(0.01)
+        finished.set()
+
+    monkeypatch.setattr(AsyncCrawler, "crawl", crawl)
+    pages = AsyncCrawler().iter_pages("http://127.0.0.1/")
+    next(pages)
+    pages.close()
+
+    assert finished.wait(2)
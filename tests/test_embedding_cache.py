@@ -0,0 +1,56 @@
+import sqlite3
+import threading
+
+import numpy as np
+
+from services.embedding_cache import EmbeddingCache
+
+
+def rows(db_path):
+    with sqlite3.connect(db_path) as db:
+        return db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+
+
+def test_writes_are_batched_and_shared_with_other_workers(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(1024, db_path, batch_size=3, flush_interval=3600)
+    cache.put("one", "m", [1.0, 0.0])
+    cache.put("two", "m", [0.0, 1.0])
+    assert rows(db_path) == 0
+    assert cache.stats()["pending_writes"] == 2
+
+    cache.put("three", "m", [1.0, 1.0])
+    assert rows(db_path) == 3
+
+    peer = EmbeddingCache(1024, db_path)
+    np.testing.assert_array_equal(peer.get("  ONE ", "m"), [1.0, 0.0])
+    assert peer.disk_hits == 1
+
+
+def test_row_cap_evicts_least_recently_used(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(1024, db_path, max_rows=2, batch_size=1)
+    cache.put("old", "m", [1.0])
+    cache.put("warm", "m", [2.0])
+    EmbeddingCache(1024, db_path, batch_size=1).get("old", "m")  # refreshes last_used
+    cache.put("new", "m", [3.0])
+
+    assert rows(db_path) == 2
+    assert cache.db_evictions == 1
+    reader = EmbeddingCache(1024, db_path)
+    assert reader.get("warm", "m") is None
+    assert reader.get("old", "m") is not None
+
+
+def test_reads_from_other_threads_use_their_own_connection(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    writer = EmbeddingCache(1024, db_path, batch_size=1)
+    writer.put("query", "m", [0.5])
+    cache = EmbeddingCache(1024, db_path)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("query", "m"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(result is not None for result in results) and len(results) == 4
@@ -0,0 +1,37 @@
+import socket
+
+from services.embedding_jobs import EmbeddingJobRunner, JobStore
+
+
+def test_recover_stale_fails_jobs_of_exited_processes(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    live, dead, legacy, queued = (store.create(f"https://example.com/{i}", False) for i in range(4))
+    for job_id in (live, dead, legacy):
+        assert store.start(job_id)
+    # No process has a pid this large
+    store.update(dead, owner=f"{socket.gethostname()}:999999999")
+    store.update(legacy, owner=None)
+
+    assert sorted(JobStore(store.db_path).recover_stale()) == sorted([dead, legacy])
+    assert store.get(live)['status'] == 'running'
+    assert store.get(queued)['status'] == 'queued'
+    for job_id in (dead, legacy):
+        assert store.get(job_id)['status'] == 'failed'
+        assert store.get(job_id)['finished_at'] is not None
+
+
+def test_one_active_job_per_site(tmp_path):
+    runner = EmbeddingJobRunner(lambda *args: None, JobStore(str(tmp_path / "jobs.sqlite3")), external=True)
+    first, created = runner.submit("https://example.com/")
+    assert created
+    again, created = runner.submit("https://www.example.com/about", incremental=True)
+    assert not created and again["job_id"] == first["job_id"]
+    other, created = runner.submit("https://example.org/")
+    assert created and other["job_id"] != first["job_id"]
+
+    # A second web worker sharing the database sees the same job
+    peer = EmbeddingJobRunner(lambda *args: None, JobStore(runner.store.db_path), external=True)
+    assert peer.submit("https://example.com/")[0]["job_id"] == first["job_id"]
+
+    runner._run(runner.store.claim_next())
+    assert runner.submit("https://example.com/")[1]
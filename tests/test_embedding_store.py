@@ -0,0 +1,98 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from services import embedding_store
+from services.embedding_store import content_hash, load_hashes, load_index, save_index
+from services.vector_index import VectorIndex
+
+RECORDS = [
+    {"url": "https://example.com/", "chunk": "Welcome to the example site.", "tokens": 6},
+    {"url": "https://example.com/", "chunk": "We build examples.", "tokens": 4},
+    {"url": "https://example.com/about", "chunk": "Founded in 1999 — still going.", "tokens": 8},
+]
+
+
+def make_index():
+    rng = np.random.default_rng(0)
+    index = VectorIndex.from_records([dict(r, embedding=rng.standard_normal(8).tolist()) for r in RECORDS])
+    index.provider = "test:hash"
+    return index
+
+
+def test_round_trip(tmp_path):
+    base = str(tmp_path / "store")
+    index = make_index()
+    save_index(index, base, {"https://example.com/": "abc"})
+
+    loaded = load_index(base)
+    assert list(loaded.metadata) == RECORDS
+    assert loaded.provider == "test:hash"
+    np.testing.assert_allclose(loaded.vectors, index.vectors, rtol=1e-6)
+    page_hashes, chunk_hashes = load_hashes(base)
+    assert page_hashes == {"https://example.com/": "abc"}
+    assert chunk_hashes == [content_hash(r["chunk"]) for r in RECORDS]
+
+
+def test_sidecar_holds_no_per_chunk_arrays(tmp_path):
+    base = str(tmp_path / "store")
+    save_index(make_index(), base)
+    with open(f"{base}.meta.json") as f:
+        sidecar = json.load(f)
+    assert set(sidecar) == {"version", "count", "dim", "provider", "urls", "page_hashes", "key"}
+    assert isinstance(load_index(base).metadata._offsets, np.memmap)
+
+
+def test_reads_version_1_stores(tmp_path):
+    base = str(tmp_path / "store")
+    index = make_index()
+    save_index(index, base)
+    blob = b"".join(r["chunk"].encode() for r in RECORDS)
+    offsets = np.concatenate(([0], np.cumsum([len(r["chunk"].encode()) for r in RECORDS]))).tolist()
+    with open(f"{base}.meta.json", "w") as f:
+        json.dump({"version": 1, "count": 3, "dim": 8, "provider": "test:hash",
+                   "urls": ["https://example.com/", "https://example.com/about"], "url_ids": [0, 0, 1],
+                   "offsets": offsets, "token_counts": [6, 4, 8],
+                   "chunk_hashes": ["h0", "h1", "h2"], "page_hashes": {}}, f)
+    assert (tmp_path / "store.chunks.bin").read_bytes() == blob
+
+    assert list(load_index(base).metadata) == RECORDS
+    assert load_hashes(base) == ({}, ["h0", "h1", "h2"])
+
+
+def test_rows_that_do_not_match_the_sidecar_are_rejected(tmp_path):
+    base = str(tmp_path / "store")
+    save_index(make_index(), base)
+    np.save(f"{base}.url_ids.npy", np.zeros(2, dtype=np.int32))
+    with pytest.raises(ValueError):
+        load_index(base)
+
+
+def test_quantized_copy_is_keyed_on_the_saved_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_store, "EMBEDDING_DTYPE", "int8")
+    base = str(tmp_path / "store")
+    save_index(make_index(), base)
+    with open(f"{base}.meta.json") as f:
+        key = json.load(f)["key"]
+    assert os.path.exists(f"{base}.int8.{key}.npy")
+    assert load_index(base).quantized is not None
+
+    # A copy left by an earlier save is removed, and never used for the new vectors
+    index = make_index()
+    index.vectors = index.vectors[::-1].copy()
+    save_index(index, base)
+    assert not os.path.exists(f"{base}.int8.{key}.npy")
+    assert load_index(base).quantized is not None
+
+
+def test_load_never_writes_derived_files(tmp_path, monkeypatch):
+    base = str(tmp_path / "store")
+    save_index(make_index(), base)
+    before = sorted(os.listdir(tmp_path))
+
+    monkeypatch.setattr(embedding_store, "EMBEDDING_DTYPE", "int8")
+    loaded = load_index(base)
+    assert loaded.quantized is None
+    assert sorted(os.listdir(tmp_path)) == before
@@ -0,0 +1,143 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from services import chat
+from services.crawler import CrawlError, CrawledPage
+from services.embedding_jobs import EmbeddingJobRunner, JobStore
+from services.embedding_store import load_index
+
+SITE = "https://example.test/"
+HOME = CrawledPage("https://example.test/", "Welcome to the example site.", None)
+ABOUT = CrawledPage("https://example.test/about", "We have been building examples since 1999.", None)
+
+
+class HashEmbeddingProvider:
+    """Deterministic vectors, so indexing needs no network."""
+    name = "test:hash"
+    dim = 8
+
+    def embed_documents(self, texts):
+        return [np.random.default_rng(int(hashlib.sha256(t.encode()).hexdigest()[:8], 16))
+                .standard_normal(self.dim).astype(np.float32) for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class FlakyEmbeddingProvider(HashEmbeddingProvider):
+    """Refuses every batch containing a chunk that mentions ``fail_on``."""
+
+    def __init__(self, fail_on):
+        self.fail_on = fail_on
+
+    def embed_documents(self, texts):
+        if any(self.fail_on in text for text in texts):
+            raise ValueError("embedding request rejected")
+        return super().embed_documents(texts)
+
+
+def fake_crawler(pages, error=None):
+    class FakeCrawler:
+        pages_visited = pages_pending = errors = 0
+
+        def __init__(self, should_stop=None):
+            pass
+
+        def iter_pages(self, base_url):
+            yield from pages
+            if error is not None:
+                raise CrawlError(error)
+
+    return FakeCrawler
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(chat, "INDEXES_DIR", str(tmp_path))
+    monkeypatch.setattr(chat, "embedding_provider", HashEmbeddingProvider())
+    return chat.ChatService()
+
+
+def crawl(service, monkeypatch, pages, incremental, error=None):
+    monkeypatch.setattr(chat, "AsyncCrawler", fake_crawler(pages, error))
+    service._crawl_embed_and_save_playwright_from_url(SITE, incremental=incremental)
+
+
+def stored_urls(service):
+    index = load_index(service._store_path("example.test"))
+    return sorted(meta["url"] for meta in index.metadata)
+
+
+def test_incremental_crawl_keeps_pages_it_did_not_reach(service, monkeypatch):
+    crawl(service, monkeypatch, [HOME, ABOUT], incremental=False)
+    assert stored_urls(service) == [HOME.url, ABOUT.url]
+
+    crawl(service, monkeypatch, [HOME], incremental=True)
+    assert stored_urls(service) == [HOME.url, ABOUT.url]
+
+
+def test_incremental_crawl_drops_removed_pages(service, monkeypatch):
+    crawl(service, monkeypatch, [HOME, ABOUT], incremental=False)
+
+    crawl(service, monkeypatch, [HOME, CrawledPage(ABOUT.url, None, "HTTP 404", 404)], incremental=True)
+    assert stored_urls(service) == [HOME.url]
+
+
+def test_incremental_crawl_keeps_pages_that_failed_to_load(service, monkeypatch):
+    crawl(service, monkeypatch, [HOME, ABOUT], incremental=False)
+
+    crawl(service, monkeypatch, [HOME, CrawledPage(ABOUT.url, None, "Timeout")], incremental=True)
+    assert stored_urls(service) == [HOME.url, ABOUT.url]
+
+
+@pytest.mark.parametrize("pages, error", [
+    ([CrawledPage(HOME.url, None, "Timeout"), ABOUT], None),  # home page timed out
+    ([CrawledPage(HOME.url, None, "HTTP 404", 404)], None),
+    ([], "browser failed to launch"),
+])
+def test_failed_crawl_keeps_the_existing_index(service, monkeypatch, pages, error):
+    crawl(service, monkeypatch, [HOME, ABOUT], incremental=False)
+
+    with pytest.raises(CrawlError):
+        crawl(service, monkeypatch, pages, incremental=True, error=error)
+    assert stored_urls(service) == [HOME.url, ABOUT.url]
+
+
+def test_failed_crawl_fails_the_job(service, monkeypatch):
+    crawl(service, monkeypatch, [HOME, ABOUT], incremental=False)
+    monkeypatch.setattr(chat, "AsyncCrawler", fake_crawler([], "browser failed to launch"))
+    runner = EmbeddingJobRunner(service.run_embedding_job, JobStore(":memory:"), external=True)
+    job_id = runner.store.create(SITE, incremental=True)
+
+    runner._run(job_id)
+
+    job = runner.get(job_id)
+    assert job["status"] == "failed"
+    assert "browser failed to launch" in job["message"]
+    assert stored_urls(service) == [HOME.url, ABOUT.url]
+
+
+def test_full_crawl_with_failed_embeddings_saves_nothing(service, monkeypatch):
+    monkeypatch.setattr(chat, "embedding_provider", FlakyEmbeddingProvider("1999"))
+
+    with pytest.raises(CrawlError):
+        crawl(service, monkeypatch, [HOME, ABOUT], incremental=False)
+    assert not chat.store_exists(service._store_path("example.test"))
+
+
+def test_page_whose_chunks_failed_to_embed_is_embedded_next_time(service, monkeypatch):
+    crawl(service, monkeypatch, [HOME, ABOUT], incremental=False)
+    changed = CrawledPage(ABOUT.url, "We have been building examples since 2001.", None)
+
+    monkeypatch.setattr(chat, "embedding_provider", FlakyEmbeddingProvider("2001"))
+    crawl(service, monkeypatch, [HOME, changed], incremental=True)
+    # The old text is kept, with the old hash, rather than a half-embedded page
+    index = load_index(service._store_path("example.test"))
+    assert sorted(meta["chunk"] for meta in index.metadata) == sorted([HOME.text, ABOUT.text])
+
+    monkeypatch.setattr(chat, "embedding_provider", HashEmbeddingProvider())
+    crawl(service, monkeypatch, [HOME, changed], incremental=True)
+    index = load_index(service._store_path("example.test"))
+    assert sorted(meta["chunk"] for meta in index.metadata) == sorted([HOME.text, changed.text])
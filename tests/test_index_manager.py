@@ -0,0 +1,79 @@
+import threading
+
+import numpy as np
+
+from services.index_manager import IndexManager
+from services.vector_index import VectorIndex
+
+
+def index_of(rows):
+    return VectorIndex.from_records([
+        {"embedding": np.ones(4).tolist(), "url": f"https://example.com/{i}", "chunk": str(i)}
+        for i in range(rows)
+    ])
+
+
+def test_empty_index_is_loaded_once():
+    loads = []
+    manager = IndexManager(lambda tenant: loads.append(tenant) or VectorIndex.empty())
+    for _ in range(3):
+        assert not len(manager.get("example.com"))
+    assert loads == ["example.com"]
+
+
+def test_tenant_locks_are_dropped_after_loading():
+    manager = IndexManager(lambda tenant: index_of(1))
+    for i in range(50):
+        manager.get(f"site-{i}.example.com")
+    assert manager._tenant_locks == {}
+
+
+def test_concurrent_first_queries_load_once():
+    loads = []
+    started = threading.Event()
+
+    def loader(tenant):
+        loads.append(tenant)
+        started.wait(1)
+        return index_of(2)
+
+    manager = IndexManager(loader)
+    threads = [threading.Thread(target=manager.get, args=("example.com",)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    started.set()
+    for thread in threads:
+        thread.join()
+    assert loads == ["example.com"]
+    assert manager._tenant_locks == {}
+
+
+def test_index_rewritten_elsewhere_is_reloaded():
+    versions = {"example.com": 1}
+    changes = []
+    manager = IndexManager(lambda tenant: index_of(versions[tenant]), version=versions.get,
+                           on_change=changes.append, check_interval=0)
+    assert len(manager.get("example.com")) == 1
+    assert len(manager.get("example.com")) == 1
+    versions["example.com"] = 3
+    assert len(manager.get("example.com")) == 3
+    assert changes == ["example.com"]
+    assert manager.stats()["reloads"] == 1
+
+
+def test_unchanged_version_check_leaves_no_tenant_lock():
+    manager = IndexManager(lambda tenant: index_of(1), version=lambda tenant: 1, check_interval=0)
+    for i in range(20):
+        manager.get(f"site-{i}.example.com")
+        manager.get(f"site-{i}.example.com")
+    assert manager._tenant_locks == {}
+
+
+def test_version_is_checked_at_most_once_per_interval():
+    checks = []
+    manager = IndexManager(lambda tenant: index_of(1), version=lambda tenant: checks.append(tenant),
+                           check_interval=3600)
+    for _ in range(5):
+        manager.get("example.com")
+    # Only the load itself read the version
+    assert checks == ["example.com"]
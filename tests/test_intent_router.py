@@ -0,0 +1,78 @@
+import re
+import threading
+
+import pytest
+
+from services import intent_router
+from services.intent_router import IntentRouter
+
+INTENTS = [
+    {"name": "greeting", "answer": "Hi!", "examples": ["hi", "hello there"]},
+    {"name": "thanks", "answer": "You're welcome!", "examples": ["thanks", "thank you"]},
+]
+NAVIGATION = re.compile(r"\btake me to\b", re.I)
+
+
+def embed_many(texts):
+    # Greetings point along the first axis, thanks along the second
+    return [[1.0, 0.0, 0.1] if "h" in text and "thank" not in text else [0.0, 1.0, 0.1] for text in texts]
+
+
+class Embedder:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        self.release.wait(5)
+        if self.fail:
+            raise ConnectionError("embeddings API is down")
+        return embed_many(texts)
+
+
+def router(embedder):
+    return IntentRouter([], NAVIGATION, INTENTS, embed_many=embedder, threshold=0.9)
+
+
+def test_centroids_are_built_with_one_batched_call():
+    embedder = Embedder()
+    r = router(embedder)
+    r.warm().join()
+    assert embedder.calls == [["hi", "hello there", "thanks", "thank you"]]
+    route = r.match_embedding([1.0, 0.0, 0.0])
+    assert (route.kind, route.name) == ("intent", "greeting")
+    assert r.match_embedding([0.0, 1.0, 0.0]).name == "thanks"
+
+
+def test_queries_do_not_wait_for_the_centroids():
+    embedder = Embedder()
+    embedder.release.clear()
+    r = router(embedder)
+    thread = r.warm()
+    # The build is blocked: queries fall through instead of waiting, and do not start another
+    assert r.match_embedding([1.0, 0.0, 0.0]) is None
+    assert r.warm() is None
+    embedder.release.set()
+    thread.join()
+    assert len(embedder.calls) == 1
+    assert r.match_embedding([1.0, 0.0, 0.0]).name == "greeting"
+
+
+def test_failed_build_backs_off(monkeypatch):
+    embedder = Embedder(fail=True)
+    r = router(embedder)
+    r.warm().join()
+    for _ in range(5):
+        assert r.match_embedding([1.0, 0.0, 0.0]) is None
+    assert len(embedder.calls) == 1
+    assert r.stats()["centroid_failures"] == 1
+
+    # Once the backoff has passed the next query retries, and a second failure waits longer
+    now = intent_router.time.monotonic()
+    monkeypatch.setattr(intent_router.time, "monotonic", lambda: now + intent_router.CENTROID_RETRY_BASE + 1)
+    r.warm().join()
+    assert len(embedder.calls) == 2
+    assert r._retry_at == pytest.approx(now + intent_router.CENTROID_RETRY_BASE + 1 + 2 * intent_router.CENTROID_RETRY_BASE)
@@ -0,0 +1,67 @@
+import pytest
+
+from services.lead_queue import LeadQueue, LeadQueueFull, LeadRejected
+
+
+class FakeDatabase:
+    """write_batch for LeadQueue: refuses names over 100 characters, like Lead.name on Postgres."""
+
+    def __init__(self):
+        self.leads = {}
+        self.down = False
+
+    def write_batch(self, leads):
+        if self.down:
+            raise ConnectionError("database is down")
+        if any(len(lead['name']) > 100 for lead in leads):
+            raise LeadRejected("value too long for type character varying(100)")
+        for lead in leads:
+            self.leads.setdefault(lead['queue_id'], lead)
+
+
+def lead(name):
+    return {'name': name, 'email': f"{name[:10]}@example.com", 'phone': '555-0100', 'message': None}
+
+
+@pytest.fixture
+def database():
+    return FakeDatabase()
+
+
+@pytest.fixture
+def lead_queue(tmp_path, database):
+    return LeadQueue(database.write_batch, db_path=str(tmp_path / "lead_queue.db"), max_pending=5, batch_size=10,
+                     flush_interval=3600)
+
+
+def test_refused_lead_is_dead_lettered_and_the_rest_delivered(lead_queue, database):
+    good = [lead_queue.enqueue(lead(f"Visitor {i}")) for i in range(3)]
+    bad = lead_queue.enqueue(lead("x" * 101))
+
+    assert lead_queue.flush() == 4
+    assert sorted(database.leads) == sorted(good)
+    assert lead_queue.stats()['pending'] == 0
+    assert lead_queue.stats()['dead_letters'] == 1
+    assert lead_queue._db.execute("SELECT id FROM lead_dead_letter").fetchone()[0] == bad
+
+
+def test_batch_stays_queued_while_the_database_is_down(lead_queue, database):
+    lead_queue.enqueue(lead("Visitor"))
+    database.down = True
+
+    with pytest.raises(ConnectionError):
+        lead_queue.flush()
+    assert lead_queue.stats()['pending'] == 1
+    assert lead_queue.stats()['dead_letters'] == 0
+
+    database.down = False
+    assert lead_queue.flush() == 1
+    assert lead_queue.stats()['pending'] == 0
+
+
+def test_full_queue_refuses_new_leads(lead_queue):
+    for i in range(5):
+        lead_queue.enqueue(lead(f"Visitor {i}"))
+
+    with pytest.raises(LeadQueueFull):
+        lead_queue.enqueue(lead("One too many"))
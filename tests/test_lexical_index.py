@@ -0,0 +1,54 @@
+import math
+
+import numpy as np
+import pytest
+
+from services.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+CORPUS = [
+    "Our SEO audit covers technical SEO and content.",
+    "Email marketing campaigns with monthly reporting.",
+    "Pricing: the SEO plan starts at $300 per month.",
+    "Paid media and email marketing for local businesses.",
+]
+
+
+def reference_bm25(query, texts, k1=1.2, b=0.75):
+    docs = [tokenize(text) for text in texts]
+    avgdl = sum(len(doc) for doc in docs) / len(docs)
+    scores = []
+    for doc in docs:
+        score = 0.0
+        for term in dict.fromkeys(tokenize(query)):
+            df = sum(term in other for other in docs)
+            tf = doc.count(term)
+            if not tf:
+                continue
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avgdl))
+        scores.append(score)
+    return scores
+
+
+@pytest.mark.parametrize("query", ["seo pricing", "email marketing", "monthly reporting for seo"])
+def test_scores_match_the_bm25_formula(query):
+    index = BM25Index.build(CORPUS, k1=1.2, b=0.75)
+    ids, scores, _ = index.search(query, k=len(CORPUS))
+
+    expected = reference_bm25(query, CORPUS)
+    assert list(ids) == sorted((i for i, s in enumerate(expected) if s > 0), key=lambda i: -expected[i])
+    np.testing.assert_allclose(scores, [expected[i] for i in ids], rtol=1e-5)
+
+
+def test_ranking_and_coverage_on_a_toy_corpus():
+    index = BM25Index.build(CORPUS)
+    ids, _, coverage = index.search("What is the pricing of the SEO plan per month?", k=2)
+    assert ids[0] == 2
+    assert coverage == 1.0
+    # "cost" appears nowhere: 4 of the 5 query terms are in the best chunk
+    assert index.search("What does the SEO plan cost per month?", k=2)[2] == pytest.approx(0.8)
+    assert index.search("kubernetes", k=3)[0].size == 0
+
+
+def test_reciprocal_rank_fusion_prefers_documents_ranked_by_both():
+    assert reciprocal_rank_fusion([[3, 1, 2], [1, 0, 3]], k=3, rrf_k=60) == [1, 3, 0]
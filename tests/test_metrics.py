@@ -0,0 +1,19 @@
+import os
+
+from services.metrics import Registry
+
+
+def test_exited_workers_keep_counters_but_not_files(tmp_path):
+    registry = Registry(directory=str(tmp_path))
+    requests = registry.counter("requests_total", "Requests")
+    in_flight = registry.gauge("in_flight", "In flight")
+    requests.inc(2)
+    in_flight.set(5)
+    registry.flush()
+
+    registry.mark_process_dead(os.getpid())
+    registry.mark_process_dead(os.getpid())  # already folded: no-op
+    assert os.listdir(tmp_path) == ["dead.json"]
+    merged = registry.merged()
+    assert merged["requests_total"] == {(): 2}
+    assert merged["in_flight"] == {}
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from services.quantization import QuantizedVectors
+from services.vector_index import VectorIndex
+
+
+def make_index(rng, rows=1000, dim=64):
+    vectors = rng.standard_normal((rows, dim))
+    return VectorIndex.from_records(
+        [{"url": f"https://example.com/{i}", "chunk": str(i), "embedding": v.tolist()} for i, v in enumerate(vectors)]
+    )
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_reranked_results_equal_exact_search(dtype):
+    rng = np.random.default_rng(42)
+    index = make_index(rng)
+    queries = rng.standard_normal((20, index.dim))
+    exact = index.search_rows(queries, 10)
+
+    index.quantized = QuantizedVectors.quantize(index.vectors, dtype)
+    index.rerank = 50
+    reranked = index.search_rows(queries, 10)
+    assert [[i for i, _ in row] for row in reranked] == [[i for i, _ in row] for row in exact]
+    # Re-ranked scores are exact float32 similarities, not quantized ones
+    np.testing.assert_allclose([[s for _, s in row] for row in reranked], [[s for _, s in row] for row in exact],
+                               rtol=1e-5)
+
+
+def test_int8_scores_stay_close_to_float32():
+    rng = np.random.default_rng(3)
+    index = make_index(rng, rows=200)
+    queries = np.asarray(rng.standard_normal((5, index.dim)), dtype=np.float32)
+    quantized = QuantizedVectors.quantize(index.vectors, "int8")
+
+    exact = queries @ index.vectors.T
+    # Each code is within half a step (max |x| / 254) of its float value
+    bound = np.abs(queries).sum(axis=1, keepdims=True) * np.abs(index.vectors).max(axis=1) / 254
+    assert np.all(np.abs(quantized.scores(queries) - exact) <= bound + 1e-5)
+    assert quantized.nbytes < index.vectors.nbytes / 3
@@ -0,0 +1,27 @@
+import numpy as np
+
+from services.vector_index import VectorIndex, top_k
+
+
+def test_top_k_matches_a_full_sort():
+    rng = np.random.default_rng(7)
+    scores = rng.standard_normal((5, 200)).astype(np.float32)
+    for k in (1, 10, 200, 500):
+        expected = np.argsort(-scores, axis=1, kind='stable')[:, :min(k, 200)]
+        np.testing.assert_array_equal(top_k(scores, k), expected)
+    assert top_k(scores, 0).shape == (5, 0)
+
+
+def test_search_matches_brute_force_cosine():
+    rng = np.random.default_rng(11)
+    vectors = rng.standard_normal((100, 16))
+    index = VectorIndex.from_records(
+        [{"url": f"https://example.com/{i}", "chunk": str(i), "embedding": v.tolist()} for i, v in enumerate(vectors)]
+    )
+    queries = rng.standard_normal((3, 16))
+
+    cosine = (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ \
+        (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).T
+    for row, expected in zip(index.search_rows(queries, 5), cosine):
+        assert [i for i, _ in row] == list(np.argsort(-expected)[:5])
+        np.testing.assert_allclose([score for _, score in row], np.sort(expected)[::-1][:5], rtol=1e-5)